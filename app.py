@@ -1,14 +1,40 @@
 
 import sqlite3
+import json
 import os
-import random
+import sys
 from datetime import datetime, timedelta
 
+from backup import list_snapshots, restore_database, take_snapshot
+from cleanup import enable_incremental_vacuum, run_cleanup
+from concurrency import BUSY_TIMEOUT, configure
+from ingredients import get_ingredient_index
+from mealplans import (MAX_PLAN_DAYS, MEAL_TYPES, PLAN_DAYS, generate_meal_plans, load_recipe_pool,
+                       missing_categories, planned_meals)
+from migrations import migrate
+from pantry import match_pantry
+from profiling import enable_profiling, run_action
+from recipecache import get_recipe_cache, invalidate_recipes
+from search import rebuild_search_index, search_recipes
+from shopping import (add_recipe_to_list, aggregate_ingredients, format_item, list_shopping_lists,
+                      load_shopping_list, remove_recipe_from_list, save_plan_shopping_list,
+                      save_shopping_list, shopping_list_recipes)
+from similarity import get_neighbor_table, recommend_recipes, similar_recipes
+from sqltrace import connection_factory, get_tracer, tracing_enabled
+from unitofwork import RecipeEdit, transaction
+
+# database file used by the application
+DB_FILE = 'Checkpoint2-dbase.sqlite3'
+
 # clear the console screen to improve readability of the menu and content
+# ANSI terminals are cleared with an escape sequence instead of spawning a shell
 
 
 def clear_screen():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    if os.name == 'nt':
+        os.system('cls')
+    else:
+        print("\033[H\033[2J", end="", flush=True)
 
 # display the main menu with available options for the recipe management system
 
@@ -21,77 +47,243 @@ def display_menu():
     print("3. Update a Recipe")
     print("4. Delete a Recipe")
     print("5. Generate Shopping List")
-    print("6. Generate Weekly Meal Plan")
+    print("6. Generate Meal Plans")
     print("7. View All Meal Plans")
     print("8. Delete a Meal Plan")
+    print("9. Maintenance")
     print("b. Exit")
 
-# establish a connection to the SQLite database
+# establish a connection to the SQLite database and bring its schema up to date
+# the database runs in WAL mode so several sessions can use it at once (see concurrency.py)
 
 
 def connect_db(db_file):
     try:
-        conn = sqlite3.connect(db_file)
-        return conn
+        conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT, factory=connection_factory())
     except sqlite3.Error as e:
         print(f"Error connecting to database: {e}")
         return None
+    try:
+        migrate(conn)
+    except sqlite3.Error as e:
+        print(f"Error migrating database schema: {e}")
+        conn.close()
+        return None
+    configure(conn)
+    # deletes cascade to link rows (see migration 6)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+# number of recipes shown per page when browsing
+PAGE_SIZE = 10
+
+# fetch one page of recipes using keyset pagination on recipe_id, optionally for one user
+# after_id continues forward from a page, before_id walks backwards from a page
+# category and user are LEFT JOINed, so every recipe count_recipes and find_page_anchor
+# see is listed, even one whose category or user row is gone (shown as None)
+
+
+def fetch_recipe_page(conn, user_id=None, after_id=None, before_id=None, page_size=PAGE_SIZE):
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append("Recipe.user_id = ?")
+        params.append(user_id)
+    if after_id is not None:
+        conditions.append("Recipe.recipe_id > ?")
+        params.append(after_id)
+    if before_id is not None:
+        conditions.append("Recipe.recipe_id < ?")
+        params.append(before_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "DESC" if before_id is not None else "ASC"
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT Recipe.recipe_id, Recipe.name, Recipe.prep_time, Recipe.cook_time, Recipe.servings,
+                   Category.name AS category, User.username AS user
+            FROM Recipe
+            LEFT JOIN Category ON Recipe.category_id = Category.category_id
+            LEFT JOIN User ON Recipe.user_id = User.user_id
+            {where}
+            ORDER BY Recipe.recipe_id {order}
+            LIMIT ?
+        """, params + [page_size])
+        recipes = cursor.fetchmany(page_size)
+    finally:
+        cursor.close()
+    if before_id is not None:
+        recipes.reverse()
+    return recipes
+
+# count recipes (optionally for one user) so the browser can show the number of pages
+
+
+def count_recipes(conn, user_id=None):
+    if user_id is None:
+        row = conn.execute("SELECT COUNT(*) FROM Recipe").fetchone()
+    else:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM Recipe WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0]
+
+# find the recipe_id right before the first recipe of a page, so a jump lands on a keyset boundary
+# only the primary key (or the user_id index) is walked, never the joined rows
+
+
+def find_page_anchor(conn, page_number, user_id=None, page_size=PAGE_SIZE):
+    if page_number <= 1:
+        return None
+    offset = (page_number - 1) * page_size - 1
+    if user_id is None:
+        row = conn.execute(
+            "SELECT recipe_id FROM Recipe ORDER BY recipe_id LIMIT 1 OFFSET ?", (offset,)).fetchone()
+    else:
+        row = conn.execute("""
+            SELECT recipe_id FROM Recipe WHERE user_id = ?
+            ORDER BY recipe_id LIMIT 1 OFFSET ?
+        """, (user_id, offset)).fetchone()
+    return row[0] if row else None
+
+# page through recipes one screen at a time and open the selected recipe
+
+
+def browse_recipes(conn, user_id=None, heading="Recipes:"):
+    total_pages = max(1, -(-count_recipes(conn, user_id) // PAGE_SIZE))
+    page_number = 1
+    recipes = fetch_recipe_page(conn, user_id=user_id)
+    if not recipes:
+        return False
+
+    while True:
+        clear_screen()
+        print(f"{heading} (Page {page_number} of {total_pages})")
+        for idx, recipe in enumerate(recipes, start=1):
+            if user_id is None:
+                print(f"{idx}. {recipe[1]} (Category: {recipe[5]}, Created by: {recipe[6]})")
+            else:
+                print(f"{idx}. {recipe[1]} (Category: {recipe[5]})")
+            print(f"   Prep Time: {recipe[2]} mins | Cook Time: {recipe[3]} mins | Servings: {recipe[4]}")
+            print("-" * 30)
+        print("n. Next page | p. Previous page | g. Go to page")
+
+        # allow user to select a specific recipe to view more details
+        recipe_choice = input(
+            "\nSelect a recipe to view details (number), n/p/g or 'b' to go back: ").strip().lower()
+        if recipe_choice == 'b':
+            return True
+        elif recipe_choice == 'n':
+            next_page = fetch_recipe_page(
+                conn, user_id=user_id, after_id=recipes[-1][0])
+            if next_page:
+                recipes = next_page
+                page_number += 1
+            else:
+                print("You are on the last page.")
+                input("\nPress Enter to continue.")
+        elif recipe_choice == 'p':
+            previous_page = fetch_recipe_page(
+                conn, user_id=user_id, before_id=recipes[0][0])
+            if previous_page:
+                recipes = previous_page
+                page_number -= 1
+            else:
+                print("You are on the first page.")
+                input("\nPress Enter to continue.")
+        elif recipe_choice == 'g':
+            target = input(f"Go to page (1-{total_pages}): ").strip()
+            if target.isdigit() and 1 <= int(target) <= total_pages:
+                anchor = find_page_anchor(conn, int(target), user_id=user_id)
+                page = fetch_recipe_page(
+                    conn, user_id=user_id, after_id=anchor)
+                if page:
+                    recipes = page
+                    page_number = int(target)
+            else:
+                print("Invalid page number.")
+                input("\nPress Enter to continue.")
+        else:
+            try:
+                recipe_choice = int(recipe_choice)
+                if 1 <= recipe_choice <= len(recipes):
+                    recipe_id = recipes[recipe_choice - 1][0]
+                    detailed_recipe_view(conn, recipe_id)
+                else:
+                    print("Invalid choice. Please try again.")
+                    input("\nPress Enter to continue.")
+            except ValueError:
+                print("Invalid input. Please enter a valid number.")
+                input("\nPress Enter to continue.")
+
+# search recipes by name, instructions or ingredients and open one of the best matches
+
+
+def search_recipe_menu(conn):
+    while True:
+        clear_screen()
+        print("Search Recipes:")
+        text = input(
+            "Enter words to search for (name, ingredients, instructions) or 'b' to go back: ").strip()
+        if text.lower() == 'b' or not text:
+            return
+
+        try:
+            recipes = search_recipes(conn, text)
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            input("\nPress Enter to go back.")
+            return
+
+        if not recipes:
+            print(f"No recipes match '{text}'.")
+            input("\nPress Enter to continue.")
+            continue
+
+        print(f"\nBest matches for '{text}':")
+        for idx, recipe in enumerate(recipes, start=1):
+            print(f"{idx}. {recipe[1]} (Category: {recipe[5]}, Created by: {recipe[6]})")
+            print(f"   Prep Time: {recipe[2]} mins | Cook Time: {recipe[3]} mins | Servings: {recipe[4]}")
+            print("-" * 30)
+
+        recipe_choice = input(
+            "\nSelect a recipe to view details (number) or press Enter to search again: ").strip()
+        if recipe_choice.isdigit() and 1 <= int(recipe_choice) <= len(recipes):
+            detailed_recipe_view(conn, recipes[int(recipe_choice) - 1][0])
 
 # allow users to view recipes, with options to view all recipes or recipes by a specific user
 
 
-def view_recipes(conn):
+def view_recipes(conn, user_id):
     while True:
         clear_screen()
         print("View Recipes:")
         print("1. View all recipes")
         print("2. View recipes by user")
+        print("3. Search recipes")
+        print("4. What can I cook? (match the ingredients you have)")
+        print("5. Recommended for you")
         print("b. Go back to the main menu")
 
         choice = input("Enter your choice: ").strip().lower()
         if choice == 'b':
             return
+        elif choice == '3':
+            search_recipe_menu(conn)
+        elif choice == '4':
+            pantry_menu(conn)
+        elif choice == '5':
+            recommendations_menu(conn, user_id)
         elif choice == '1':
-            # fetch and display all recipes with details like category, creator, prep time, etc.
-            clear_screen()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT Recipe.recipe_id, Recipe.name, Recipe.prep_time, Recipe.cook_time, Recipe.servings, 
-                       Category.name AS category, User.username AS user
-                FROM Recipe
-                JOIN Category ON Recipe.category_id = Category.category_id
-                JOIN User ON Recipe.user_id = User.user_id
-            """)
-            recipes = cursor.fetchall()
-            if recipes:
-                print("Recipes:")
-                for idx, recipe in enumerate(recipes, start=1):
-                    print(f"{idx}. {recipe[1]} (Category: {
-                          recipe[5]}, Created by: {recipe[6]})")
-                    print(f"   Prep Time: {recipe[2]} mins | Cook Time: {
-                          recipe[3]} mins | Servings: {recipe[4]}")
-                    print("-" * 30)
-
-                # allow user to select a specific recipe to view more details
-                recipe_choice = input(
-                    "\nSelect a recipe to view details (number) or 'b' to go back: ").strip()
-                if recipe_choice.lower() == 'b':
-                    continue
-
-                try:
-                    recipe_choice = int(recipe_choice)
-                    if 1 <= recipe_choice <= len(recipes):
-                        recipe_id = recipes[recipe_choice - 1][0]
-                        detailed_recipe_view(conn, recipe_id)
-                    else:
-                        print("Invalid choice. Please try again.")
-                        input("\nPress Enter to continue.")
-                except ValueError:
-                    print("Invalid input. Please enter a valid number.")
+            # page through all recipes with details like category, creator, prep time, etc.
+            try:
+                if not browse_recipes(conn):
+                    clear_screen()
+                    print("No recipes found.")
                     input("\nPress Enter to continue.")
-            else:
-                print("No recipes found.")
-                input("\nPress Enter to continue.")
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                input("\nPress Enter to go back.")
         elif choice == '2':
             # fetch and display recipes by a specific user
             clear_screen()
@@ -115,7 +307,7 @@ def view_recipes(conn):
                 try:
                     user_choice = int(user_choice)
                     if 1 <= user_choice <= len(users):
-                        user_id = users[user_choice - 1][0]
+                        browse_user_id = users[user_choice - 1][0]
                     else:
                         print("Invalid choice. Please try again.")
                         input("\nPress Enter to continue.")
@@ -125,96 +317,209 @@ def view_recipes(conn):
                     input("\nPress Enter to continue.")
                     continue
 
-                # fetch recipes for the selected user
-                cursor.execute("""
-                    SELECT Recipe.recipe_id, Recipe.name, Recipe.prep_time, Recipe.cook_time, Recipe.servings, 
-                           Category.name AS category
-                    FROM Recipe
-                    JOIN Category ON Recipe.category_id = Category.category_id
-                    WHERE Recipe.user_id = ?
-                """, (user_id,))
-                recipes = cursor.fetchall()
-                if recipes:
-                    print(f"Recipes by {users[user_choice - 1][1]}:")
-                    for idx, recipe in enumerate(recipes, start=1):
-                        print(f"{idx}. {recipe[1]} (Category: {recipe[5]})")
-                        print(f"   Prep Time: {recipe[2]} mins | Cook Time: {
-                              recipe[3]} mins | Servings: {recipe[4]}")
-                        print("-" * 30)
-
-                    recipe_choice = input(
-                        "\nSelect a recipe to view details (number) or 'b' to go back: ").strip()
-                    if recipe_choice.lower() == 'b':
-                        continue
-
-                    try:
-                        recipe_choice = int(recipe_choice)
-                        if 1 <= recipe_choice <= len(recipes):
-                            recipe_id = recipes[recipe_choice - 1][0]
-                            detailed_recipe_view(conn, recipe_id)
-                        else:
-                            print("Invalid choice. Please try again.")
-                            input("\nPress Enter to continue.")
-                    except ValueError:
-                        print("Invalid input. Please enter a valid number.")
-                        input("\nPress Enter to continue.")
-                else:
-                    print(f"No recipes found for {users[user_choice - 1][1]}.")
+                # page through recipes for the selected user
+                username = users[user_choice - 1][1]
+                if not browse_recipes(conn, user_id=browse_user_id, heading=f"Recipes by {username}:"):
+                    print(f"No recipes found for {username}.")
                     input("\nPress Enter to continue.")
             except sqlite3.Error as e:
                 print(f"Database error: {e}")
                 input("\nPress Enter to go back.")
 
-# display detailed information about a specific recipe
+# assemble everything about one recipe: its metadata and its ingredients
+# returns None when the recipe does not exist; served from the recipe cache when possible
 
 
-def detailed_recipe_view(conn, recipe_id):
-    clear_screen()
+def get_recipe_detail(conn, recipe_id):
+    return get_recipe_cache(conn).get(recipe_id, lambda: load_recipe_detail(conn, recipe_id))
+
+# read a recipe detail from the database, bypassing the cache
+
+
+def load_recipe_detail(conn, recipe_id):
     cursor = conn.cursor()
-    try:  # fetch recipe details including name, instructions, and metadata
+    try:
         cursor.execute("""
-            SELECT Recipe.name, Recipe.instructions, Recipe.prep_time, Recipe.cook_time, Recipe.servings, 
-                   Category.name AS category, User.username AS user
+            SELECT Recipe.recipe_id, Recipe.name, Recipe.instructions, Recipe.prep_time, Recipe.cook_time,
+                   Recipe.servings, Category.name AS category, User.username AS user
             FROM Recipe
             JOIN Category ON Recipe.category_id = Category.category_id
             JOIN User ON Recipe.user_id = User.user_id
             WHERE Recipe.recipe_id = ?
         """, (recipe_id,))
-        recipe_details = cursor.fetchone()
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        cursor.execute("""
+            SELECT Ingredient.ingredient_id, Ingredient.name, RecipeIngredient.quantity, Ingredient.unit_of_measure
+            FROM RecipeIngredient
+            JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+            WHERE RecipeIngredient.recipe_id = ?
+        """, (recipe_id,))
+        ingredients = [
+            {'ingredient_id': ingredient_id, 'name': name,
+                'quantity': quantity, 'unit_of_measure': unit_of_measure}
+            for ingredient_id, name, quantity, unit_of_measure in cursor
+        ]
+    finally:
+        cursor.close()
+    return {
+        'recipe_id': row[0], 'name': row[1], 'instructions': row[2], 'prep_time': row[3],
+        'cook_time': row[4], 'servings': row[5], 'category': row[6], 'user': row[7],
+        'ingredients': ingredients,
+    }
 
-        if recipe_details:
-            print(f"Recipe: {recipe_details[0]} (Category: {
-                  recipe_details[5]}, Created by: {recipe_details[6]})")
-            print(f"Prep Time: {recipe_details[2]} mins | Cook Time: {
-                  recipe_details[3]} mins | Servings: {recipe_details[4]}")
-            print("\nIngredients:")
+# display detailed information about a specific recipe
 
-            # fetch and display ingredients for the recipe
-            cursor.execute("""
-                SELECT Ingredient.name, RecipeIngredient.quantity, Ingredient.unit_of_measure
-                FROM RecipeIngredient
-                JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
-                WHERE RecipeIngredient.recipe_id = ?
-            """, (recipe_id,))
-            ingredients = cursor.fetchall()
 
-            if ingredients:
-                for ingredient in ingredients:
-                    print(
-                        f"- {ingredient[0]}: {ingredient[1]} {ingredient[2]}")
+def detailed_recipe_view(conn, recipe_id):
+    while recipe_id is not None:
+        clear_screen()
+        try:  # fetch recipe details including name, instructions, metadata and ingredients
+            recipe = get_recipe_detail(conn, recipe_id)
+
+            if recipe:
+                print(f"Recipe: {recipe['name']} (Category: {recipe['category']}, Created by: {recipe['user']})")
+                print(f"Prep Time: {recipe['prep_time']} mins | Cook Time: {recipe['cook_time']} mins | Servings: {recipe['servings']}")
+                print("\nIngredients:")
+
+                if recipe['ingredients']:
+                    for ingredient in recipe['ingredients']:
+                        print(
+                            f"- {ingredient['name']}: {ingredient['quantity']} {ingredient['unit_of_measure']}")
+                else:
+                    print("No ingredients found for this recipe.")
+
+                print("\nInstructions:")
+                print(recipe['instructions'])
+                print("-" * 50)
+                similar = similar_recipes(conn, recipe_id)
+                if similar:
+                    print("\nSimilar recipes:")
+                    for idx, (_, name, score) in enumerate(similar, start=1):
+                        print(f"{idx}. {name} ({score:.0%} alike)")
+                recipe_choice = input(
+                    "\nSelect a similar recipe (number) or press Enter to return: ").strip()
+                recipe_id = similar[int(recipe_choice) - 1][0] if recipe_choice.isdigit(
+                ) and 1 <= int(recipe_choice) <= len(similar) else None
             else:
-                print("No ingredients found for this recipe.")
+                print("Recipe details not found.")
+                input("\nPress Enter to return.")
+                recipe_id = None
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            input("\nPress Enter to return.")
+            return
 
-            print("\nInstructions:")
-            print(recipe_details[1])
-            print("-" * 50)
-        else:
-            print("Recipe details not found.")
+# recipes like the ones in the user's recent meal plans
 
-        input("\nPress Enter to return.")
+
+def recommendations_menu(conn, user_id):
+    while True:
+        clear_screen()
+        try:
+            recommended = recommend_recipes(conn, user_id, limit=PAGE_SIZE)
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            input("\nPress Enter to go back.")
+            return
+        if not recommended:
+            print("No recommendations yet. Generate a meal plan first.")
+            input("\nPress Enter to go back.")
+            return
+
+        print("Recommended for you, based on your recent meal plans:")
+        for idx, (_, name, _) in enumerate(recommended, start=1):
+            print(f"{idx}. {name}")
+        recipe_choice = input(
+            "\nSelect a recipe to view details (number) or press Enter to go back: ").strip()
+        if not (recipe_choice.isdigit() and 1 <= int(recipe_choice) <= len(recommended)):
+            return
+        detailed_recipe_view(conn, recommended[int(recipe_choice) - 1][0])
+
+# user picks the ingredients they have and sees the recipes they can make with them,
+# optionally also those missing a few ingredients
+
+
+def pantry_menu(conn):
+    pantry = {}
+    while True:
+        heading = "What Can I Cook?\n\nYour ingredients: " + (", ".join(sorted(pantry.values())) or "none yet")
+        ingredient = pick_ingredient(conn, heading + "\n\nAdd an ingredient, or go back ('b') when you are done.",
+                                     create=False)
+        if ingredient is None:
+            break
+        pantry[ingredient[0]] = ingredient[1]
+    if not pantry:
+        return
+
+    clear_screen()
+    max_missing = input("How many missing ingredients are you willing to buy? (default 0): ").strip()
+    max_missing = int(max_missing) if max_missing.isdigit() else 0
+    try:
+        matches = match_pantry(conn, pantry, max_missing)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
-        input("\nPress Enter to return.")
+        input("\nPress Enter to go back.")
+        return
+    index = get_ingredient_index(conn)
+    while True:
+        clear_screen()
+        print(f"Recipes you can make from {', '.join(sorted(pantry.values()))}:")
+        if not matches:
+            print("No recipes match. Try adding ingredients or allowing some to be missing.")
+            input("\nPress Enter to go back.")
+            return
+        for idx, (recipe_id, name, matched, total, missing) in enumerate(matches, start=1):
+            print(f"{idx}. {name} ({matched} of {total} ingredients)")
+            if missing:
+                ingredients = (index.get(ingredient_id) for ingredient_id in missing)
+                print(f"   Missing: {', '.join(ingredient[1] for ingredient in ingredients if ingredient)}")
+        recipe_choice = input(
+            "\nSelect a recipe to view details (number) or press Enter to go back: ").strip()
+        if not (recipe_choice.isdigit() and 1 <= int(recipe_choice) <= len(matches)):
+            return
+        detailed_recipe_view(conn, matches[int(recipe_choice) - 1][0])
+
+# number of matches the ingredient picker shows at once
+PICKER_LIMIT = 10
+
+# returned by pick_ingredient when the user asks to create a new ingredient
+CREATE_INGREDIENT = 'c'
+
+# search-as-you-type ingredient picker backed by the in-memory prefix index
+# typing text narrows the matches; returns (ingredient_id, name, unit_of_measure),
+# CREATE_INGREDIENT (only offered when create is set), or None when the user goes back
+
+
+def pick_ingredient(conn, heading="Select an Ingredient:", create=True):
+    index = get_ingredient_index(conn)
+    text = ""
+    while True:
+        clear_screen()
+        print(heading)
+        matches = index.search(text, limit=PICKER_LIMIT)
+        if text:
+            print(f"\nIngredients matching '{text}':")
+        else:
+            print(f"\nIngredients (showing {len(matches)} of {len(index)}):")
+        for idx, ingredient in enumerate(matches, start=1):
+            print(f"{idx}. {ingredient[1]} ({ingredient[2]})")
+        if not matches:
+            print("No matching ingredients.")
+
+        offer = "'c' to create a new ingredient or " if create else "or "
+        choice = input(
+            f"\nType part of a name to search, select an ingredient (number), {offer}'b' to go back: ").strip()
+        if choice.lower() == 'b':
+            return None
+        elif create and choice.lower() == CREATE_INGREDIENT:
+            return CREATE_INGREDIENT
+        elif choice.isdigit() and 1 <= int(choice) <= len(matches):
+            return matches[int(choice) - 1]
+        else:
+            text = choice
 
 # user can add their own recipe
 
@@ -242,7 +547,7 @@ def add_recipe(conn):
                 "Select a category (number) or 'b' to go back: ").strip()
             if category_choice.lower() == 'b':
                 return
-            category_id = int(category_choice) if category_choice.isdigit(
+            category_id = categories[int(category_choice) - 1][0] if category_choice.isdigit(
             ) and 1 <= int(category_choice) <= len(categories) else None
 
             cursor.execute("SELECT user_id, username FROM User")
@@ -255,56 +560,40 @@ def add_recipe(conn):
                 "Select a user (number) or 'b' to go back: ").strip()
             if user_choice.lower() == 'b':
                 return
-            user_id = int(user_choice) if user_choice.isdigit(
+            user_id = users[int(user_choice) - 1][0] if user_choice.isdigit(
             ) and 1 <= int(user_choice) <= len(users) else None
 
-            # user enters all fields
-            name = input("Enter recipe name: ").strip()
-            prep_time = input("Enter preparation time (in minutes): ").strip()
-            cook_time = input("Enter cooking time (in minutes): ").strip()
-            servings = input("Enter number of servings: ").strip()
-            instructions = input("Enter instructions: ").strip()
-
-            cursor.execute("""
-                INSERT INTO Recipe (name, prep_time, cook_time, servings, instructions, category_id, user_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (name, prep_time, cook_time, servings, instructions, category_id, user_id))
-            conn.commit()
-            recipe_id = cursor.lastrowid
-            print("Recipe added successfully!")
+            # user enters all fields; nothing is written until the recipe is complete
+            edit = RecipeEdit()
+            edit.update(
+                name=input("Enter recipe name: ").strip(),
+                prep_time=input("Enter preparation time (in minutes): ").strip(),
+                cook_time=input("Enter cooking time (in minutes): ").strip(),
+                servings=input("Enter number of servings: ").strip(),
+                instructions=input("Enter instructions: ").strip(),
+                category_id=category_id,
+                user_id=user_id)
 
             while True:
-                clear_screen()
-                print("Add Ingredients:")
-                cursor.execute(
-                    "SELECT ingredient_id, name, unit_of_measure FROM Ingredient")
-                ingredients = cursor.fetchall()
-                print("\nAvailable Ingredients:")
-                for idx, ingredient in enumerate(ingredients, start=1):
-                    print(f"{idx}. {ingredient[1]} ({ingredient[2]})")
-
-                ingredient_choice = input(
-                    "\nSelect an ingredient (number) or 'c' to create a new ingredient: ").strip()
-                if ingredient_choice.lower() == 'c':
-                    create_ingredient(conn, auto_link_recipe_id=recipe_id)
-                elif ingredient_choice.isdigit() and 1 <= int(ingredient_choice) <= len(ingredients):
-                    ingredient_id = ingredients[int(ingredient_choice) - 1][0]
-                    quantity = input(f"Enter quantity for '{
-                                     ingredients[int(ingredient_choice) - 1][1]}': ").strip()
+                ingredient = pick_ingredient(conn, "Add Ingredients:")
+                if ingredient == CREATE_INGREDIENT:
+                    create_ingredient(conn, edit)
+                elif ingredient:
+                    quantity = input(
+                        f"Enter quantity for '{ingredient[1]}': ").strip()
                     if quantity:
-                        cursor.execute("""
-                            INSERT INTO RecipeIngredient (recipe_id, ingredient_id, quantity)
-                            VALUES (?, ?, ?)
-                        """, (recipe_id, ingredient_id, quantity))
-                        conn.commit()
-                        print("Ingredient added successfully!")
+                        edit.link(ingredient[0], quantity,
+                                  ingredient[1], ingredient[2])
+                        print("Ingredient added.")
                 else:
-                    print("Invalid choice. Please try again.")
+                    print("No ingredient selected.")
                 cont = input(
                     "\nWould you like to add another ingredient? (y/n): ").strip().lower()
                 if cont != 'y':
                     break
 
+            edit.commit(conn)
+            print("Recipe added successfully!")
             input("\nPress Enter to return.")
             return
         except sqlite3.Error as e:
@@ -312,9 +601,10 @@ def add_recipe(conn):
             input("\nPress Enter to go back.")
 
 # creates ingredient not already in the database
+# inside a recipe edit the ingredient is only created, and linked, when the edit is committed
 
 
-def create_ingredient(conn, auto_link_recipe_id=None):
+def create_ingredient(conn, edit=None):
     clear_screen()
     print("Create New Ingredient:")
     name = input("Enter ingredient name: ").strip()
@@ -326,25 +616,25 @@ def create_ingredient(conn, auto_link_recipe_id=None):
         input("\nPress Enter to return.")
         return None
 
-    cursor = conn.cursor()
+    if edit is not None:
+        quantity = input(f"Enter quantity for '{name}' (e.g., 200g): ").strip()
+        if not quantity:
+            print("No quantity entered; the ingredient was not added.")
+            input("\nPress Enter to return.")
+            return None
+        ingredient_id = edit.create_ingredient(name, unit_of_measure)
+        edit.link(ingredient_id, quantity)
+        print(f"Ingredient '{name}' will be created and added to the recipe.")
+        input("\nPress Enter to return.")
+        return ingredient_id
+
     try:
-        cursor.execute(
-            "INSERT INTO Ingredient (name, unit_of_measure) VALUES (?, ?)", (name, unit_of_measure))
-        conn.commit()
-        ingredient_id = cursor.lastrowid
+        with transaction(conn) as cursor:
+            cursor.execute(
+                "INSERT INTO Ingredient (name, unit_of_measure) VALUES (?, ?)", (name, unit_of_measure))
+            ingredient_id = cursor.lastrowid
+        get_ingredient_index(conn).add(ingredient_id, name, unit_of_measure)
         print(f"Ingredient '{name}' created successfully!")
-
-        if auto_link_recipe_id:
-            quantity = input(f"Enter quantity for '{
-                             name}' (e.g., 200g): ").strip()
-            if quantity:
-                cursor.execute("""
-                    INSERT INTO RecipeIngredient (recipe_id, ingredient_id, quantity)
-                    VALUES (?, ?, ?)
-                """, (auto_link_recipe_id, ingredient_id, quantity))
-                conn.commit()
-                print(f"Ingredient '{
-                      name}' linked to the recipe successfully!")
         input("\nPress Enter to return.")
         return ingredient_id
     except sqlite3.Error as e:
@@ -448,34 +738,25 @@ def update_recipe(conn):
                 try:
                     user_choice = int(user_choice)
                     if 1 <= user_choice <= len(users):
-                        user_id = users[user_choice - 1][0]
+                        owner_id = users[user_choice - 1][0]
                     else:
                         print("Invalid user choice. Keeping current user.")
-                        user_id = selected_recipe[8]
+                        owner_id = selected_recipe[8]
                 except ValueError:
                     print("Invalid input. Keeping current user.")
-                    user_id = selected_recipe[8]
+                    owner_id = selected_recipe[8]
             else:
-                user_id = selected_recipe[8]
+                owner_id = selected_recipe[8]
 
-            cursor.execute("""
-                UPDATE Recipe
-                SET name = ?, prep_time = ?, cook_time = ?, servings = ?, category_id = ?, user_id = ?
-                WHERE recipe_id = ?
-            """, (new_name, new_prep_time, new_cook_time, new_servings, category_id, user_id, recipe_id))
-            conn.commit()
-            print("Recipe updated successfully!")
+            # the whole edit session is saved in one transaction when the user is done
+            edit = RecipeEdit(recipe_id)
+            edit.update(name=new_name, prep_time=new_prep_time, cook_time=new_cook_time,
+                        servings=new_servings, category_id=category_id, user_id=owner_id)
 
             while True:
                 clear_screen()
                 print("Manage Ingredients:")
-                cursor.execute("""
-                    SELECT Ingredient.ingredient_id, Ingredient.name, RecipeIngredient.quantity, Ingredient.unit_of_measure
-                    FROM RecipeIngredient
-                    JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
-                    WHERE RecipeIngredient.recipe_id = ?
-                """, (recipe_id,))
-                ingredients = cursor.fetchall()
+                ingredients = edit.ingredients(conn)
                 print("\nCurrent Ingredients:")
                 for idx, ingredient in enumerate(ingredients, start=1):
                     print(f"{idx}. {ingredient[1]}: {
@@ -484,39 +765,25 @@ def update_recipe(conn):
                 print("\nOptions:")
                 print("1. Add an ingredient")
                 print("2. Remove an ingredient")
-                print("b. Go back")
+                print("b. Save and go back")
 
                 choice = input("Enter your choice: ").strip().lower()
                 if choice == 'b':
                     break
                 elif choice == '1':
 
-                    clear_screen()
-                    cursor.execute(
-                        "SELECT ingredient_id, name, unit_of_measure FROM Ingredient")
-                    all_ingredients = cursor.fetchall()
-                    print("\nAvailable Ingredients:")
-                    for idx, ingredient in enumerate(all_ingredients, start=1):
-                        print(f"{idx}. {ingredient[1]} ({ingredient[2]})")
-
-                    ingredient_choice = input(
-                        "\nSelect an ingredient (number) or 'c' to create a new ingredient: ").strip()
-                    if ingredient_choice.lower() == 'c':
-                        create_ingredient(conn, auto_link_recipe_id=recipe_id)
-                    elif ingredient_choice.isdigit() and 1 <= int(ingredient_choice) <= len(all_ingredients):
-                        ingredient_id = all_ingredients[int(
-                            ingredient_choice) - 1][0]
-                        quantity = input(f"Enter quantity for '{
-                                         all_ingredients[int(ingredient_choice) - 1][1]}': ").strip()
+                    ingredient = pick_ingredient(conn, "Add an Ingredient:")
+                    if ingredient == CREATE_INGREDIENT:
+                        create_ingredient(conn, edit)
+                    elif ingredient:
+                        quantity = input(
+                            f"Enter quantity for '{ingredient[1]}': ").strip()
                         if quantity:
-                            cursor.execute("""
-                                INSERT INTO RecipeIngredient (recipe_id, ingredient_id, quantity)
-                                VALUES (?, ?, ?)
-                            """, (recipe_id, ingredient_id, quantity))
-                            conn.commit()
-                            print("Ingredient added successfully!")
+                            edit.link(ingredient[0], quantity,
+                                      ingredient[1], ingredient[2])
+                            print("Ingredient added.")
                     else:
-                        print("Invalid choice. Please try again.")
+                        print("No ingredient selected.")
                 elif choice == '2':
 
                     if not ingredients:
@@ -529,13 +796,8 @@ def update_recipe(conn):
                     try:
                         ingredient_choice = int(ingredient_choice)
                         if 1 <= ingredient_choice <= len(ingredients):
-                            ingredient_id = ingredients[ingredient_choice - 1][0]
-                            cursor.execute("""
-                                DELETE FROM RecipeIngredient
-                                WHERE recipe_id = ? AND ingredient_id = ?
-                            """, (recipe_id, ingredient_id))
-                            conn.commit()
-                            print("Ingredient removed successfully!")
+                            edit.unlink(ingredients[ingredient_choice - 1][0])
+                            print("Ingredient removed.")
                         else:
                             print("Invalid choice. Please try again.")
                     except ValueError:
@@ -543,6 +805,8 @@ def update_recipe(conn):
                     input("\nPress Enter to continue.")
                 else:
                     print("Invalid choice. Please try again.")
+            edit.commit(conn)
+            print("Recipe updated successfully!")
             input("\nPress Enter to return.")
             return
         except sqlite3.Error as e:
@@ -597,9 +861,7 @@ def delete_recipe(conn):
             confirm = input(f"Are you sure you want to delete the recipe '{
                             recipes[recipe_choice - 1][1]}'? (y/n): ").strip().lower()
             if confirm == 'y':
-                cursor.execute(
-                    "DELETE FROM Recipe WHERE recipe_id = ?", (recipe_id,))
-                conn.commit()
+                delete_recipes(conn, [recipe_id])
                 print("Recipe deleted successfully!")
             else:
                 print("Deletion canceled.")
@@ -612,10 +874,18 @@ def delete_recipe(conn):
             input("\nPress Enter to go back.")
             return
 
+# print a shopping list, either freshly aggregated or loaded from a saved list
+
+
+def print_shopping_list(ingredients, heading="Shopping List:"):
+    print(heading)
+    for ingredient in ingredients:
+        print(f"- {format_item(ingredient)}")
+
 # user can make a shopping list from ingredients of a recipe
 
 
-def generate_shopping_list(conn):
+def shopping_list_from_recipes(conn, user_id):
     while True:
         clear_screen()
         print("Generate Shopping List:")
@@ -657,22 +927,19 @@ def generate_shopping_list(conn):
                 input("\nPress Enter to continue.")
                 continue
 
-            placeholders = ', '.join(['?'] * len(selected_recipe_ids))
-            cursor.execute(f"""
-                SELECT Ingredient.name, SUM(RecipeIngredient.quantity) AS total_quantity, Ingredient.unit_of_measure
-                FROM RecipeIngredient
-                JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
-                WHERE RecipeIngredient.recipe_id IN ({placeholders})
-                GROUP BY Ingredient.name, Ingredient.unit_of_measure
-            """, selected_recipe_ids)
-            ingredients = cursor.fetchall()
+            servings = ask_servings()
+            ingredients = aggregate_ingredients(conn, selected_recipe_ids, servings=servings)
 
             if ingredients:
                 clear_screen()
-                print("Shopping List:")
-                for ingredient in ingredients:
-                    print(
-                        f"- {ingredient[0]}: {ingredient[1]} {ingredient[2]}")
+                print_shopping_list(ingredients)
+                save = input(
+                    "\nSave this shopping list? (y/n): ").strip().lower()
+                if save == 'y':
+                    name = input("Name for the list (optional): ").strip() or None
+                    list_id = save_shopping_list(
+                        conn, user_id, selected_recipe_ids, name=name, servings=servings)
+                    print(f"Shopping list saved with ID: {list_id}")
             else:
                 print("No ingredients found for the selected recipes.")
 
@@ -682,85 +949,184 @@ def generate_shopping_list(conn):
             print(f"Database error: {e}")
             input("\nPress Enter to go back.")
 
-# make a meal plan for the week based on recipes in the db
+# ask how many servings a shopping list is for; None keeps the recipes as written
 
 
-def generate_and_save_meal_plan(conn, user_id):
-    clear_screen()
-    print("Generate Weekly Meal Plan:")
+def ask_servings():
+    answer = input("Servings to shop for (Enter to keep the recipes as written): ").strip()
+    return int(answer) if answer.isdigit() and int(answer) > 0 else None
 
-    cursor = conn.cursor()
+# build (or reopen) the saved shopping list for one of the recent meal plans
+
+
+def shopping_list_from_meal_plan(conn):
+    clear_screen()
+    print("Shopping List for a Meal Plan:")
     try:
+        meal_plans = fetch_meal_plans(conn, limit=PLAN_PAGE_SIZE * 2)
+        if not meal_plans:
+            print("No meal plans found.")
+            input("\nPress Enter to return.")
+            return
 
-        cursor.execute("""
-            SELECT Recipe.recipe_id, Recipe.name, Category.name AS category
-            FROM Recipe
-            JOIN Category ON Recipe.category_id = Category.category_id
-            WHERE Category.name NOT IN ('Appetizer', 'Dessert')
-        """)
-        recipes = cursor.fetchall()
+        for idx, plan in enumerate(meal_plans, start=1):
+            print(f"{idx}. Meal Plan (Start Date: {plan[1]} | End Date: {plan[2]} | Created At: {plan[3]})")
+        choice = input(
+            "\nSelect a meal plan (number) or 'b' to go back: ").strip()
+        if not (choice.isdigit() and 1 <= int(choice) <= len(meal_plans)):
+            return
 
-        if not recipes:
-            print("No recipes available for meal planning. Please add more recipes.")
+        list_id = save_plan_shopping_list(conn, meal_plans[int(choice) - 1][0], ask_servings())
+        show_saved_shopping_list(conn, list_id)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        input("\nPress Enter to return.")
+
+# show a saved list and let the user add or remove source recipes
+
+
+def show_saved_shopping_list(conn, list_id):
+    while True:
+        clear_screen()
+        ingredients = load_shopping_list(conn, list_id)
+        recipes = shopping_list_recipes(conn, list_id)
+        print_shopping_list(ingredients, f"Shopping List {list_id}:")
+        if not ingredients:
+            print("This shopping list is empty.")
+        print("\nFrom recipes: " + (", ".join(recipe[1] for recipe in recipes) or "none"))
+
+        print("\nOptions:")
+        print("1. Add a recipe")
+        print("2. Remove a recipe")
+        print("b. Go back")
+        choice = input("Enter your choice: ").strip().lower()
+        if choice == 'b':
+            return
+        elif choice == '1':
+            text = input("Search for a recipe to add: ").strip()
+            matches = search_recipes(conn, text, limit=PAGE_SIZE) if text else []
+            if not matches:
+                print("No matching recipes.")
+                input("\nPress Enter to continue.")
+                continue
+            for idx, recipe in enumerate(matches, start=1):
+                print(f"{idx}. {recipe[1]} (Category: {recipe[5]})")
+            recipe_choice = input("Select a recipe to add (number): ").strip()
+            if recipe_choice.isdigit() and 1 <= int(recipe_choice) <= len(matches):
+                if not add_recipe_to_list(conn, list_id, matches[int(recipe_choice) - 1][0]):
+                    print("That recipe is already on this list.")
+                    input("\nPress Enter to continue.")
+        elif choice == '2':
+            for idx, recipe in enumerate(recipes, start=1):
+                print(f"{idx}. {recipe[1]}")
+            recipe_choice = input(
+                "Select a recipe to remove (number): ").strip()
+            if recipe_choice.isdigit() and 1 <= int(recipe_choice) <= len(recipes):
+                remove_recipe_from_list(
+                    conn, list_id, recipes[int(recipe_choice) - 1][0])
+        else:
+            print("Invalid choice. Please try again.")
+            input("\nPress Enter to continue.")
+
+# pick one of the recently saved shopping lists and open it
+
+
+def open_saved_shopping_list(conn):
+    clear_screen()
+    print("Saved Shopping Lists:")
+    try:
+        lists = list_shopping_lists(conn)
+        if not lists:
+            print("No saved shopping lists.")
             input("\nPress Enter to return.")
             return
 
-        categorized_recipes = {}
-        for recipe in recipes:
-            category = recipe[2]
-            if category not in categorized_recipes:
-                categorized_recipes[category] = []
-            categorized_recipes[category].append(recipe)
-
-        required_categories = ['Breakfast', 'Lunch', 'Dinner']
-        for category in required_categories:
-            if category not in categorized_recipes or not categorized_recipes[category]:
-                print(f"Insufficient recipes for {
-                      category}. Please add more recipes.")
-                input("\nPress Enter to return.")
-                return
+        for idx, shopping_list in enumerate(lists, start=1):
+            name = shopping_list[1] or "Shopping list"
+            print(f"{idx}. {name} (Created At: {shopping_list[3]})")
+        choice = input(
+            "\nSelect a shopping list (number) or 'b' to go back: ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(lists):
+            show_saved_shopping_list(conn, lists[int(choice) - 1][0])
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        input("\nPress Enter to return.")
 
-        days = ['Monday', 'Tuesday', 'Wednesday',
-                'Thursday', 'Friday', 'Saturday', 'Sunday']
-        meal_plan = {}
+# shopping lists: build a new one from recipes or a meal plan, or reopen a saved one
 
-        shuffled_recipes = {category: random.sample(recipes, len(
-            recipes)) for category, recipes in categorized_recipes.items()}
 
-        for day in days:
-            meal_plan[day] = {}
-            for meal_type in ['Breakfast', 'Lunch', 'Dinner']:
+def generate_shopping_list(conn, user_id):
+    while True:
+        clear_screen()
+        print("Shopping Lists:")
+        print("1. New shopping list from recipes")
+        print("2. Shopping list for a meal plan")
+        print("3. Open a saved shopping list")
+        print("b. Go back to the main menu")
 
-                if not shuffled_recipes[meal_type]:
-                    shuffled_recipes[meal_type] = random.sample(
-                        categorized_recipes[meal_type], len(categorized_recipes[meal_type]))
+        choice = input("Enter your choice: ").strip().lower()
+        if choice == 'b':
+            return
+        elif choice == '1':
+            shopping_list_from_recipes(conn, user_id)
+        elif choice == '2':
+            shopping_list_from_meal_plan(conn)
+        elif choice == '3':
+            open_saved_shopping_list(conn)
+        else:
+            print("Invalid choice. Please try again.")
+            input("\nPress Enter to continue.")
 
-                selected_recipe = shuffled_recipes[meal_type].pop()
-                meal_plan[day][meal_type] = selected_recipe
+# make a meal plan of a week or longer based on recipes in the db
+# the current user gets a plan shown on screen; the batch option plans for every user at once
 
-        start_date = datetime.now().date()
-        end_date = start_date + timedelta(days=6)
-        created_at = datetime.now()
 
-        cursor.execute("""
-            INSERT INTO MealPlan (user_id, start_date, end_date, created_at)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, start_date, end_date, created_at))
-        conn.commit()
-        plan_id = cursor.lastrowid
+def generate_and_save_meal_plan(conn, user_id):
+    clear_screen()
+    print("Generate Meal Plan:")
+    print("1. Make a plan for the current user")
+    print("2. Make plans for all users")
+    print("3. Show what is planned for the current user")
+    print("b. Go back to the main menu")
+    choice = input("Enter your choice: ").strip().lower()
+    if choice == '3':
+        view_planned_meals(conn, user_id)
+        return
+    if choice not in ('1', '2'):
+        return
+    days = input(f"Number of days to plan [{PLAN_DAYS}]: ").strip()
+    days = int(days) if days.isdigit() and 1 <= int(days) <= MAX_PLAN_DAYS else PLAN_DAYS
+    optimize = input(
+        "Keep the shopping list short by reusing ingredients across meals? (y/n): ").strip().lower() == 'y'
 
-        for day, meals in meal_plan.items():
-            for recipe in meals.values():
-                cursor.execute("""
-                    INSERT INTO MealPlanRecipe (plan_id, recipe_id)
-                    VALUES (?, ?)
-                """, (plan_id, recipe[0]))
-        conn.commit()
+    try:
+
+        categorized_recipes = load_recipe_pool(conn)
+        if not categorized_recipes:
+            print("No recipes available for meal planning. Please add more recipes.")
+            input("\nPress Enter to return.")
+            return
+
+        for category in missing_categories(categorized_recipes):
+            print(f"Insufficient recipes for {category}. Please add more recipes.")
+            input("\nPress Enter to return.")
+            return
+
+        if choice == '2':
+            count = generate_meal_plans(
+                conn, categorized_recipes=categorized_recipes, optimize=optimize, days=days)
+            print(f"\nSaved {count} meal plans of {days} days.")
+            input("\nPress Enter to return.")
+            return
+
+        plan_id, _, meal_plan = generate_meal_plans(
+            conn, [user_id], categorized_recipes=categorized_recipes, keep_plans=True, optimize=optimize,
+            days=days)[0]
 
         clear_screen()
-        print("Weekly Meal Plan:")
+        print("Meal Plan:")
         for day, meals in meal_plan.items():
-            print(f"\n{day}:")
+            print(f"\n{day:%A %Y-%m-%d}:")
             for meal_type, recipe in meals.items():
                 print(f"  {meal_type}: {recipe[1]} (Category: {recipe[2]})")
         print(f"\nMeal plan saved successfully with ID: {plan_id}")
@@ -772,8 +1138,99 @@ def generate_and_save_meal_plan(conn, user_id):
     except Exception as e:
         print(f"Unexpected error: {e}")
         input("\nPress Enter to return.")
+
+# what the user has planned over a date range, one line per meal
+
+
+def view_planned_meals(conn, user_id):
+    clear_screen()
+    print("Planned Meals:")
+    date_from = prompt_date("From date (YYYY-MM-DD) or press Enter for today: ") or datetime.now().date()
+    date_to = prompt_date("Up to date (YYYY-MM-DD) or press Enter for a week: ") or date_from + timedelta(days=6)
+    meal_type = input(f"Only one meal ({', '.join(MEAL_TYPES)}) or press Enter for all: ").strip().title()
+    try:
+        meals = planned_meals(conn, user_id, date_from, date_to, meal_type if meal_type in MEAL_TYPES else None)
+        if not meals:
+            print("\nNothing planned for these dates.")
+        day = None
+        for date, meal, _, name, _ in meals:
+            if date != day:
+                day = date
+                print(f"\n{day}:")
+            print(f"  {meal}: {name}")
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    input("\nPress Enter to return.")
+
+# number of meal plans shown per page when viewing plan history
+PLAN_PAGE_SIZE = 5
+
+# fetch one page of meal plans with their recipes in a single query, newest first
+# filters: owner, plans overlapping [date_from, date_to]; before continues after the
+# (created_at, plan_id) of the last plan on the previous page. a plan overlapping
+# date_from started at most MAX_PLAN_DAYS before it, which bounds the start_date range
+
+
+def fetch_meal_plans(conn, user_id=None, date_from=None, date_to=None, before=None, limit=PLAN_PAGE_SIZE):
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if date_from is not None:
+        conditions.append("end_date >= ? AND start_date >= ?")
+        params.extend([str(date_from), str(date_from - timedelta(days=MAX_PLAN_DAYS - 1))])
+    if date_to is not None:
+        conditions.append("start_date <= ?")
+        params.append(str(date_to))
+    if before is not None:
+        conditions.append("(created_at, plan_id) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            WITH page AS (
+                SELECT plan_id, start_date, end_date, created_at
+                FROM MealPlan
+                {where}
+                ORDER BY created_at DESC, plan_id DESC
+                LIMIT ?
+            )
+            SELECT page.plan_id, page.start_date, page.end_date, page.created_at,
+                   Recipe.name, Category.name AS category
+            FROM page
+            LEFT JOIN MealPlanRecipe ON MealPlanRecipe.plan_id = page.plan_id
+            LEFT JOIN Recipe ON MealPlanRecipe.recipe_id = Recipe.recipe_id
+            LEFT JOIN Category ON Recipe.category_id = Category.category_id
+            ORDER BY page.created_at DESC, page.plan_id DESC
+        """, params + [limit])
+
+        # group the joined rows back into one entry per plan
+        meal_plans = []
+        for plan_id, start_date, end_date, created_at, recipe_name, category in cursor:
+            if not meal_plans or meal_plans[-1][0] != plan_id:
+                meal_plans.append(
+                    (plan_id, start_date, end_date, created_at, []))
+            if recipe_name is not None:
+                meal_plans[-1][4].append((recipe_name, category))
     finally:
         cursor.close()
+    return meal_plans
+
+# ask for an optional date, returning None when left blank
+
+
+def prompt_date(prompt):
+    while True:
+        value = input(prompt).strip()
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            print("Invalid date. Please use YYYY-MM-DD.")
 
 # user can see all the meal plans they have generated
 
@@ -785,44 +1242,111 @@ def view_all_meal_plans(conn):
     cursor = conn.cursor()
     try:
 
-        cursor.execute("""
-            SELECT plan_id, start_date, end_date, created_at
-            FROM MealPlan
-            ORDER BY created_at DESC
-        """)
-        meal_plans = cursor.fetchall()
-
-        if not meal_plans:
-            print("No meal plans found.")
-            input("\nPress Enter to return.")
-            return
+        # optional filters so long histories can be narrowed down
+        cursor.execute("SELECT user_id, username FROM User")
+        users = cursor.fetchall()
+        print("\nUsers:")
+        for idx, user in enumerate(users, start=1):
+            print(f"{idx}. {user[1]}")
+        user_choice = input(
+            "Filter by user (number) or press Enter for all users: ").strip()
+        user_id = users[int(user_choice) - 1][0] if user_choice.isdigit(
+        ) and 1 <= int(user_choice) <= len(users) else None
+        date_from = prompt_date(
+            "Show plans from date (YYYY-MM-DD) or press Enter for any: ")
+        date_to = prompt_date(
+            "Show plans up to date (YYYY-MM-DD) or press Enter for any: ")
+
+        # keyset cursors of the pages already visited, for going back
+        page_starts = [None]
+        while True:
+            meal_plans = fetch_meal_plans(
+                conn, user_id=user_id, date_from=date_from, date_to=date_to, before=page_starts[-1])
 
-        for idx, plan in enumerate(meal_plans, start=1):
-            print(f"Meal Plan {idx}:")
-            print(f"  Start Date: {plan[1]} | End Date: {
-                  plan[2]} | Created At: {plan[3]}")
-            print("-" * 30)
+            clear_screen()
+            if not meal_plans:
+                print("No meal plans found.")
+                input("\nPress Enter to return.")
+                return
 
-            cursor.execute("""
-                SELECT Recipe.name, Category.name AS category
-                FROM MealPlanRecipe
-                JOIN Recipe ON MealPlanRecipe.recipe_id = Recipe.recipe_id
-                JOIN Category ON Recipe.category_id = Category.category_id
-                WHERE MealPlanRecipe.plan_id = ?
-            """, (plan[0],))
-            recipes = cursor.fetchall()
+            print(f"All Generated Meal Plans (Page {len(page_starts)}):")
+            first_idx = (len(page_starts) - 1) * PLAN_PAGE_SIZE + 1
+            for idx, plan in enumerate(meal_plans, start=first_idx):
+                print(f"Meal Plan {idx}:")
+                print(f"  Start Date: {plan[1]} | End Date: {plan[2]} | Created At: {plan[3]}")
+                print("-" * 30)
 
-            for recipe in recipes:
-                print(f"  {recipe[1]}: {recipe[0]}")  # Category: Recipe Name
-            print("=" * 50)
+                for recipe in plan[4]:
+                    print(f"  {recipe[1]}: {recipe[0]}")  # Category: Recipe Name
+                print("=" * 50)
 
-        input("\nPress Enter to return.")
+            choice = input(
+                "\nn. Next page | p. Previous page | press Enter to return: ").strip().lower()
+            if choice == 'n':
+                if len(meal_plans) == PLAN_PAGE_SIZE:
+                    last = meal_plans[-1]
+                    page_starts.append((last[3], last[0]))
+                else:
+                    print("You are on the last page.")
+                    input("\nPress Enter to continue.")
+            elif choice == 'p':
+                if len(page_starts) > 1:
+                    page_starts.pop()
+            else:
+                return
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         input("\nPress Enter to return.")
     finally:
         cursor.close()
 
+# delete meal plans in one statement; their recipes go with them through ON DELETE CASCADE
+# and shopping lists made from them are kept. returns the number of plans deleted
+
+
+def delete_meal_plans(conn, plan_ids):
+    with transaction(conn) as cursor:
+        return cursor.execute("""
+            DELETE FROM MealPlan WHERE plan_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(plan_ids)),)).rowcount
+
+# delete every meal plan created more than days ago, optionally only one user's
+# created_at is UTC like CURRENT_TIMESTAMP, so the cutoff is computed by SQLite as well
+# walks idx_mealplan_created_at; returns the number of plans deleted
+
+
+def delete_old_meal_plans(conn, days, user_id=None):
+    age = f"-{int(days)} days"
+    with transaction(conn) as cursor:
+        if user_id is None:
+            return cursor.execute("DELETE FROM MealPlan WHERE created_at < datetime('now', ?)", (age,)).rowcount
+        return cursor.execute("DELETE FROM MealPlan WHERE user_id = ? AND created_at < datetime('now', ?)",
+                              (user_id, age)).rowcount
+
+# delete recipes in one statement, together with their ingredient links, meal plan
+# entries and shopping list links (ON DELETE CASCADE). returns the number deleted
+
+
+def delete_recipes(conn, recipe_ids):
+    recipe_ids = list(recipe_ids)
+    with transaction(conn) as cursor:
+        deleted = cursor.execute("""
+            DELETE FROM Recipe WHERE recipe_id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(recipe_ids),)).rowcount
+    invalidate_recipes(conn, recipe_ids)
+    return deleted
+
+# delete every recipe of one user; returns the number deleted
+
+
+def delete_user_recipes(conn, user_id):
+    with transaction(conn) as cursor:
+        recipe_ids = [row[0] for row in cursor.execute(
+            "SELECT recipe_id FROM Recipe WHERE user_id = ?", (user_id,))]
+        cursor.execute("DELETE FROM Recipe WHERE user_id = ?", (user_id,))
+    invalidate_recipes(conn, recipe_ids)
+    return len(recipe_ids)
+
 # deletes meal plan user has made
 
 
@@ -859,11 +1383,7 @@ def delete_meal_plan(conn):
             if 1 <= choice <= len(meal_plans):
                 selected_plan_id = meal_plans[choice - 1][0]
 
-                cursor.execute(
-                    "DELETE FROM MealPlanRecipe WHERE plan_id = ?", (selected_plan_id,))
-                cursor.execute(
-                    "DELETE FROM MealPlan WHERE plan_id = ?", (selected_plan_id,))
-                conn.commit()
+                delete_meal_plans(conn, [selected_plan_id])
                 print("Meal plan deleted successfully!")
             else:
                 print("Invalid selection. Please try again.")
@@ -876,6 +1396,121 @@ def delete_meal_plan(conn):
     finally:
         cursor.close()
 
+# maintenance tasks for the database and its derived indexes
+
+
+def maintenance_menu(conn):
+    while True:
+        clear_screen()
+        print("Maintenance:")
+        print("1. Rebuild recipe search index")
+        print("2. Show recipe cache statistics")
+        print("3. Show SQL trace summary")
+        print("4. Precompute similar recipes")
+        print("5. Delete old meal plans")
+        print("6. Remove orphaned rows and free unused space")
+        print("7. Take a snapshot of the database")
+        print("8. Restore a snapshot")
+        print("b. Go back to the main menu")
+
+        choice = input("Enter your choice: ").strip().lower()
+        if choice == 'b':
+            return
+        elif choice == '1':
+            try:
+                indexed = rebuild_search_index(conn)
+                print(f"Search index rebuilt for {indexed} recipes.")
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+            input("\nPress Enter to continue.")
+        elif choice == '2':
+            stats = get_recipe_cache(conn).stats()
+            print(f"Cached recipes: {stats['size']} of {stats['capacity']}")
+            print(f"Hits: {stats['hits']} | Misses: {stats['misses']} | Hit rate: {stats['hit_rate']:.1%}")
+            print(f"Evictions: {stats['evictions']} | Invalidations: {stats['invalidations']}")
+            input("\nPress Enter to continue.")
+        elif choice == '3':
+            if tracing_enabled():
+                get_tracer().report(sys.stdout, limit=10)
+            else:
+                print("SQL tracing is off. Start the application with RECIPE_SQL_TRACE=1 to enable it.")
+            input("\nPress Enter to continue.")
+        elif choice == '4':
+            try:
+                table = get_neighbor_table(conn)
+                table.precompute()
+                print(f"Similar recipes computed for {len(table)} recipes.")
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+            input("\nPress Enter to continue.")
+        elif choice == '5':
+            try:
+                days = int(input("Delete meal plans created more than how many days ago? "))
+                confirm = input(f"Delete every meal plan older than {days} days? (y/n): ").strip().lower()
+                if confirm == 'y':
+                    print(f"Deleted {delete_old_meal_plans(conn, days)} meal plans.")
+                else:
+                    print("Deletion canceled.")
+            except ValueError:
+                print("Invalid input. Please enter a number.")
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+            input("\nPress Enter to continue.")
+        elif choice == '6':
+            try:
+                full = input("Also rewrite the file so space can be freed from now on (slow)? (y/n): ").strip().lower()
+                if full == 'y' and enable_incremental_vacuum(conn):
+                    print("Database rewritten with incremental vacuum.")
+                result = run_cleanup(conn)
+                print(f"Removed {result['orphans']} orphaned rows and freed {result['pages']} pages.")
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+            input("\nPress Enter to continue.")
+        elif choice == '7':
+            try:
+                path = take_snapshot(conn, progress=print_progress)
+                print(f"\nSnapshot saved to {path}")
+            except (sqlite3.Error, OSError) as e:
+                print(f"\nSnapshot failed: {e}")
+            input("\nPress Enter to continue.")
+        elif choice == '8':
+            restore_snapshot(conn)
+        else:
+            print("Invalid choice. Please try again.")
+            input("\nPress Enter to continue.")
+
+# show how far a backup or restore has got, on one line
+
+
+def print_progress(done, total):
+    print(f"\rCopied {done} of {total} pages ({done / total if total else 1:.0%})", end='', flush=True)
+
+# pick a snapshot and restore it; the current database is snapshotted first
+
+
+def restore_snapshot(conn):
+    snapshots = list_snapshots()
+    if not snapshots:
+        print("No snapshots found.")
+        input("\nPress Enter to continue.")
+        return
+    for idx, (path, taken_at, size) in enumerate(snapshots, start=1):
+        print(f"{idx}. {taken_at:%Y-%m-%d %H:%M:%S} ({size / 1048576:.1f} MiB) {path}")
+    choice = input("Select a snapshot to restore (number) or press Enter to cancel: ").strip()
+    if not (choice.isdigit() and 1 <= int(choice) <= len(snapshots)):
+        return
+    path = snapshots[int(choice) - 1][0]
+    confirm = input(f"Replace the database with {path}? The current data is snapshotted first. (y/n): ")
+    if confirm.strip().lower() != 'y':
+        print("Restore canceled.")
+    else:
+        try:
+            previous = restore_database(conn, path, progress=print_progress)
+            print(f"\nRestored {path}. The replaced data was saved to {previous}")
+        except (sqlite3.Error, OSError) as e:
+            print(f"\nRestore failed: {e}")
+    input("\nPress Enter to continue.")
+
 # exit
 
 
@@ -886,8 +1521,7 @@ def exit_application(conn):
 
 
 def main():
-    db_file = 'Checkpoint2-dbase.sqlite3'
-    conn = connect_db(db_file)
+    conn = connect_db(DB_FILE)
     if not conn:
         print("Failed to connect to the database.")
         return
@@ -898,21 +1532,23 @@ def main():
         display_menu()
         choice = input("\nEnter your choice: ").strip().lower()
         if choice == '1':
-            view_recipes(conn)
+            run_action('view_recipes', view_recipes, conn, user_id)
         elif choice == '2':
-            add_recipe(conn)
+            run_action('add_recipe', add_recipe, conn)
         elif choice == '3':
-            update_recipe(conn)
+            run_action('update_recipe', update_recipe, conn)
         elif choice == '4':
-            delete_recipe(conn)
+            run_action('delete_recipe', delete_recipe, conn)
         elif choice == '5':
-            generate_shopping_list(conn)
+            run_action('generate_shopping_list', generate_shopping_list, conn, user_id)
         elif choice == '6':
-            generate_and_save_meal_plan(conn, user_id)
+            run_action('generate_and_save_meal_plan', generate_and_save_meal_plan, conn, user_id)
         elif choice == '7':
-            view_all_meal_plans(conn)
+            run_action('view_all_meal_plans', view_all_meal_plans, conn)
         elif choice == '8':
-            delete_meal_plan(conn)
+            run_action('delete_meal_plan', delete_meal_plan, conn)
+        elif choice == '9':
+            run_action('maintenance_menu', maintenance_menu, conn)
         elif choice == 'b':
             print("Goodbye!")
             exit_application(conn)
@@ -923,4 +1559,13 @@ def main():
 
 
 if __name__ == "__main__":
+    argv = sys.argv[1:]
+    # --profile DIR writes a profile of every action to DIR (see profiling.py)
+    if argv[:1] == ['--profile'] and len(argv) > 1:
+        enable_profiling(argv[1])
+        argv = argv[2:]
+    # any other arguments switch to the non-interactive command line (see cli.py)
+    if argv:
+        from cli import main as cli_main
+        sys.exit(cli_main(argv))
     main()
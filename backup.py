@@ -0,0 +1,155 @@
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from concurrency import BUSY_TIMEOUT, configure
+from ingredients import reset_ingredient_index
+from migrations import migrate
+from recipecache import get_recipe_cache
+
+# online backups, snapshots and restores through SQLite's backup API
+#
+#   python app.py backup copy.sqlite3
+#   python app.py snapshot --dir snapshots
+#   python app.py restore snapshots/Checkpoint2-dbase-20250301-120000.sqlite3
+#
+# pages are copied PAGES at a time with a PAUSE in between, so live sessions get the
+# disk and the locks back between steps. the source connection holds one read
+# transaction for the whole copy: in WAL mode writers carry on meanwhile, and the copy
+# is the database as of the moment it started instead of restarting whenever another
+# session commits (the WAL file grows until the copy is done)
+#
+# a copy is written next to its destination and renamed into place once it passed
+# quick_check, so a backup file is never half-written
+
+# pages copied per step, and seconds to pause between steps
+PAGES = 1024
+PAUSE = 0.01
+# where snapshots go by default
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_TIME = '%Y%m%d-%H%M%S'
+
+
+def _database_file(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def _copy(source, target, pages, pause, progress):
+    def step(status, remaining, total):
+        if progress is not None:
+            progress(total - remaining, total)
+        if remaining and pause:
+            time.sleep(pause)
+    source.backup(target, pages=pages, progress=step)
+
+
+def _check(conn, what):
+    result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f"{what} failed its integrity check: {result}")
+
+# copy the database behind conn to path while it stays in use
+# progress(pages_done, pages_total) is called after every step; returns the file size
+
+
+def backup_database(conn, path, pages=PAGES, pause=PAUSE, progress=None):
+    partial = f"{path}.partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    pinned = not conn.in_transaction
+    target = sqlite3.connect(partial)
+    try:
+        if pinned:
+            conn.execute("BEGIN")
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        try:
+            _copy(conn, target, pages, pause, progress)
+        finally:
+            if pinned:
+                conn.rollback()
+        # a self-contained file, without a WAL to carry along
+        target.execute("PRAGMA journal_mode = DELETE")
+        _check(target, "The backup")
+    except BaseException:
+        target.close()
+        os.remove(partial)
+        raise
+    target.close()
+    os.replace(partial, path)
+    return os.path.getsize(path)
+
+# back up into a new file in directory named after the database and the time
+# returns the path of the snapshot
+
+
+def take_snapshot(conn, directory=SNAPSHOT_DIR, pages=PAGES, pause=PAUSE, progress=None):
+    stem = os.path.splitext(os.path.basename(_database_file(conn) or 'memory'))[0]
+    os.makedirs(directory, exist_ok=True)
+    name = f"{stem}-{datetime.now().strftime(SNAPSHOT_TIME)}"
+    path = os.path.join(directory, f"{name}.sqlite3")
+    copy = 1
+    while os.path.exists(path):
+        copy += 1
+        path = os.path.join(directory, f"{name}-{copy}.sqlite3")
+    backup_database(conn, path, pages, pause, progress)
+    return path
+
+# snapshots in directory, oldest first: [(path, taken_at, size), ...]
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith('.sqlite3'):
+            continue
+        # <database>-YYYYmmdd-HHMMSS[-copy].sqlite3
+        parts = name[:-len('.sqlite3')].split('-')
+        for start in range(len(parts) - 1):
+            try:
+                taken_at = datetime.strptime(f"{parts[start]}-{parts[start + 1]}", SNAPSHOT_TIME)
+            except ValueError:
+                continue
+            path = os.path.join(directory, name)
+            snapshots.append((path, taken_at, os.path.getsize(path)))
+            break
+    snapshots.sort(key=lambda snapshot: (snapshot[1], snapshot[0]))
+    return snapshots
+
+# replace the database behind conn with a snapshot (or any backup file) and bring it
+# up to the current schema. the restored database gets a new recipe change epoch, so
+# the in-memory copies of recipe data of every session reload (see
+# recipecache.recipe_version); this process's recipe cache and ingredient index are
+# reset here
+# keep_current first takes a snapshot of the database being replaced; returns its path
+
+
+def restore_database(conn, snapshot, pages=PAGES, pause=PAUSE, progress=None, keep_current=True,
+                     directory=SNAPSHOT_DIR):
+    db_file = _database_file(conn)
+    if not db_file:
+        raise ValueError("Only a database file can be restored.")
+    if not os.path.isfile(snapshot):
+        raise FileNotFoundError(f"No such snapshot: {snapshot}")
+    source = sqlite3.connect(f"file:{os.path.abspath(snapshot)}?mode=ro", uri=True)
+    try:
+        _check(source, "The snapshot")
+        previous = take_snapshot(conn, directory, pages, pause) if keep_current else None
+        target = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT)
+        try:
+            _copy(source, target, pages, pause, progress)
+            # the snapshot may be from an older schema version
+            migrate(target)
+            with target:
+                target.execute("UPDATE RecipeVersion SET epoch = abs(random())")
+            configure(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    get_recipe_cache(conn).clear()
+    reset_ingredient_index(conn)
+    return previous
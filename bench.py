@@ -0,0 +1,242 @@
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from app import (count_recipes, delete_meal_plans, fetch_meal_plans, fetch_recipe_page, find_page_anchor,
+                 get_recipe_detail, load_recipe_detail)
+from mealplans import generate_meal_plans, load_recipe_pool
+from search import search_recipes
+from shopping import aggregate_ingredients
+from similarity import recommend_recipes, similar_recipes
+
+# benchmarks for the query and assembly path behind each menu action, without prompts
+#
+#   python datagen.py bench.sqlite3 --recipes 50000
+#   python bench.py bench.sqlite3 --iterations 500 --json results.json
+#   python bench.py bench.sqlite3 --baseline results.json
+#
+# every operation is timed on its own for the given number of iterations and reported
+# as p50/p95/p99 latency, then run again under tracemalloc for its peak memory
+# the benchmark works on a copy of the database, since some operations write
+
+# operation name -> (menu action, function(conn, fixture, rng))
+OPERATIONS = {}
+
+
+def operation(name, action):
+    def register(function):
+        OPERATIONS[name] = (action, function)
+        return function
+    return register
+
+# ids and terms the operations draw from, loaded once per run
+
+
+class Fixture:
+    def __init__(self, conn):
+        self.recipe_ids = [row[0] for row in conn.execute("SELECT recipe_id FROM Recipe")]
+        self.user_ids = [row[0] for row in conn.execute("SELECT user_id FROM User")]
+        words = set()
+        for (name,) in conn.execute("SELECT name FROM Recipe LIMIT 1000"):
+            words.update(word for word in name.lower().split() if word.isalpha())
+        self.search_terms = sorted(words) or ['recipe']
+        self.page_count = max(1, -(-count_recipes(conn) // 10))
+        self.recipe_pool = load_recipe_pool(conn)
+        self.plan_ids = []
+
+    # recipe ids with a skewed popularity, like real traffic on recipe details
+
+    def popular_recipe(self, rng):
+        return self.recipe_ids[min(int(rng.paretovariate(1.2)) - 1, len(self.recipe_ids) - 1)]
+
+
+@operation('view_all', "View all recipes (jump to a page)")
+def _view_all(conn, fixture, rng):
+    count_recipes(conn)
+    anchor = find_page_anchor(conn, rng.randint(1, fixture.page_count))
+    fetch_recipe_page(conn, after_id=anchor)
+
+
+@operation('view_by_user', "View recipes by user (first page)")
+def _view_by_user(conn, fixture, rng):
+    user_id = rng.choice(fixture.user_ids)
+    count_recipes(conn, user_id)
+    fetch_recipe_page(conn, user_id)
+
+
+@operation('detail', "Recipe detail (uncached)")
+def _detail(conn, fixture, rng):
+    load_recipe_detail(conn, rng.choice(fixture.recipe_ids))
+
+
+@operation('detail_cached', "Recipe detail (skewed ids, through the cache)")
+def _detail_cached(conn, fixture, rng):
+    get_recipe_detail(conn, fixture.popular_recipe(rng))
+
+
+@operation('similar', "Similar recipes (skewed ids, through the neighbor table)")
+def _similar(conn, fixture, rng):
+    similar_recipes(conn, fixture.popular_recipe(rng))
+
+
+@operation('recommend', "Recommended for you")
+def _recommend(conn, fixture, rng):
+    recommend_recipes(conn, rng.choice(fixture.user_ids))
+
+
+@operation('search', "Search recipes")
+def _search(conn, fixture, rng):
+    search_recipes(conn, rng.choice(fixture.search_terms))
+
+
+@operation('shopping_list', "Shopping list for 5 recipes")
+def _shopping_list(conn, fixture, rng):
+    aggregate_ingredients(conn, rng.sample(fixture.recipe_ids, min(5, len(fixture.recipe_ids))))
+
+
+@operation('plan_generate', "Generate a weekly meal plan")
+def _plan_generate(conn, fixture, rng):
+    plans = generate_meal_plans(conn, [rng.choice(fixture.user_ids)], rng=rng,
+                                categorized_recipes=fixture.recipe_pool, keep_plans=True)
+    fixture.plan_ids.append(plans[0][0])
+
+
+@operation('plan_list', "View meal plans (first page)")
+def _plan_list(conn, fixture, rng):
+    fetch_meal_plans(conn, rng.choice(fixture.user_ids))
+
+
+@operation('plan_delete', "Delete a meal plan")
+def _plan_delete(conn, fixture, rng):
+    if fixture.plan_ids:
+        delete_meal_plans(conn, [fixture.plan_ids.pop()])
+
+# p50/p95/p99 of a list of durations in seconds, reported in milliseconds
+
+
+def summarize(timings):
+    if len(timings) < 2:
+        timings = timings * 2
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {'runs': len(timings), 'p50_ms': percentiles[49] * 1000, 'p95_ms': percentiles[94] * 1000,
+            'p99_ms': percentiles[98] * 1000, 'max_ms': max(timings) * 1000}
+
+
+def run_operation(conn, fixture, name, iterations, seed, memory_iterations=20):
+    action, function = OPERATIONS[name]
+    rng = random.Random(seed)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function(conn, fixture, rng)
+        timings.append(time.perf_counter() - start)
+    result = summarize(timings)
+    result['action'] = action
+
+    tracemalloc.start()
+    try:
+        for _ in range(memory_iterations):
+            function(conn, fixture, rng)
+        result['peak_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+    return result
+
+# run the selected operations on a scratch copy of db_file; returns {name: result}
+
+
+def run_benchmarks(db_file, names=None, iterations=200, seed=0):
+    from app import connect_db
+
+    names = names or list(OPERATIONS)
+    with tempfile.TemporaryDirectory() as scratch:
+        copy = os.path.join(scratch, os.path.basename(db_file))
+        source = sqlite3.connect(db_file)
+        target = sqlite3.connect(copy)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        conn = connect_db(copy)
+        if not conn:
+            raise RuntimeError(f"Cannot open {db_file}")
+        try:
+            fixture = Fixture(conn)
+            # deletion needs plans to delete: one per timed and memory run
+            if 'plan_delete' in names and 'plan_generate' not in names:
+                plan_rng = random.Random(seed)
+                for _ in range(iterations + 20):
+                    _plan_generate(conn, fixture, plan_rng)
+            return {name: run_operation(conn, fixture, name, iterations, seed) for name in names}
+        finally:
+            conn.close()
+
+# compare p95 latencies against a saved run; returns the names that got slower than allowed
+
+
+def regressions(results, baseline, tolerance):
+    slower = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            slower.append(name)
+    return slower
+
+
+def print_results(results, baseline=None):
+    print(f"{'operation':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KiB':>10}"
+          + (f"{'p95 vs base':>13}" if baseline else ""))
+    for name, result in results.items():
+        line = (f"{name:<16}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+                f"{result['max_ms']:>10.3f}{result['peak_kib']:>10.1f}")
+        if baseline and name in baseline and baseline[name]['p95_ms']:
+            change = result['p95_ms'] / baseline[name]['p95_ms'] - 1
+            line += f"{change:>+13.1%}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the operations behind each menu action.")
+    parser.add_argument('db', help="database to benchmark (see datagen.py); it is not modified")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', action='append', choices=list(OPERATIONS),
+                        help="run only this operation (repeatable)")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="results file from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed p95 slowdown against the baseline (default 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    try:
+        results = run_benchmarks(args.db, args.only, args.iterations, args.seed)
+    except (RuntimeError, sqlite3.Error) as e:
+        print(e, file=sys.stderr)
+        return 1
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as stream:
+            baseline = json.load(stream)
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as stream:
+            json.dump(results, stream, indent=2)
+    if baseline:
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            print(f"\nSlower than the baseline: {', '.join(slower)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from recipecache import recipe_version
+
+# compact in-memory copy of the recipe data that planning and shopping lists read
+# recipes are parallel arrays sorted by recipe_id; their ingredients are one CSR
+# adjacency: the links of the recipe at position p are offsets[p]:offsets[p + 1] of
+# link_ingredients / link_amounts / link_units. amounts are canonical numbers (NaN when
+# the quantity could not be parsed, which is then kept as text in unparsed)
+#
+# the catalog is loaded once per database and reloaded on the next use after recipe
+# data changed, in this or any other process, as told by the recipe change counter
+# (see recipecache.recipe_version); meal plan and shopping list writes leave it alone
+
+NO_NUMBER = -1
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NO_NUMBER
+
+
+class RecipeCatalog:
+    def __init__(self):
+        self.recipe_ids = array('q')
+        self.names = []
+        self.categories = []  # category code -> name
+        self.category_codes = array('h')
+        self.prep_times = array('l')  # NO_NUMBER when unknown
+        self.cook_times = array('l')
+        self.servings = array('l')
+        self.offsets = array('q', [0])
+        self.link_ingredients = array('q')
+        self.link_amounts = array('d')
+        self.units = ['']  # unit code -> canonical unit, '' for none
+        self.link_units = array('h')
+        self.unparsed = {}  # link position -> quantity as typed
+        self.ingredients = {}  # ingredient_id -> (name, unit_of_measure)
+        self._pools = {}
+
+    # load everything with three ordered scans
+
+    @classmethod
+    def load(cls, conn):
+        catalog = cls()
+        category_codes = {}
+        unit_codes = {'': 0}
+        for recipe_id, name, category, prep_time, cook_time, servings in conn.execute("""
+            SELECT Recipe.recipe_id, Recipe.name, Category.name, Recipe.prep_time, Recipe.cook_time, Recipe.servings
+            FROM Recipe
+            LEFT JOIN Category ON Recipe.category_id = Category.category_id
+            ORDER BY Recipe.recipe_id
+        """):
+            if category not in category_codes:
+                category_codes[category] = len(catalog.categories)
+                catalog.categories.append(category)
+            catalog.recipe_ids.append(recipe_id)
+            catalog.names.append(name)
+            catalog.category_codes.append(category_codes[category])
+            catalog.prep_times.append(_int(prep_time))
+            catalog.cook_times.append(_int(cook_time))
+            catalog.servings.append(_int(servings))
+
+        position = 0
+        count = len(catalog.recipe_ids)
+        for recipe_id, ingredient_id, quantity, amount, unit in conn.execute("""
+            SELECT recipe_id, ingredient_id, quantity, amount, unit
+            FROM RecipeIngredient
+            ORDER BY recipe_id
+        """):
+            # close the rows of recipes before this link; skip links of deleted recipes
+            while position < count and catalog.recipe_ids[position] < recipe_id:
+                catalog.offsets.append(len(catalog.link_ingredients))
+                position += 1
+            if position == count or catalog.recipe_ids[position] != recipe_id:
+                continue
+            unit = unit or ''
+            if unit not in unit_codes:
+                unit_codes[unit] = len(catalog.units)
+                catalog.units.append(unit)
+            if amount is None and quantity is not None:
+                catalog.unparsed[len(catalog.link_ingredients)] = quantity
+            catalog.link_ingredients.append(ingredient_id)
+            catalog.link_amounts.append(math.nan if amount is None else amount)
+            catalog.link_units.append(unit_codes[unit])
+        while position < count:
+            catalog.offsets.append(len(catalog.link_ingredients))
+            position += 1
+
+        catalog.ingredients = {ingredient_id: (name, unit_of_measure) for ingredient_id, name, unit_of_measure
+                               in conn.execute("SELECT ingredient_id, name, unit_of_measure FROM Ingredient")}
+        return catalog
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    # position of a recipe in the arrays, or None when it is not in the catalog
+
+    def position(self, recipe_id):
+        position = bisect_left(self.recipe_ids, recipe_id)
+        if position < len(self.recipe_ids) and self.recipe_ids[position] == recipe_id:
+            return position
+        return None
+
+    def _positions(self, recipe_ids):
+        positions = (self.position(recipe_id) for recipe_id in dict.fromkeys(recipe_ids))
+        return [position for position in positions if position is not None]
+
+    # recipes bucketed by category name: {category: [(recipe_id, name, category), ...]}
+    # built once per catalog and shared, so callers must not modify it
+
+    def recipe_pool(self, exclude=()):
+        key = tuple(sorted(exclude))
+        if key not in self._pools:
+            pool = {}
+            excluded = set(exclude)
+            for position, code in enumerate(self.category_codes):
+                category = self.categories[code]
+                if category is None or category in excluded:
+                    continue
+                pool.setdefault(category, []).append(
+                    (self.recipe_ids[position], self.names[position], category))
+            self._pools[key] = pool
+        return self._pools[key]
+
+    # recipe_id -> ingredient bitset for the given recipes; the most common ingredients
+    # get the lowest bits, which keeps typical bitsets short
+
+    def ingredient_bitsets(self, recipe_ids):
+        positions = self._positions(recipe_ids)
+        offsets, links = self.offsets, self.link_ingredients
+        frequency = Counter()
+        for position in positions:
+            frequency.update(links[offsets[position]:offsets[position + 1]])
+        bit = {ingredient_id: index for index,
+               (ingredient_id, _) in enumerate(frequency.most_common())}
+        return {self.recipe_ids[position]: reduce(
+            or_, (1 << bit[ingredient_id] for ingredient_id in links[offsets[position]:offsets[position + 1]]), 0)
+            for position in positions if offsets[position] < offsets[position + 1]}
+
+    # scale factor of each of the given recipe positions. servings is None to keep the
+    # recipes as written, a number of servings to scale every recipe to, or a dict of
+    # recipe_id -> servings (None keeps that recipe as written); recipes that do not say
+    # how many they serve are not scaled. times multiplies recipes cooked more than once
+
+    def scale_factors(self, positions, servings=None, times=None):
+        factors = []
+        for position in positions:
+            recipe_id = self.recipe_ids[position]
+            target = servings.get(recipe_id) if isinstance(servings, dict) else servings
+            written = self.servings[position]
+            factor = target / written if target is not None and written > 0 else 1.0
+            factors.append(factor * times.get(recipe_id, 1) if times else factor)
+        return factors
+
+    # sum the ingredients of the given recipes, like shopping.aggregate_ingredients:
+    # rows of (ingredient_id, name, unit_of_measure, unit, total_amount, unparsed_quantities)
+    # ordered by name and unit. servings and times scale the amounts (see scale_factors);
+    # quantities that could not be parsed are listed with their factor instead
+
+    def aggregate(self, recipe_ids, ingredient_ids=None, servings=None, times=None):
+        wanted = None if ingredient_ids is None else set(ingredient_ids)
+        positions = self._positions(recipe_ids)
+        totals = {}
+        for position, factor in zip(positions, self.scale_factors(positions, servings, times)):
+            for link in range(self.offsets[position], self.offsets[position + 1]):
+                ingredient_id = self.link_ingredients[link]
+                if wanted is not None and ingredient_id not in wanted:
+                    continue
+                key = (ingredient_id, self.units[self.link_units[link]])
+                total = totals.get(key)
+                if total is None:
+                    total = totals[key] = [None, []]
+                amount = self.link_amounts[link] * factor
+                if amount == amount:  # not NaN
+                    total[0] = amount if total[0] is None else total[0] + amount
+                elif link in self.unparsed:
+                    quantity = self.unparsed[link]
+                    total[1].append(quantity if factor == 1 else f"{quantity} (x{factor:.3g})")
+        rows = []
+        for (ingredient_id, unit), (amount, unparsed) in totals.items():
+            name, unit_of_measure = self.ingredients.get(ingredient_id, (None, None))
+            if name is None:
+                continue
+            rows.append((ingredient_id, name, unit_of_measure, unit, amount,
+                         ' + '.join(unparsed) if unparsed else None))
+        rows.sort(key=lambda row: (row[1], row[3]))
+        return rows
+
+
+class _Entry:
+    __slots__ = ('catalog', 'version', 'lock')
+
+    def __init__(self):
+        self.catalog = None
+        self.version = None  # recipe change counter the catalog was loaded at
+        self.lock = threading.Lock()
+
+
+_entries = {}
+
+
+def _key(conn):
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    return database or id(conn)
+
+# get the catalog for a connection's database, loading or reloading it when recipes
+# changed; connections to the same database file share one catalog
+
+
+def get_catalog(conn):
+    entry = _entries.setdefault(_key(conn), _Entry())
+    with entry.lock:
+        # read before loading, so a write committed during the load reloads it again
+        version = recipe_version(conn)
+        if entry.catalog is None or entry.version != version:
+            entry.catalog = RecipeCatalog.load(conn)
+            entry.version = version
+        return entry.catalog
@@ -0,0 +1,127 @@
+
+import json
+import sqlite3
+import threading
+import time
+
+from sqltrace import connection_factory
+from unitofwork import transaction
+
+# reclaim rows orphaned before deletes cascaded (schema version 6) and give freed pages
+# back to the file system
+#
+# the work is split into short transactions: one batch of orphans from one table, or a
+# few pages of incremental vacuum, so a cleanup running in the background never holds
+# the write lock for long
+
+# orphans removed per step
+BATCH_SIZE = 500
+# free pages returned per step
+VACUUM_PAGES = 256
+# seconds between steps, leaving room for other writers
+PAUSE = 0.05
+
+# (table, condition selecting its orphaned rows); every lookup hits a primary key
+ORPHANS = [
+    ('RecipeIngredient', "NOT EXISTS (SELECT 1 FROM Recipe WHERE Recipe.recipe_id = RecipeIngredient.recipe_id)"),
+    ('MealPlanRecipe', "NOT EXISTS (SELECT 1 FROM MealPlan WHERE MealPlan.plan_id = MealPlanRecipe.plan_id)"
+                       " OR NOT EXISTS (SELECT 1 FROM Recipe WHERE Recipe.recipe_id = MealPlanRecipe.recipe_id)"),
+    ('ShoppingListRecipe',
+     "NOT EXISTS (SELECT 1 FROM ShoppingList WHERE ShoppingList.list_id = ShoppingListRecipe.list_id)"
+     " OR NOT EXISTS (SELECT 1 FROM Recipe WHERE Recipe.recipe_id = ShoppingListRecipe.recipe_id)"),
+    ('ShoppingListItem',
+     "NOT EXISTS (SELECT 1 FROM ShoppingList WHERE ShoppingList.list_id = ShoppingListItem.list_id)"),
+]
+
+# shopping lists pointing at a deleted meal plan forget the plan, as ON DELETE SET NULL would
+DANGLING_PLANS = """
+    UPDATE ShoppingList SET plan_id = NULL
+    WHERE plan_id IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM MealPlan WHERE MealPlan.plan_id = ShoppingList.plan_id)
+"""
+
+
+# delete one batch of orphans from a table, walking it in rowid order from after
+# returns the rowids deleted, empty once the rest of the table is clean
+
+
+def delete_orphans(conn, table, condition, after=0, batch_size=BATCH_SIZE):
+    rowids = [row[0] for row in conn.execute(f"""
+        SELECT rowid FROM {table} WHERE rowid > ? AND ({condition}) ORDER BY rowid LIMIT ?
+    """, (after, batch_size))]
+    if rowids:
+        with transaction(conn) as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT value FROM json_each(?))",
+                           (json.dumps(rowids),))
+    return rowids
+
+# return up to pages free pages to the file system; a no-op unless the database uses
+# incremental auto-vacuum (see enable_incremental_vacuum). returns the pages freed
+
+
+def incremental_vacuum(conn, pages=VACUUM_PAGES):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if before:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+# switch an existing database to incremental auto-vacuum; this takes one full VACUUM,
+# which rewrites the whole file, so it is only done on request. new databases start
+# out incremental (see migrations.migrate)
+
+
+def enable_incremental_vacuum(conn):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+# one cleanup pass: orphans table by table, then dangling plan references, then free
+# pages, each in short transactions with a pause in between. returns the totals
+
+
+def run_cleanup(conn, batch_size=BATCH_SIZE, pages=VACUUM_PAGES, pause=PAUSE):
+    orphans = 0
+    for table, condition in ORPHANS:
+        after = 0
+        while True:
+            rowids = delete_orphans(conn, table, condition, after, batch_size)
+            if not rowids:
+                break
+            orphans += len(rowids)
+            after = rowids[-1]
+            time.sleep(pause)
+    with transaction(conn) as cursor:
+        orphans += cursor.execute(DANGLING_PLANS).rowcount
+
+    freed = 0
+    while True:
+        released = incremental_vacuum(conn, pages)
+        if not released:
+            break
+        freed += released
+        time.sleep(pause)
+    return {'orphans': orphans, 'pages': freed}
+
+# run one cleanup pass on its own connection in a daemon thread
+
+
+def start_background_cleanup(db_file, **options):
+    def run():
+        try:
+            conn = sqlite3.connect(db_file, timeout=30, factory=connection_factory())
+        except sqlite3.Error:
+            return
+        try:
+            run_cleanup(conn, **options)
+        except sqlite3.Error:
+            pass  # retried on the next start
+        finally:
+            conn.close()
+
+    thread = threading.Thread(target=run, name='cleanup', daemon=True)
+    thread.start()
+    return thread
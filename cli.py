@@ -0,0 +1,558 @@
+
+import argparse
+import inspect
+import json
+import os
+import random
+import sqlite3
+import sys
+from datetime import date
+
+from app import (DB_FILE, PAGE_SIZE, PLAN_PAGE_SIZE, connect_db, delete_meal_plans, delete_old_meal_plans,
+                 delete_recipes, delete_user_recipes, fetch_meal_plans, fetch_recipe_page, get_recipe_detail)
+from backup import PAGES, PAUSE, SNAPSHOT_DIR, backup_database, list_snapshots, restore_database, take_snapshot
+from cleanup import enable_incremental_vacuum, run_cleanup
+from concurrency import with_retry
+from ingredients import get_ingredient_index
+from mealplans import MEAL_TYPES, PLAN_DAYS, generate_meal_plans, planned_meals
+from pantry import MATCH_LIMIT, match_pantry
+from profiling import enable_profiling, run_action
+from recipecache import get_recipe_cache
+from search import search_recipes
+from shopping import (aggregate_ingredients, aggregate_meal_plans, format_item, load_shopping_list, plan_meals,
+                      save_plan_shopping_list, save_shopping_list)
+from similarity import SIMILAR_LIMIT, recommend_recipes, similar_recipes
+from sqltrace import get_tracer
+from unitofwork import RecipeEdit
+
+# non-interactive front end: the same operations as the menus, driven by flags or by
+# JSON lines on stdin, printing JSON instead of screens
+#
+#   python app.py recipes list --user-id 2
+#   python app.py meal-plans generate --all-users --optimize
+#   python app.py batch < commands.jsonl
+#
+# batch mode reads one {"id": ..., "command": "recipes.show", "args": {...}} object per
+# line and answers each with {"id": ..., "ok": true, "result": ...} or
+# {"id": ..., "ok": false, "error": ...}, all against one open connection
+
+
+class CommandError(Exception):
+    pass
+
+
+class NotFoundError(CommandError):
+    pass
+
+
+def _recipe_row(row):
+    recipe_id, name, prep_time, cook_time, servings, category, user = row
+    return {'recipe_id': recipe_id, 'name': name, 'prep_time': prep_time, 'cook_time': cook_time,
+            'servings': servings, 'category': category, 'user': user}
+
+
+def _shopping_item(row):
+    ingredient_id, name, unit_of_measure, unit, amount, unparsed = row
+    return {'ingredient_id': ingredient_id, 'name': name, 'unit_of_measure': unit_of_measure,
+            'unit': unit, 'amount': amount, 'unparsed': unparsed, 'text': format_item(row)}
+
+
+def _meal_plan(meal_plan):
+    return {str(day): {meal_type: {'recipe_id': recipe[0], 'name': recipe[1], 'category': recipe[2]}
+                  for meal_type, recipe in meals.items()}
+            for day, meals in meal_plan.items()}
+
+# look up a row id by its name column, accepting an id as is
+
+
+def _resolve(cursor, table, id_column, name_column, value):
+    if isinstance(value, int) or str(value).isdigit():
+        row = cursor.execute(
+            f"SELECT {id_column} FROM {table} WHERE {id_column} = ?", (int(value),)).fetchone()
+    else:
+        row = cursor.execute(
+            f"SELECT {id_column} FROM {table} WHERE {name_column} = ?", (value,)).fetchone()
+    if row is None:
+        raise CommandError(f"Unknown {table.lower()}: {value}")
+    return row[0]
+
+# make sure every id exists before anything referencing it is written, so a bad id is
+# reported as not found instead of failing a foreign key; returns the ids as ints
+
+
+def _existing(conn, table, id_column, ids):
+    ids = [int(value) for value in ids]
+    missing = [row[0] for row in conn.execute(f"""
+        SELECT value FROM json_each(?)
+        WHERE value NOT IN (SELECT {id_column} FROM {table})
+    """, (json.dumps(ids),))]
+    if missing:
+        raise NotFoundError(f"{table} not found: {', '.join(map(str, missing))}")
+    return ids
+
+
+def recipes_list(conn, user_id=None, after_id=None, limit=PAGE_SIZE):
+    return [_recipe_row(row) for row in fetch_recipe_page(conn, user_id, after_id=after_id, page_size=limit)]
+
+
+def recipes_search(conn, text, limit=20):
+    return [_recipe_row(row) for row in search_recipes(conn, text, limit)]
+
+
+def recipes_show(conn, recipe_id):
+    recipe = get_recipe_detail(conn, recipe_id)
+    if recipe is None:
+        raise NotFoundError(f"Recipe {recipe_id} not found.")
+    return recipe
+
+# recipes that can be cooked from the given ingredients (names or ids), with at most
+# max_missing ingredients to buy, best covered first
+
+
+def recipes_cook(conn, ingredients, max_missing=0, limit=MATCH_LIMIT):
+    if not isinstance(ingredients, list):
+        ingredients = [ingredients]
+    if not ingredients:
+        raise CommandError("No ingredients given.")
+    cursor = conn.cursor()
+    try:
+        ingredient_ids = [_resolve(cursor, 'Ingredient', 'ingredient_id', 'name', ingredient)
+                          for ingredient in ingredients]
+    finally:
+        cursor.close()
+    index = get_ingredient_index(conn)
+    return [{'recipe_id': recipe_id, 'name': name, 'matched': matched, 'total': total,
+             'coverage': matched / total,
+             'missing': [{'ingredient_id': ingredient_id, 'name': (index.get(ingredient_id) or (None, None))[1]}
+                         for ingredient_id in missing]}
+            for recipe_id, name, matched, total, missing
+            in match_pantry(conn, ingredient_ids, max_missing, limit)]
+
+
+def recipes_similar(conn, recipe_id, limit=SIMILAR_LIMIT):
+    if get_recipe_detail(conn, recipe_id) is None:
+        raise NotFoundError(f"Recipe {recipe_id} not found.")
+    return [{'recipe_id': neighbor_id, 'name': name, 'score': score}
+            for neighbor_id, name, score in similar_recipes(conn, recipe_id, limit)]
+
+
+def recipes_recommend(conn, user_id=1, limit=SIMILAR_LIMIT):
+    return [{'recipe_id': recipe_id, 'name': name, 'score': score}
+            for recipe_id, name, score in recommend_recipes(conn, user_id, limit)]
+
+# delete recipes by id, or every recipe of one user
+
+
+def recipes_delete(conn, recipe_ids=(), user_id=None):
+    if not recipe_ids and user_id is None:
+        raise CommandError("Give recipe ids or a user_id.")
+    deleted = delete_recipes(conn, recipe_ids) if recipe_ids else 0
+    if user_id is not None:
+        deleted += delete_user_recipes(conn, user_id)
+    return {'deleted': deleted}
+
+# add a recipe; category and user may be given by name or id, ingredients as
+# [{"name": ..., "quantity": ...}] and unknown ingredients are created
+
+
+def recipes_add(conn, name, category, user, prep_time=None, cook_time=None, servings=None,
+                instructions='', ingredients=()):
+    if not name:
+        raise CommandError("A recipe needs a name.")
+    cursor = conn.cursor()
+    try:
+        edit = RecipeEdit()
+        edit.update(name=name, prep_time=prep_time, cook_time=cook_time, servings=servings,
+                    instructions=instructions,
+                    category_id=_resolve(cursor, 'Category', 'category_id', 'name', category),
+                    user_id=_resolve(cursor, 'User', 'user_id', 'username', user))
+        created = {}
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict) or not ingredient.get('name'):
+                raise CommandError("Every ingredient needs a name.")
+            row = cursor.execute("SELECT ingredient_id, unit_of_measure FROM Ingredient WHERE name = ?",
+                                 (ingredient['name'],)).fetchone()
+            if row is not None:
+                edit.link(row[0], ingredient.get('quantity'), ingredient['name'], row[1])
+                continue
+            if ingredient['name'] not in created:
+                created[ingredient['name']] = edit.create_ingredient(
+                    ingredient['name'], ingredient.get('unit_of_measure'))
+            edit.link(created[ingredient['name']], ingredient.get('quantity'))
+    finally:
+        cursor.close()
+    return get_recipe_detail(conn, edit.commit(conn))
+
+# aggregate a shopping list from recipes, a meal plan or several meal plans, optionally
+# saving it; servings scales every recipe to that many servings, or is a
+# {recipe_id: servings} object
+
+
+def shopping_list(conn, recipe_ids=(), plan_id=None, plan_ids=None, save=False, name=None, user_id=1,
+                  servings=None):
+    if isinstance(servings, dict):
+        servings = {int(recipe_id): value for recipe_id, value in servings.items()}
+    if plan_ids:
+        if save:
+            raise CommandError("Lists of several meal plans cannot be saved.")
+        return {'list_id': None,
+                'items': [_shopping_item(row) for row in aggregate_meal_plans(conn, plan_ids, servings)]}
+    if plan_id is not None:
+        if save:
+            list_id = save_plan_shopping_list(conn, plan_id, servings)
+            if list_id is None:
+                raise NotFoundError(f"Meal plan {plan_id} not found.")
+            return {'list_id': list_id, 'items': [_shopping_item(row) for row in load_shopping_list(conn, list_id)]}
+        meals = plan_meals(conn, [plan_id])
+        if not meals:
+            raise CommandError("No recipes selected.")
+        return {'list_id': None, 'items': [_shopping_item(row) for row in aggregate_ingredients(
+            conn, meals, servings=servings, times=meals)]}
+    if not recipe_ids:
+        raise CommandError("No recipes selected.")
+    recipe_ids = _existing(conn, 'Recipe', 'recipe_id', recipe_ids)
+    if save:
+        _existing(conn, 'User', 'user_id', [user_id])
+        list_id = save_shopping_list(conn, user_id, recipe_ids, name, servings=servings)
+        return {'list_id': list_id, 'items': [_shopping_item(row) for row in load_shopping_list(conn, list_id)]}
+    return {'list_id': None,
+            'items': [_shopping_item(row) for row in aggregate_ingredients(conn, recipe_ids, servings=servings)]}
+
+
+# dates arrive as YYYY-MM-DD text from the command line, JSON and query strings
+
+
+def _date(value):
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Invalid date: {value}")
+    return value
+
+
+def meal_plans_generate(conn, user_ids=None, all_users=False, optimize=False, start_date=None, seed=None,
+                        days=PLAN_DAYS, time_limit=None):
+    if not all_users and not user_ids:
+        user_ids = [1]
+    rng = random.Random(seed) if seed is not None else None
+    if not all_users:
+        user_ids = _existing(conn, 'User', 'user_id', user_ids)
+    try:
+        plans = generate_meal_plans(conn, None if all_users else list(user_ids), start_date=_date(start_date),
+                                    rng=rng, keep_plans=not all_users, optimize=optimize, days=days,
+                                    time_limit=time_limit)
+    except ValueError as e:
+        raise CommandError(str(e))
+    if all_users:
+        return {'count': plans}
+    return [{'plan_id': plan_id, 'user_id': user_id, 'meals': _meal_plan(meal_plan)}
+            for plan_id, user_id, meal_plan in plans]
+
+
+def meal_plans_list(conn, user_id=None, date_from=None, date_to=None, before_created_at=None,
+                    before_plan_id=None, limit=PLAN_PAGE_SIZE):
+    before = None
+    if before_created_at is not None and before_plan_id is not None:
+        before = (before_created_at, before_plan_id)
+    return [{'plan_id': plan_id, 'start_date': start_date, 'end_date': end_date, 'created_at': created_at,
+             'recipes': [{'name': name, 'category': category} for name, category in recipes]}
+            for plan_id, start_date, end_date, created_at, recipes
+            in fetch_meal_plans(conn, user_id, _date(date_from), _date(date_to), before, limit)]
+
+# the meals a user has planned on a date or over a date range, optionally one meal type
+
+
+def meal_plans_calendar(conn, date_from, date_to=None, user_id=1, meal_type=None):
+    return [{'date': day, 'meal_type': meal, 'recipe_id': recipe_id, 'name': name, 'plan_id': plan_id}
+            for day, meal, recipe_id, name, plan_id
+            in planned_meals(conn, user_id, _date(date_from), _date(date_to), meal_type)]
+
+
+# delete plans by id, or every plan older than older_than_days (of one user, if given)
+
+
+def meal_plans_delete(conn, plan_ids=(), older_than_days=None, user_id=None):
+    if not plan_ids and older_than_days is None:
+        raise CommandError("Give plan ids or older_than_days.")
+    deleted = delete_meal_plans(conn, plan_ids) if plan_ids else 0
+    if older_than_days is not None:
+        deleted += delete_old_meal_plans(conn, older_than_days, user_id)
+    return {'deleted': deleted}
+
+
+# remove rows orphaned before deletes cascaded and free unused pages; full_vacuum first
+# switches an existing database to incremental auto-vacuum, rewriting the whole file
+
+
+def cleanup(conn, full_vacuum=False):
+    vacuumed = enable_incremental_vacuum(conn) if full_vacuum else False
+    return dict(run_cleanup(conn), vacuumed=vacuumed)
+
+
+# online copies of the database (see backup.py)
+
+
+def backup(conn, path, pages=PAGES, pause=PAUSE):
+    return {'path': path, 'size': backup_database(conn, path, pages, pause)}
+
+
+def snapshot(conn, directory=SNAPSHOT_DIR, pages=PAGES, pause=PAUSE):
+    path = take_snapshot(conn, directory, pages, pause)
+    return {'path': path, 'size': os.path.getsize(path)}
+
+
+def snapshots(conn, directory=SNAPSHOT_DIR):
+    return [{'path': path, 'taken_at': taken_at, 'size': size}
+            for path, taken_at, size in list_snapshots(directory)]
+
+
+def restore(conn, snapshot, pages=PAGES, pause=PAUSE, keep_current=True, directory=SNAPSHOT_DIR):
+    try:
+        previous = restore_database(conn, snapshot, pages, pause, keep_current=keep_current, directory=directory)
+    except FileNotFoundError as e:
+        raise NotFoundError(str(e))
+    return {'restored': snapshot, 'previous': previous}
+
+
+def cache_stats(conn):
+    return get_recipe_cache(conn).stats()
+
+# statements recorded so far by SQL tracing (RECIPE_SQL_TRACE), the most expensive first
+
+
+def trace_summary(conn, limit=20):
+    return get_tracer().summary(limit)
+
+
+COMMANDS = {
+    'recipes.list': recipes_list,
+    'recipes.search': recipes_search,
+    'recipes.show': recipes_show,
+    'recipes.add': recipes_add,
+    'recipes.delete': recipes_delete,
+    'recipes.cook': recipes_cook,
+    'recipes.similar': recipes_similar,
+    'recipes.recommend': recipes_recommend,
+    'shopping-list': shopping_list,
+    'meal-plans.generate': meal_plans_generate,
+    'meal-plans.list': meal_plans_list,
+    'meal-plans.calendar': meal_plans_calendar,
+    'meal-plans.delete': meal_plans_delete,
+    'cleanup': cleanup,
+    'backup': backup,
+    'snapshot': snapshot,
+    'snapshots': snapshots,
+    'restore': restore,
+    'cache.stats': cache_stats,
+    'trace.summary': trace_summary,
+}
+
+# raise CommandError unless a command takes args; checked before it runs, so a
+# TypeError from inside a command stays a bug instead of reading as a usage mistake
+
+
+def check_arguments(command, args):
+    try:
+        inspect.signature(COMMANDS[command]).bind(None, **args)
+    except TypeError as e:
+        raise CommandError(f"Invalid arguments for {command}: {e}")
+
+# run one command, turning expected failures into an error message
+# a command is retried as a whole while another session keeps the database busy
+
+
+def run_command(conn, command, args):
+    if command not in COMMANDS:
+        raise CommandError(f"Unknown command: {command}")
+    check_arguments(command, args)
+    return run_action(command, with_retry, COMMANDS[command], conn, **args)
+
+# answer JSON lines from stdin against one connection; returns the number of failed commands
+
+
+def run_batch(conn, stream, out):
+    failures = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            result = run_command(conn, request['command'], request.get('args') or {})
+            response = {'id': request_id, 'ok': True, 'result': result}
+        except (CommandError, sqlite3.Error, ValueError, KeyError) as e:
+            failures += 1
+            response = {'id': request_id, 'ok': False, 'error': str(e)}
+        out.write(json.dumps(response, default=str) + "\n")
+        out.flush()
+    return failures
+
+# "Name=quantity" or "Name=quantity:unit of measure" from the command line
+
+
+def _ingredient_arg(value):
+    name, _, quantity = value.partition('=')
+    quantity, _, unit_of_measure = quantity.partition(':')
+    return {'name': name.strip(), 'quantity': quantity.strip() or None,
+            'unit_of_measure': unit_of_measure.strip() or None}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Run recipe, shopping list and meal plan commands without the menus, printing JSON.")
+    parser.add_argument('--db', default=DB_FILE, help="database file")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="write a cProfile/tracemalloc report of every command to DIR")
+    groups = parser.add_subparsers(dest='group', required=True)
+
+    recipes = groups.add_parser('recipes', help="list, search, show, add, delete and match recipes")
+    recipe_commands = recipes.add_subparsers(dest='action', required=True)
+    command = recipe_commands.add_parser('list')
+    command.set_defaults(command='recipes.list')
+    command.add_argument('--user-id', type=int)
+    command.add_argument('--after-id', type=int)
+    command.add_argument('--limit', type=int, default=PAGE_SIZE)
+    command = recipe_commands.add_parser('search')
+    command.set_defaults(command='recipes.search')
+    command.add_argument('text')
+    command.add_argument('--limit', type=int, default=20)
+    command = recipe_commands.add_parser('show')
+    command.set_defaults(command='recipes.show')
+    command.add_argument('recipe_id', type=int)
+    command = recipe_commands.add_parser('add')
+    command.set_defaults(command='recipes.add')
+    command.add_argument('--name', required=True)
+    command.add_argument('--category', required=True, help="category name or id")
+    command.add_argument('--user', required=True, help="username or user id")
+    command.add_argument('--prep-time', type=int)
+    command.add_argument('--cook-time', type=int)
+    command.add_argument('--servings', type=int)
+    command.add_argument('--instructions', default='')
+    command.add_argument('--ingredient', dest='ingredients', action='append', type=_ingredient_arg,
+                         default=[], help="NAME=QUANTITY[:UNIT], repeatable")
+    command = recipe_commands.add_parser('delete')
+    command.set_defaults(command='recipes.delete')
+    command.add_argument('recipe_ids', type=int, nargs='*')
+    command.add_argument('--user-id', type=int, help="delete every recipe of this user")
+
+    command = recipe_commands.add_parser('cook', help="recipes you can make from the ingredients you have")
+    command.set_defaults(command='recipes.cook')
+    command.add_argument('ingredients', nargs='+', help="ingredient names or ids")
+    command.add_argument('--max-missing', type=int, default=0,
+                         help="also list recipes missing up to this many ingredients")
+    command.add_argument('--limit', type=int, default=MATCH_LIMIT)
+
+    command = recipe_commands.add_parser('similar', help="recipes sharing the most ingredients with one")
+    command.set_defaults(command='recipes.similar')
+    command.add_argument('recipe_id', type=int)
+    command.add_argument('--limit', type=int, default=SIMILAR_LIMIT)
+    command = recipe_commands.add_parser('recommend', help="recipes like those in a user's recent meal plans")
+    command.set_defaults(command='recipes.recommend')
+    command.add_argument('--user-id', type=int, default=1)
+    command.add_argument('--limit', type=int, default=SIMILAR_LIMIT)
+
+    command = groups.add_parser('shopping-list', help="aggregate a shopping list")
+    command.set_defaults(command='shopping-list')
+    source = command.add_mutually_exclusive_group(required=True)
+    source.add_argument('--recipe-id', dest='recipe_ids', type=int, action='append')
+    source.add_argument('--plan-id', type=int)
+    source.add_argument('--plans', dest='plan_ids', type=int, nargs='+', metavar='PLAN_ID',
+                        help="several meal plans, e.g. the weeks of a month")
+    command.add_argument('--servings', type=int, help="scale every recipe to this many servings")
+    command.add_argument('--save', action='store_true')
+    command.add_argument('--name')
+    command.add_argument('--user-id', type=int, default=1)
+
+    plans = groups.add_parser('meal-plans', help="generate, list, look up and delete meal plans")
+    plan_commands = plans.add_subparsers(dest='action', required=True)
+    command = plan_commands.add_parser('generate')
+    command.set_defaults(command='meal-plans.generate')
+    command.add_argument('--user-id', dest='user_ids', type=int, action='append')
+    command.add_argument('--all-users', action='store_true')
+    command.add_argument('--optimize', action='store_true')
+    command.add_argument('--time-limit', type=float, metavar='SECONDS',
+                         help="cap on the time spent optimizing the whole run")
+    command.add_argument('--start-date')
+    command.add_argument('--days', type=int, default=PLAN_DAYS, help="plan length in days")
+    command.add_argument('--seed', type=int)
+    command = plan_commands.add_parser('list')
+    command.set_defaults(command='meal-plans.list')
+    command.add_argument('--user-id', type=int)
+    command.add_argument('--from', dest='date_from')
+    command.add_argument('--to', dest='date_to')
+    command.add_argument('--before-created-at')
+    command.add_argument('--before-plan-id', type=int)
+    command.add_argument('--limit', type=int, default=PLAN_PAGE_SIZE)
+    command = plan_commands.add_parser('calendar', help="meals planned on a date or date range")
+    command.set_defaults(command='meal-plans.calendar')
+    command.add_argument('date_from', metavar='DATE')
+    command.add_argument('--to', dest='date_to')
+    command.add_argument('--user-id', type=int, default=1)
+    command.add_argument('--meal-type', choices=MEAL_TYPES)
+    command = plan_commands.add_parser('delete')
+    command.set_defaults(command='meal-plans.delete')
+    command.add_argument('plan_ids', type=int, nargs='*')
+    command.add_argument('--older-than', dest='older_than_days', type=int, metavar='DAYS',
+                         help="delete plans created more than DAYS days ago")
+    command.add_argument('--user-id', type=int, help="with --older-than, only this user's plans")
+
+    command = groups.add_parser('cleanup', help="remove orphaned rows and free unused pages")
+    command.set_defaults(command='cleanup')
+    command.add_argument('--full-vacuum', action='store_true',
+                         help="switch to incremental auto-vacuum first (one full VACUUM)")
+
+    command = groups.add_parser('backup', help="copy the database to a file while it stays in use")
+    command.set_defaults(command='backup')
+    command.add_argument('path')
+    command = groups.add_parser('snapshot', help="back up into a new time-stamped file")
+    command.set_defaults(command='snapshot')
+    command.add_argument('--dir', dest='directory', default=SNAPSHOT_DIR)
+    command = groups.add_parser('snapshots', help="list the snapshots taken")
+    command.set_defaults(command='snapshots')
+    command.add_argument('--dir', dest='directory', default=SNAPSHOT_DIR)
+    command = groups.add_parser('restore', help="replace the database with a snapshot or backup file")
+    command.set_defaults(command='restore')
+    command.add_argument('snapshot')
+    command.add_argument('--dir', dest='directory', default=SNAPSHOT_DIR,
+                         help="where the snapshot of the replaced database goes")
+    command.add_argument('--no-keep-current', dest='keep_current', action='store_false',
+                         help="do not snapshot the database being replaced first")
+    for name in ('backup', 'snapshot', 'restore'):
+        copying = groups.choices[name]
+        copying.add_argument('--pages', type=int, default=PAGES, help="pages copied per step")
+        copying.add_argument('--pause', type=float, default=PAUSE, help="seconds between steps")
+
+    command = groups.add_parser('batch', help="read JSON command lines from stdin")
+    command.set_defaults(command='batch')
+    return parser
+
+
+def main(argv=None):
+    args = vars(build_parser().parse_args(argv))
+    profile = args.pop('profile')
+    if profile:
+        enable_profiling(profile)
+    conn = connect_db(args.pop('db'))
+    if not conn:
+        return 1
+    command = args.pop('command')
+    args.pop('group')
+    args.pop('action', None)
+    try:
+        if command == 'batch':
+            return 1 if run_batch(conn, sys.stdin, sys.stdout) else 0
+        try:
+            result = run_command(conn, command, args)
+        except (CommandError, sqlite3.Error, ValueError) as e:
+            print(json.dumps({'ok': False, 'error': str(e)}))
+            return 1
+        print(json.dumps(result, default=str))
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from queue import SimpleQueue
+
+# several sessions on one database file
+#
+# connections run in WAL mode, so readers never block the writer or each other and a
+# reader sees the last commit made before its read began. every connection waits up
+# to BUSY_TIMEOUT for a lock, and a transaction that still finds the database busy
+# (another process holds the write lock for longer, or a read snapshot went stale
+# before it could write) is retried as a whole with jittered exponential backoff
+#
+# inside one process, a WriteQueue serializes writes from many threads on a single
+# connection, so they never contend for the lock with each other at all
+
+# seconds a connection waits for a lock before failing with "database is locked"
+BUSY_TIMEOUT = 5.0
+# page cache per connection, in KiB
+CACHE_SIZE_KIB = 64 * 1024
+# bytes of the file mapped into memory for reads
+MMAP_SIZE = 256 * 1024 * 1024
+# attempts of a busy transaction, and the first backoff in seconds (doubled each time)
+RETRIES = 5
+BACKOFF = 0.05
+
+# switch a connection to WAL and tune it for concurrent use; WAL is a property of the
+# file and sticks once set, the other pragmas are per connection
+# synchronous NORMAL only syncs at checkpoints: a power cut can lose the last commits
+# but never corrupts the database
+
+
+def configure(conn, read_only=False):
+    conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+    if not read_only:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    return conn
+
+# whether an error means another connection held a lock, so trying again can succeed
+
+
+def is_busy(error):
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        # SQLITE_BUSY and SQLITE_LOCKED, with their extended codes
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+# call function(conn, *args, **kwargs), running it again while the database is busy
+# function must be one whole transaction: it is rolled back before every retry
+
+
+def with_retry(function, conn, *args, retries=RETRIES, backoff=BACKOFF, **kwargs):
+    for attempt in range(retries):
+        try:
+            return function(conn, *args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy(e) or attempt == retries - 1:
+                raise
+            if conn.in_transaction:
+                conn.rollback()
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+# a single writer thread with its own connection; submit(function, *args) queues
+# function(conn, *args) and returns a Future of its result. jobs run one at a time in
+# submission order, each retried when another process keeps the database busy
+
+
+class WriteQueue:
+    def __init__(self, connect, name='writer'):
+        self._jobs = SimpleQueue()
+        self._ready = Future()
+        self._thread = threading.Thread(target=self._run, args=(connect,), name=name, daemon=True)
+        self._thread.start()
+        # surfaces a failure to open the connection here instead of on the first write
+        self._ready.result()
+
+    def _run(self, connect):
+        try:
+            conn = connect()
+        except BaseException as e:
+            self._ready.set_exception(e)
+            return
+        self._ready.set_result(None)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+                future, function, args, kwargs = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(with_retry(function, conn, *args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            conn.close()
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        self._jobs.put((future, function, args, kwargs))
+        return future
+
+    # run function(conn, *args) on the writer and wait for its result
+
+    def call(self, function, *args, **kwargs):
+        return self.submit(function, *args, **kwargs).result()
+
+    # finish the queued jobs, then close the connection
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
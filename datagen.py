@@ -0,0 +1,147 @@
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from mealplans import generate_meal_plans
+from search import LINK_TRIGGERS, rebuild_search_index, restore_triggers, suspend_triggers
+from units import parse_quantity
+from unitofwork import transaction
+
+# deterministic synthetic data for load testing: the same seed and sizes always
+# produce the same database
+#
+#   python datagen.py bench.sqlite3 --recipes 50000 --users 1000 --seed 7
+#
+# recipes get a skewed number of ingredients and ingredients a skewed popularity,
+# so a few staples appear everywhere like in real recipe collections
+
+# creation time of every generated row, so timestamps do not depend on when the generator ran
+CREATED_AT = datetime(2024, 1, 1)
+
+MEAL_CATEGORIES = ['Breakfast', 'Lunch', 'Dinner', 'Appetizer', 'Dessert']
+
+ADJECTIVES = ['Roasted', 'Fresh', 'Smoked', 'Spicy', 'Sweet', 'Crispy', 'Creamy', 'Grilled',
+              'Baked', 'Wild', 'Golden', 'Tangy', 'Savory', 'Honey', 'Garlic', 'Lemon']
+FOODS = ['Chicken', 'Rice', 'Tomato', 'Onion', 'Potato', 'Carrot', 'Beef', 'Salmon', 'Tofu',
+         'Spinach', 'Mushroom', 'Pepper', 'Bean', 'Lentil', 'Pasta', 'Cheese', 'Egg', 'Apple',
+         'Oat', 'Corn', 'Basil', 'Ginger', 'Yogurt', 'Butter', 'Flour', 'Sugar', 'Milk', 'Bread']
+DISHES = ['Soup', 'Salad', 'Stew', 'Bowl', 'Curry', 'Bake', 'Stir Fry', 'Tart', 'Wrap',
+          'Skillet', 'Pie', 'Risotto', 'Tacos', 'Pancakes', 'Casserole', 'Sandwich']
+UNITS = [('g', ['100 g', '250g', '1 kg', '2 oz', '1/2 lb']),
+         ('ml', ['200 ml', '1 cup', '2 tbsp', '1 1/2 tsp', '1 l']),
+         ('pieces', ['1', '2', '3 pieces', '½']),
+         ('slices', ['2 slices', '4']),
+         ('pinch', ['a pinch', 'to taste', '1 pinch'])]
+
+# distinct names from a word list, numbered once the combinations run out
+
+
+def _names(rng, count, *words):
+    names = []
+    seen = set()
+    while len(names) < count:
+        name = " ".join(rng.choice(word_list) for word_list in words)
+        if name in seen:
+            name = f"{name} {len(names) + 1}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def generate(conn, users=100, categories=5, ingredients=500, recipes=5000, max_ingredients=15,
+             plans_per_user=2, seed=0):
+    rng = random.Random(seed)
+    category_names = MEAL_CATEGORIES[:categories] + [
+        f"Category {number}" for number in range(len(MEAL_CATEGORIES) + 1, categories + 1)]
+    ingredient_rows = []
+    for ingredient_id, name in enumerate(_names(rng, ingredients, ADJECTIVES, FOODS), start=1):
+        unit_of_measure, quantities = rng.choice(UNITS)
+        ingredient_rows.append((ingredient_id, name, unit_of_measure, quantities))
+    # popularity follows 1/rank, so low ids are the staples
+    weights = [1 / rank for rank in range(1, ingredients + 1)]
+
+    with transaction(conn) as cursor:
+        suspended = suspend_triggers(cursor, ('recipe_search_insert',) + LINK_TRIGGERS)
+        cursor.executemany("""
+            INSERT INTO User (user_id, username, email, password, created_at) VALUES (?, ?, ?, ?, ?)
+        """, [(user_id, f"user{user_id}", f"user{user_id}@example.com", 'password', CREATED_AT)
+              for user_id in range(1, users + 1)])
+        cursor.executemany("INSERT INTO Category (category_id, name, created_at) VALUES (?, ?, ?)",
+                           [(category_id, name, CREATED_AT)
+                            for category_id, name in enumerate(category_names, start=1)])
+        cursor.executemany("INSERT INTO Ingredient (ingredient_id, name, unit_of_measure) VALUES (?, ?, ?)",
+                           [row[:3] for row in ingredient_rows])
+
+        recipe_names = _names(rng, recipes, ADJECTIVES, FOODS, DISHES)
+        recipe_rows = []
+        links = []
+        for recipe_id, name in enumerate(recipe_names, start=1):
+            recipe_rows.append((recipe_id, name, f"Prepare the {name.lower()} and serve.",
+                                rng.randint(5, 60), rng.randint(0, 120), rng.randint(1, 8),
+                                rng.randint(1, categories), rng.randint(1, users), CREATED_AT))
+            count = min(ingredients, max(1, int(rng.paretovariate(1.5) * 3)), max_ingredients)
+            chosen = set()
+            while len(chosen) < count:
+                chosen.add(rng.choices(range(ingredients), weights)[0])
+            for index in chosen:
+                ingredient_id, _, unit_of_measure, quantities = ingredient_rows[index]
+                quantity = rng.choice(quantities)
+                amount, unit = parse_quantity(quantity, unit_of_measure)
+                links.append((recipe_id, ingredient_id, quantity, amount, unit))
+        cursor.executemany("""
+            INSERT INTO Recipe (recipe_id, name, instructions, prep_time, cook_time, servings, category_id,
+                                user_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, recipe_rows)
+        cursor.executemany("""
+            INSERT INTO RecipeIngredient (recipe_id, ingredient_id, quantity, amount, unit)
+            VALUES (?, ?, ?, ?, ?)
+        """, links)
+        restore_triggers(cursor, suspended)
+    rebuild_search_index(conn)
+
+    if categories >= 3 and plans_per_user:
+        for week in range(plans_per_user):
+            week_start = CREATED_AT + timedelta(weeks=week)
+            generate_meal_plans(conn, start_date=week_start.date(), rng=rng, created_at=week_start)
+    return {'users': users, 'categories': categories, 'ingredients': ingredients,
+            'recipes': recipes, 'links': len(links), 'plans': users * plans_per_user if categories >= 3 else 0}
+
+
+def main(argv=None):
+    from app import connect_db
+
+    parser = argparse.ArgumentParser(description="Create a database filled with seeded synthetic data.")
+    parser.add_argument('path', help="database file to create")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--ingredients', type=int, default=500)
+    parser.add_argument('--recipes', type=int, default=5000)
+    parser.add_argument('--max-ingredients', type=int, default=15, help="most ingredients per recipe")
+    parser.add_argument('--plans-per-user', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true', help="replace an existing file")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.path):
+        if not args.force:
+            print(f"{args.path} already exists; use --force to replace it.", file=sys.stderr)
+            return 1
+        os.remove(args.path)
+    conn = connect_db(args.path)
+    if not conn:
+        return 1
+    try:
+        counts = generate(conn, args.users, args.categories, args.ingredients, args.recipes,
+                          args.max_ingredients, args.plans_per_user, args.seed)
+    finally:
+        conn.close()
+    print(", ".join(f"{count} {name}" for name, count in counts.items()), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+
+import bisect
+import threading
+
+# in-memory prefix index over ingredient names for the typeahead picker
+# every name is indexed once in full and once from the start of each later word,
+# so "chip" finds "Chocolate Chips" as well as "Chipotle"
+#
+# ingredients are only ever added, so the highest ingredient_id tells whether the table
+# changed: on its next use the index reads the ingredients added since, in this or any
+# other process. a highest id below the one the index saw (a restored or rebuilt
+# table) reloads it
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._keys = []  # sorted (key, ingredient_id)
+        self._ingredients = {}  # ingredient_id -> (ingredient_id, name, unit_of_measure)
+        self._lock = threading.Lock()
+        self.last_id = 0  # highest ingredient_id read from the table
+
+    # build the index with one pass over the Ingredient table
+
+    @classmethod
+    def load(cls, conn):
+        index = cls()
+        index.update(conn)
+        return index
+
+    def __len__(self):
+        return len(self._ingredients)
+
+    # read the ingredients added to the table since the last read
+
+    def update(self, conn):
+        rows = conn.execute("""
+            SELECT ingredient_id, name, unit_of_measure FROM Ingredient
+            WHERE ingredient_id > ? ORDER BY ingredient_id
+        """, (self.last_id,)).fetchall()
+        with self._lock:
+            for ingredient_id, name, unit_of_measure in rows:
+                if ingredient_id not in self._ingredients:
+                    self._ingredients[ingredient_id] = (
+                        ingredient_id, name, unit_of_measure)
+                    self._keys.extend((key, ingredient_id) for key in _index_keys(name))
+            self._keys.sort()
+            if rows:
+                self.last_id = rows[-1][0]
+
+    # add a newly created ingredient without reloading the table
+
+    def add(self, ingredient_id, name, unit_of_measure):
+        with self._lock:
+            if ingredient_id in self._ingredients:
+                return
+            self._ingredients[ingredient_id] = (
+                ingredient_id, name, unit_of_measure)
+            for key in _index_keys(name):
+                bisect.insort(self._keys, (key, ingredient_id))
+
+    def get(self, ingredient_id):
+        return self._ingredients.get(ingredient_id)
+
+    # return up to limit ingredients whose name (or a word in it) starts with text
+    # whole-name matches come before word matches; an empty text lists names alphabetically
+
+    def search(self, text, limit=10):
+        prefix = " ".join(text.lower().split())
+        with self._lock:
+            return self._search(prefix, limit)
+
+    def _search(self, prefix, limit):
+        full_matches = []
+        word_matches = []
+        seen = set()
+        position = bisect.bisect_left(self._keys, (prefix,))
+        while position < len(self._keys) and len(full_matches) < limit:
+            key, ingredient_id = self._keys[position]
+            if not key.startswith(prefix):
+                break
+            position += 1
+            if ingredient_id in seen:
+                continue
+            ingredient = self._ingredients[ingredient_id]
+            if ingredient[1].lower().startswith(prefix):
+                seen.add(ingredient_id)
+                full_matches.append(ingredient)
+            elif len(word_matches) < limit:
+                seen.add(ingredient_id)
+                word_matches.append(ingredient)
+        return (full_matches + word_matches)[:limit]
+
+
+# the index keys for a name: the whole name, then the name from each later word onwards
+
+
+def _index_keys(name):
+    words = name.lower().split()
+    return {" ".join(words[start:]) for start in range(len(words))}
+
+
+class _Entry:
+    __slots__ = ('index', 'lock')
+
+    def __init__(self):
+        self.index = None
+        self.lock = threading.Lock()
+
+
+_entries = {}
+
+
+def _key(conn):
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    return database or id(conn)
+
+# get the shared ingredient index for a connection's database, building it on first use
+# and reading the ingredients added since; connections to the same database file share
+# one index
+
+
+def get_ingredient_index(conn):
+    entry = _entries.setdefault(_key(conn), _Entry())
+    with entry.lock:
+        last_id = conn.execute("SELECT COALESCE(MAX(ingredient_id), 0) FROM Ingredient").fetchone()[0]
+        index = entry.index
+        if index is None or last_id < index.last_id:
+            index = entry.index = IngredientIndex.load(conn)
+        elif last_id > index.last_id:
+            index.update(conn)
+    return index
+
+# drop the cached index after bulk changes to the Ingredient table; it is rebuilt on next use
+
+
+def reset_ingredient_index(conn):
+    _entries.pop(_key(conn), None)
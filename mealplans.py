@@ -0,0 +1,203 @@
+
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from catalog import get_catalog
+from planner import TIME_LIMIT, build_optimized_plan, index_candidates, load_ingredient_bitsets
+from unitofwork import transaction
+
+# meal plan generation for one user or many users at once, a week or longer
+# the recipe pool is loaded and bucketed by category once per run, and all plans
+# of a run are written in a single transaction with chunked executemany calls
+#
+# every planned meal is a MealPlanSlot row keyed by (plan_id, date, meal_type), so a
+# recipe can come back on another day and calendar lookups are primary key ranges;
+# MealPlanRecipe keeps the set of recipes per plan for history, recommendations and
+# shopping lists
+
+# days planned (and optimized) together
+WEEK = 7
+MEAL_TYPES = ['Breakfast', 'Lunch', 'Dinner']
+
+# default plan length in days, and the longest plan; the limit bounds how far back a
+# calendar lookup has to search for plans still running
+PLAN_DAYS = 7
+MAX_PLAN_DAYS = 366
+
+# created_at is stored as UTC text, the format of CURRENT_TIMESTAMP
+TIMESTAMP = '%Y-%m-%d %H:%M:%S'
+
+# users per executemany batch for week-long plans, fewer for longer ones; bounds
+# memory when planning for every user
+CHUNK_SIZE = 5000
+
+# categories that are never planned
+EXCLUDED_CATEGORIES = ('Appetizer', 'Dessert')
+
+# the recipes eligible for planning, bucketed by category name, from the recipe catalog
+# returns {category: [(recipe_id, name, category), ...]}; the lists are shared, do not modify them
+
+
+def load_recipe_pool(conn):
+    return get_catalog(conn).recipe_pool(EXCLUDED_CATEGORIES)
+
+# categories without any recipe, which make planning impossible
+
+
+def missing_categories(categorized_recipes):
+    return [category for category in MEAL_TYPES if not categorized_recipes.get(category)]
+
+# draw count recipes without repeats until the pool runs out, then start a new shuffled round
+
+
+def _draw(recipes, count, rng):
+    drawn = []
+    while len(drawn) < count:
+        drawn.extend(rng.sample(recipes, min(len(recipes), count - len(drawn))))
+    return drawn
+
+# build one week of meals for the given dates: {date: {meal_type: (recipe_id, name, category)}}
+# with ingredient bitsets the week is optimized for the fewest distinct ingredients
+# (improving it until deadline at the latest, from the planner.index_candidates of a
+# run when given), otherwise recipes are drawn at random
+
+
+def build_week_plan(categorized_recipes, days, rng=random, bitsets=None, deadline=None, candidates=None):
+    if bitsets is not None:
+        return build_optimized_plan(categorized_recipes, bitsets, days, MEAL_TYPES, rng, deadline=deadline,
+                                    candidates=candidates)
+    picks = {meal_type: _draw(categorized_recipes[meal_type], len(days), rng)
+             for meal_type in MEAL_TYPES}
+    return {day: {meal_type: picks[meal_type][idx] for meal_type in MEAL_TYPES}
+            for idx, day in enumerate(days)}
+
+# build meals for every date from start_date on: {date: {meal_type: recipe}}
+# longer plans are built a week at a time, so optimizing stays linear in the length;
+# the weeks share one deadline, TIME_LIMIT from now unless the caller gives one
+
+
+def build_plan(categorized_recipes, start_date, days=PLAN_DAYS, rng=random, bitsets=None, deadline=None,
+               candidates=None):
+    if bitsets is not None:
+        if deadline is None:
+            deadline = time.perf_counter() + TIME_LIMIT
+        if candidates is None:
+            candidates = index_candidates(categorized_recipes, bitsets, MEAL_TYPES)
+    dates = [start_date + timedelta(days=offset) for offset in range(days)]
+    meal_plan = {}
+    for week in range(0, days, WEEK):
+        meal_plan.update(build_week_plan(categorized_recipes, dates[week:week + WEEK], rng, bitsets,
+                                         deadline, candidates))
+    return meal_plan
+
+# first free plan_id, so plans can be inserted with explicit ids through executemany
+
+
+def _next_plan_id(cursor):
+    row = cursor.execute("""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'MealPlan'), 0),
+                   COALESCE((SELECT MAX(plan_id) FROM MealPlan), 0))
+    """).fetchone()
+    return row[0] + 1
+
+# generate and save a plan of days days for each user (every User when user_ids is None)
+# optimize picks each week to need as few distinct ingredients as possible; time_limit
+# caps the seconds spent improving plans over the whole run (by default every plan may
+# take up to planner.TIME_LIMIT); created_at is a datetime in UTC, now by default
+# returns [(plan_id, user_id, meal_plan)] when keep_plans is set, otherwise the number of plans
+
+
+def generate_meal_plans(conn, user_ids=None, start_date=None, rng=None, categorized_recipes=None,
+                        keep_plans=False, optimize=False, chunk_size=CHUNK_SIZE, created_at=None,
+                        days=PLAN_DAYS, time_limit=None):
+    if not 1 <= days <= MAX_PLAN_DAYS:
+        raise ValueError(f"Plans are 1 to {MAX_PLAN_DAYS} days long.")
+    rng = rng or random.Random()
+    if categorized_recipes is None:
+        categorized_recipes = load_recipe_pool(conn)
+    missing = missing_categories(categorized_recipes)
+    if missing:
+        raise ValueError(f"Insufficient recipes for {', '.join(missing)}.")
+    bitsets = load_ingredient_bitsets(
+        conn, categorized_recipes) if optimize else None
+    candidates = index_candidates(categorized_recipes, bitsets, MEAL_TYPES) if optimize else None
+    # plans built once the run is out of time keep their greedy picks
+    deadline = time.perf_counter() + time_limit if optimize and time_limit is not None else None
+
+    start_date = start_date or datetime.now().date()
+    end_date = start_date + timedelta(days=days - 1)
+    created_at = (created_at or datetime.now(timezone.utc)).strftime(TIMESTAMP)
+
+    if user_ids is None:
+        user_ids = [row[0] for row in conn.execute(
+            "SELECT user_id FROM User ORDER BY user_id")]
+
+    # one write transaction for the whole run; IMMEDIATE reserves the plan ids
+    with transaction(conn) as cursor:
+        plan_id = _next_plan_id(cursor)
+        saved = []
+        count = 0
+        chunk_size = max(1, chunk_size * PLAN_DAYS // days)
+        for chunk_start in range(0, len(user_ids), chunk_size):
+            plans = []
+            plan_recipes = []
+            slots = []
+            for user_id in user_ids[chunk_start:chunk_start + chunk_size]:
+                meal_plan = build_plan(categorized_recipes, start_date, days, rng, bitsets, deadline, candidates)
+                plans.append((plan_id, user_id, str(start_date),
+                              str(end_date), created_at))
+                slots.extend((plan_id, str(day), meal_type, recipe[0])
+                             for day, meals in meal_plan.items() for meal_type, recipe in meals.items())
+                # MealPlanRecipe keeps each recipe once per plan; repeats are in the slots
+                plan_recipes.extend((plan_id, recipe_id) for recipe_id in dict.fromkeys(
+                    recipe[0] for meals in meal_plan.values() for recipe in meals.values()))
+                if keep_plans:
+                    saved.append((plan_id, user_id, meal_plan))
+                plan_id += 1
+            cursor.executemany("""
+                INSERT INTO MealPlan (plan_id, user_id, start_date, end_date, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, plans)
+            cursor.executemany("""
+                INSERT INTO MealPlanRecipe (plan_id, recipe_id)
+                VALUES (?, ?)
+            """, plan_recipes)
+            cursor.executemany("""
+                INSERT INTO MealPlanSlot (plan_id, date, meal_type, recipe_id)
+                VALUES (?, ?, ?, ?)
+            """, slots)
+            count += len(plans)
+    return saved if keep_plans else count
+
+# the meals a user has planned from date_from to date_to, in date and meal order:
+# [(date, meal_type, recipe_id, name, plan_id), ...] with dates as YYYY-MM-DD text
+# where plans overlap, the most recent one wins. plans are found on
+# idx_mealplan_user_start (a plan running on date_from started at most MAX_PLAN_DAYS
+# before it) and their meals by a primary key range on MealPlanSlot
+
+
+def planned_meals(conn, user_id, date_from, date_to=None, meal_type=None):
+    date_to = date_to or date_from
+    earliest = date_from - timedelta(days=MAX_PLAN_DAYS - 1)
+    params = [str(date_from), str(date_to), user_id, str(earliest), str(date_to), str(date_from)]
+    meal_filter = ""
+    if meal_type:
+        meal_filter = "AND MealPlanSlot.meal_type = ?"
+        params.append(meal_type)
+    rows = conn.execute(f"""
+        SELECT MealPlanSlot.date, MealPlanSlot.meal_type, MealPlanSlot.recipe_id, Recipe.name,
+               MealPlanSlot.plan_id
+        FROM MealPlan
+        JOIN MealPlanSlot ON MealPlanSlot.plan_id = MealPlan.plan_id
+                         AND MealPlanSlot.date BETWEEN ? AND ?
+        JOIN Recipe ON MealPlanSlot.recipe_id = Recipe.recipe_id
+        WHERE MealPlan.user_id = ? AND MealPlan.start_date BETWEEN ? AND ? AND MealPlan.end_date >= ?
+        {meal_filter}
+        ORDER BY MealPlanSlot.plan_id DESC
+    """, params).fetchall()
+    meals = {}
+    for row in rows:
+        meals.setdefault((row[0], row[1]), row)
+    order = {meal_type: idx for idx, meal_type in enumerate(MEAL_TYPES)}
+    return sorted(meals.values(), key=lambda row: (row[0], order.get(row[1], len(order))))
@@ -0,0 +1,534 @@
+
+import sqlite3
+
+from units import parse_quantity
+
+# versioned schema migrations, tracked with PRAGMA user_version
+# each entry moves the schema from (version - 1) to version; a step is either an
+# SQL statement or a callable taking a cursor. all steps of one migration run in
+# a single transaction together with the user_version bump
+
+
+# parse the free-text quantities already stored in RecipeIngredient
+
+
+def _backfill_amounts(cursor):
+    rows = cursor.execute("""
+        SELECT RecipeIngredient.rowid, RecipeIngredient.quantity, Ingredient.unit_of_measure
+        FROM RecipeIngredient
+        LEFT JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+    """).fetchall()
+    cursor.executemany(
+        "UPDATE RecipeIngredient SET amount = ?, unit = ? WHERE rowid = ?",
+        [parse_quantity(quantity, unit_of_measure) + (rowid,)
+         for rowid, quantity, unit_of_measure in rows])
+
+
+# move existing shopping list items into the per-unit layout, converting each quantity
+# from the ingredient's unit of measure into its canonical unit
+
+
+def _copy_shopping_list_items(cursor):
+    rows = cursor.execute("""
+        SELECT ShoppingListItem.list_id, ShoppingListItem.ingredient_id,
+               ShoppingListItem.quantity, Ingredient.unit_of_measure
+        FROM ShoppingListItem
+        LEFT JOIN Ingredient ON ShoppingListItem.ingredient_id = Ingredient.ingredient_id
+    """).fetchall()
+    items = {}
+    for list_id, ingredient_id, quantity, unit_of_measure in rows:
+        amount, unit = parse_quantity(quantity, unit_of_measure)
+        if amount is None:
+            items[(list_id, ingredient_id, '')] = (None, str(quantity))
+        else:
+            items[(list_id, ingredient_id, unit)] = (amount, None)
+    cursor.executemany("""
+        INSERT INTO ShoppingListItem_new (list_id, ingredient_id, unit, quantity, note)
+        VALUES (?, ?, ?, ?, ?)
+    """, [key + value for key, value in items.items()])
+
+
+# rebuild a table under a new definition, keeping its rows, indexes, triggers and
+# AUTOINCREMENT counter; SQLite cannot change the constraints of an existing table.
+# runs with foreign key enforcement off (see migrate), so dropping the old table
+# does not cascade
+
+
+def _rebuild_table(table, definition):
+    def rebuild(cursor):
+        dependents = [sql for (sql,) in cursor.execute("""
+            SELECT sql FROM sqlite_master
+            WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        """, (table,))]
+        columns = ", ".join(row[1] for row in cursor.execute(f"PRAGMA table_info({table})"))
+        sequence = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone() \
+            if _has_sequence(cursor) else None
+        cursor.execute(definition.format(table=f"{table}_new"))
+        cursor.execute(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        # the legacy rename leaves other tables' triggers alone; the modern one would
+        # reparse those naming the dropped table and fail
+        cursor.execute("PRAGMA legacy_alter_table = ON")
+        try:
+            cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        finally:
+            cursor.execute("PRAGMA legacy_alter_table = OFF")
+        for sql in dependents:
+            cursor.execute(sql)
+        if sequence is not None:
+            cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (sequence[0], table))
+    return rebuild
+
+
+# a trigger that stamps the recipes an event touched with a new RecipeVersion.version;
+# recipes is a SELECT of recipe_id over new and old
+
+
+def _recipe_change_trigger(name, event, recipes):
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} BEGIN
+      UPDATE RecipeVersion SET version = version + 1;
+      INSERT INTO RecipeChange (recipe_id, version)
+      SELECT recipe_id, (SELECT version FROM RecipeVersion) FROM ({recipes}) WHERE true
+      ON CONFLICT (recipe_id) DO UPDATE SET version = excluded.version;
+    END
+    """
+
+
+def _has_sequence(cursor):
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'").fetchone() is not None
+
+
+MIGRATIONS = [
+    (1, [
+        # base tables from Checkpoint 2, so a fresh database file is usable as-is
+        """
+        CREATE TABLE IF NOT EXISTS User (
+          user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          username VARCHAR(255) NOT NULL UNIQUE,
+          email VARCHAR(255) NOT NULL UNIQUE,
+          password VARCHAR(255) NOT NULL,
+          created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+          last_login DATETIME
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Category (
+          category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          name VARCHAR(255) NOT NULL UNIQUE,
+          description TEXT,
+          created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Recipe (
+          recipe_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          name VARCHAR(255) NOT NULL,
+          instructions TEXT,
+          prep_time INTEGER,
+          cook_time INTEGER,
+          servings INTEGER,
+          category_id INTEGER,
+          user_id INTEGER,
+          created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+          FOREIGN KEY (category_id) REFERENCES Category(category_id),
+          FOREIGN KEY (user_id) REFERENCES User(user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS Ingredient (
+          ingredient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          name VARCHAR(255) NOT NULL UNIQUE,
+          unit_of_measure VARCHAR(255)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS MealPlan (
+          plan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER,
+          start_date DATE,
+          end_date DATE,
+          created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+          FOREIGN KEY (user_id) REFERENCES User(user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ShoppingList (
+          list_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER,
+          created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+          FOREIGN KEY (user_id) REFERENCES User(user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS MealPlanRecipe (
+          plan_id INTEGER,
+          recipe_id INTEGER,
+          PRIMARY KEY (plan_id, recipe_id),
+          FOREIGN KEY (plan_id) REFERENCES MealPlan(plan_id),
+          FOREIGN KEY (recipe_id) REFERENCES Recipe(recipe_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ShoppingListItem (
+          list_id INTEGER,
+          ingredient_id INTEGER,
+          quantity FLOAT,
+          PRIMARY KEY (list_id, ingredient_id),
+          FOREIGN KEY (list_id) REFERENCES ShoppingList(list_id),
+          FOREIGN KEY (ingredient_id) REFERENCES Ingredient(ingredient_id)
+        )
+        """,
+        # the recipe <-> ingredient link used by app.py but missing from Checkpoint 2
+        """
+        CREATE TABLE IF NOT EXISTS RecipeIngredient (
+          recipe_id INTEGER,
+          ingredient_id INTEGER,
+          quantity VARCHAR(255),
+          PRIMARY KEY (recipe_id, ingredient_id),
+          FOREIGN KEY (recipe_id) REFERENCES Recipe(recipe_id),
+          FOREIGN KEY (ingredient_id) REFERENCES Ingredient(ingredient_id)
+        )
+        """,
+        # secondary indexes for the joins and filters in app.py; lookups by
+        # RecipeIngredient.recipe_id and MealPlanRecipe.plan_id are already
+        # served by the leading column of their primary keys
+        "CREATE INDEX IF NOT EXISTS idx_recipe_user_id ON Recipe(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_recipe_category_id ON Recipe(category_id)",
+        "CREATE INDEX IF NOT EXISTS idx_recipeingredient_ingredient_id ON RecipeIngredient(ingredient_id)",
+        "CREATE INDEX IF NOT EXISTS idx_mealplan_created_at ON MealPlan(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_mealplan_user_start ON MealPlan(user_id, start_date)",
+        "CREATE INDEX IF NOT EXISTS idx_mealplanrecipe_recipe_id ON MealPlanRecipe(recipe_id)",
+    ]),
+    (2, [
+        # full-text index over recipe names, instructions and ingredient names;
+        # rowid is the recipe_id. kept in sync by the triggers below
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS RecipeSearch USING fts5(
+          name, instructions, ingredients,
+          tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        INSERT INTO RecipeSearch (rowid, name, instructions, ingredients)
+        SELECT Recipe.recipe_id, Recipe.name, Recipe.instructions,
+               COALESCE((SELECT group_concat(Ingredient.name, ' ')
+                         FROM RecipeIngredient
+                         JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+                         WHERE RecipeIngredient.recipe_id = Recipe.recipe_id), '')
+        FROM Recipe
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_insert AFTER INSERT ON Recipe BEGIN
+          INSERT INTO RecipeSearch (rowid, name, instructions, ingredients)
+          VALUES (new.recipe_id, new.name, new.instructions, '');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_update AFTER UPDATE OF name, instructions ON Recipe BEGIN
+          UPDATE RecipeSearch SET name = new.name, instructions = new.instructions
+          WHERE rowid = new.recipe_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_delete AFTER DELETE ON Recipe BEGIN
+          DELETE FROM RecipeSearch WHERE rowid = old.recipe_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_link_insert AFTER INSERT ON RecipeIngredient BEGIN
+          UPDATE RecipeSearch SET ingredients = COALESCE((
+            SELECT group_concat(Ingredient.name, ' ')
+            FROM RecipeIngredient
+            JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+            WHERE RecipeIngredient.recipe_id = new.recipe_id), '')
+          WHERE rowid = new.recipe_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_link_delete AFTER DELETE ON RecipeIngredient BEGIN
+          UPDATE RecipeSearch SET ingredients = COALESCE((
+            SELECT group_concat(Ingredient.name, ' ')
+            FROM RecipeIngredient
+            JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+            WHERE RecipeIngredient.recipe_id = old.recipe_id), '')
+          WHERE rowid = old.recipe_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_link_update
+        AFTER UPDATE OF recipe_id, ingredient_id ON RecipeIngredient BEGIN
+          UPDATE RecipeSearch SET ingredients = COALESCE((
+            SELECT group_concat(Ingredient.name, ' ')
+            FROM RecipeIngredient
+            JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+            WHERE RecipeIngredient.recipe_id = RecipeSearch.rowid), '')
+          WHERE rowid IN (old.recipe_id, new.recipe_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_ingredient_rename AFTER UPDATE OF name ON Ingredient BEGIN
+          UPDATE RecipeSearch SET ingredients = COALESCE((
+            SELECT group_concat(Ingredient.name, ' ')
+            FROM RecipeIngredient
+            JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+            WHERE RecipeIngredient.recipe_id = RecipeSearch.rowid), '')
+          WHERE rowid IN (SELECT recipe_id FROM RecipeIngredient WHERE ingredient_id = new.ingredient_id);
+        END
+        """,
+    ]),
+    (3, [
+        # numeric quantities parsed once at write time: amount in a canonical unit
+        "ALTER TABLE RecipeIngredient ADD COLUMN amount REAL",
+        "ALTER TABLE RecipeIngredient ADD COLUMN unit VARCHAR(255)",
+        _backfill_amounts,
+        # covers shopping list aggregation: recipe lookup plus everything it sums
+        """
+        CREATE INDEX IF NOT EXISTS idx_recipeingredient_amount
+        ON RecipeIngredient(recipe_id, ingredient_id, unit, amount)
+        """,
+    ]),
+    (4, [
+        # saved shopping lists remember where they came from
+        "ALTER TABLE ShoppingList ADD COLUMN name VARCHAR(255)",
+        "ALTER TABLE ShoppingList ADD COLUMN plan_id INTEGER REFERENCES MealPlan(plan_id)",
+        "CREATE INDEX IF NOT EXISTS idx_shoppinglist_plan_id ON ShoppingList(plan_id)",
+        "CREATE INDEX IF NOT EXISTS idx_shoppinglist_user_created ON ShoppingList(user_id, created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS ShoppingListRecipe (
+          list_id INTEGER,
+          recipe_id INTEGER,
+          PRIMARY KEY (list_id, recipe_id),
+          FOREIGN KEY (list_id) REFERENCES ShoppingList(list_id),
+          FOREIGN KEY (recipe_id) REFERENCES Recipe(recipe_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_shoppinglistrecipe_recipe_id ON ShoppingListRecipe(recipe_id)",
+        # items are kept per ingredient and canonical unit, like the aggregation;
+        # note holds quantities that could not be summed
+        """
+        CREATE TABLE ShoppingListItem_new (
+          list_id INTEGER,
+          ingredient_id INTEGER,
+          unit VARCHAR(255) NOT NULL DEFAULT '',
+          quantity FLOAT,
+          note TEXT,
+          PRIMARY KEY (list_id, ingredient_id, unit),
+          FOREIGN KEY (list_id) REFERENCES ShoppingList(list_id),
+          FOREIGN KEY (ingredient_id) REFERENCES Ingredient(ingredient_id)
+        )
+        """,
+        _copy_shopping_list_items,
+        "DROP TABLE ShoppingListItem",
+        "ALTER TABLE ShoppingListItem_new RENAME TO ShoppingListItem",
+    ]),
+    (5, [
+        # recipes are identified by (owner, name) when importing
+        "CREATE INDEX IF NOT EXISTS idx_recipe_user_name ON Recipe(user_id, name)",
+    ]),
+    (6, [
+        # deleting a recipe, meal plan or shopping list takes its link rows with it;
+        # a shopping list outlives the meal plan it was made from. every cascade walks
+        # an index on the child column. rows already orphaned are copied as they are
+        # and reclaimed by the cleanup pass (see cleanup.py)
+        _rebuild_table('RecipeIngredient', """
+        CREATE TABLE {table} (
+          recipe_id INTEGER,
+          ingredient_id INTEGER,
+          quantity VARCHAR(255),
+          amount REAL,
+          unit VARCHAR(255),
+          PRIMARY KEY (recipe_id, ingredient_id),
+          FOREIGN KEY (recipe_id) REFERENCES Recipe(recipe_id) ON DELETE CASCADE,
+          FOREIGN KEY (ingredient_id) REFERENCES Ingredient(ingredient_id)
+        )
+        """),
+        _rebuild_table('MealPlanRecipe', """
+        CREATE TABLE {table} (
+          plan_id INTEGER,
+          recipe_id INTEGER,
+          PRIMARY KEY (plan_id, recipe_id),
+          FOREIGN KEY (plan_id) REFERENCES MealPlan(plan_id) ON DELETE CASCADE,
+          FOREIGN KEY (recipe_id) REFERENCES Recipe(recipe_id) ON DELETE CASCADE
+        )
+        """),
+        _rebuild_table('ShoppingList', """
+        CREATE TABLE {table} (
+          list_id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id INTEGER,
+          created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+          name VARCHAR(255),
+          plan_id INTEGER,
+          FOREIGN KEY (user_id) REFERENCES User(user_id),
+          FOREIGN KEY (plan_id) REFERENCES MealPlan(plan_id) ON DELETE SET NULL
+        )
+        """),
+        _rebuild_table('ShoppingListRecipe', """
+        CREATE TABLE {table} (
+          list_id INTEGER,
+          recipe_id INTEGER,
+          PRIMARY KEY (list_id, recipe_id),
+          FOREIGN KEY (list_id) REFERENCES ShoppingList(list_id) ON DELETE CASCADE,
+          FOREIGN KEY (recipe_id) REFERENCES Recipe(recipe_id) ON DELETE CASCADE
+        )
+        """),
+        _rebuild_table('ShoppingListItem', """
+        CREATE TABLE {table} (
+          list_id INTEGER,
+          ingredient_id INTEGER,
+          unit VARCHAR(255) NOT NULL DEFAULT '',
+          quantity FLOAT,
+          note TEXT,
+          PRIMARY KEY (list_id, ingredient_id, unit),
+          FOREIGN KEY (list_id) REFERENCES ShoppingList(list_id) ON DELETE CASCADE,
+          FOREIGN KEY (ingredient_id) REFERENCES Ingredient(ingredient_id)
+        )
+        """),
+    ]),
+    (7, [
+        # shopping lists can be scaled to a number of servings: the whole list, or one
+        # of its recipes overriding it. NULL keeps the recipes as written
+        "ALTER TABLE ShoppingList ADD COLUMN servings INTEGER",
+        "ALTER TABLE ShoppingListRecipe ADD COLUMN servings INTEGER",
+    ]),
+    (8, [
+        # one row per planned meal, so plans can run for weeks and repeat recipes;
+        # the primary key is the calendar index (a plan's meals by date and meal type).
+        # plans saved before this have no slots, only their MealPlanRecipe set
+        """
+        CREATE TABLE IF NOT EXISTS MealPlanSlot (
+          plan_id INTEGER NOT NULL,
+          date DATE NOT NULL,
+          meal_type VARCHAR(50) NOT NULL,
+          recipe_id INTEGER NOT NULL,
+          PRIMARY KEY (plan_id, date, meal_type),
+          FOREIGN KEY (plan_id) REFERENCES MealPlan(plan_id) ON DELETE CASCADE,
+          FOREIGN KEY (recipe_id) REFERENCES Recipe(recipe_id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_mealplanslot_recipe_id ON MealPlanSlot(recipe_id)",
+    ]),
+    (9, [
+        # a recipe on a list made from a meal plan is bought for every meal it fills
+        "ALTER TABLE ShoppingListRecipe ADD COLUMN meals INTEGER NOT NULL DEFAULT 1",
+    ]),
+    (10, [
+        # a change counter for the in-memory copies of recipe data (see recipecache.py):
+        # every write to a recipe, its ingredient links or a name its details show bumps
+        # RecipeVersion.version and stamps the recipe with it in RecipeChange, so any
+        # session can ask which recipes changed since the version it last saw, whichever
+        # process wrote them. a restored database gets a new epoch (see backup.py)
+        "CREATE TABLE IF NOT EXISTS RecipeVersion (epoch INTEGER NOT NULL, version INTEGER NOT NULL)",
+        "INSERT INTO RecipeVersion (epoch, version) VALUES (abs(random()), 0)",
+        """
+        CREATE TABLE IF NOT EXISTS RecipeChange (
+          recipe_id INTEGER PRIMARY KEY,
+          version INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_recipechange_version ON RecipeChange(version)",
+        _recipe_change_trigger('recipe_change_insert', "INSERT ON Recipe",
+                               "SELECT new.recipe_id AS recipe_id"),
+        _recipe_change_trigger('recipe_change_update', "UPDATE ON Recipe",
+                               "SELECT old.recipe_id AS recipe_id UNION SELECT new.recipe_id"),
+        _recipe_change_trigger('recipe_change_delete', "DELETE ON Recipe",
+                               "SELECT old.recipe_id AS recipe_id"),
+        _recipe_change_trigger('recipe_change_link_insert', "INSERT ON RecipeIngredient",
+                               "SELECT new.recipe_id AS recipe_id"),
+        _recipe_change_trigger('recipe_change_link_update', "UPDATE ON RecipeIngredient",
+                               "SELECT old.recipe_id AS recipe_id UNION SELECT new.recipe_id"),
+        _recipe_change_trigger('recipe_change_link_delete', "DELETE ON RecipeIngredient",
+                               "SELECT old.recipe_id AS recipe_id"),
+        _recipe_change_trigger('recipe_change_ingredient_update', "UPDATE OF name, unit_of_measure ON Ingredient",
+                               "SELECT recipe_id FROM RecipeIngredient WHERE ingredient_id = new.ingredient_id"),
+        _recipe_change_trigger('recipe_change_category_update', "UPDATE OF name ON Category",
+                               "SELECT recipe_id FROM Recipe WHERE category_id = new.category_id"),
+        _recipe_change_trigger('recipe_change_user_update', "UPDATE OF username ON User",
+                               "SELECT recipe_id FROM Recipe WHERE user_id = new.user_id"),
+    ]),
+    (11, [
+        # bulk loaders pause the per-link search refresh with a row in SearchPause that
+        # only lives inside their own transaction (see search.pause_link_triggers)
+        "CREATE TABLE IF NOT EXISTS SearchPause (paused INTEGER)",
+        "DROP TRIGGER IF EXISTS recipe_search_link_insert",
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_link_insert AFTER INSERT ON RecipeIngredient
+        WHEN NOT EXISTS (SELECT 1 FROM SearchPause) BEGIN
+          UPDATE RecipeSearch SET ingredients = COALESCE((
+            SELECT group_concat(Ingredient.name, ' ')
+            FROM RecipeIngredient
+            JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+            WHERE RecipeIngredient.recipe_id = new.recipe_id), '')
+          WHERE rowid = new.recipe_id;
+        END
+        """,
+        "DROP TRIGGER IF EXISTS recipe_search_link_delete",
+        """
+        CREATE TRIGGER IF NOT EXISTS recipe_search_link_delete AFTER DELETE ON RecipeIngredient
+        WHEN NOT EXISTS (SELECT 1 FROM SearchPause) BEGIN
+          UPDATE RecipeSearch SET ingredients = COALESCE((
+            SELECT group_concat(Ingredient.name, ' ')
+            FROM RecipeIngredient
+            JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+            WHERE RecipeIngredient.recipe_id = old.recipe_id), '')
+          WHERE rowid = old.recipe_id;
+        END
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# read the schema version stored in the database header
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# bring the database up to the latest schema version, one migration per transaction
+# foreign keys are not enforced while migrating, since tables get rebuilt; a new
+# database is created with incremental auto-vacuum so freed pages can be returned
+# to the file system in small steps
+
+
+def migrate(conn):
+    current = schema_version(conn)
+    if current > LATEST_VERSION:
+        raise sqlite3.DatabaseError(
+            f"Database schema version {current} is newer than this application ({LATEST_VERSION}).")
+    if current == LATEST_VERSION:
+        return current
+
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.execute("PRAGMA foreign_keys = OFF")
+    if current == 0 and conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor = conn.cursor()
+    try:
+        for version, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            # IMMEDIATE so two sessions starting at once do not both apply a migration
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                if schema_version(conn) >= version:
+                    conn.rollback()
+                    current = version
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                # PRAGMA does not accept bound parameters
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            current = version
+    finally:
+        cursor.close()
+        conn.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
+    return current
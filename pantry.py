@@ -0,0 +1,168 @@
+
+import json
+import threading
+from collections import Counter
+
+from recipecache import changed_recipes, recipe_version
+
+# "what can I cook": recipes that can be made from the ingredients on hand, or with at
+# most a few missing, ranked by the share of their ingredients already in the pantry
+#
+# an inverted index maps every ingredient to the recipes using it; a query counts, per
+# recipe, how many of its ingredients the pantry covers by walking only the postings of
+# the pantry ingredients, so its cost depends on the pantry, not on the number of recipes
+#
+# the index follows the recipe change counter (see recipecache.recipe_version): on its
+# next use, recipes written since the version it last saw, in this or any other
+# process, are re-read and patched in. other writes (meal plans, shopping lists) leave
+# it alone; only a restored database rebuilds it
+
+# matches returned by default
+MATCH_LIMIT = 20
+
+
+class PantryIndex:
+    def __init__(self):
+        self._postings = {}  # ingredient_id -> {recipe_id, ...}
+        self._recipes = {}  # recipe_id -> frozenset of ingredient_ids
+        self._names = {}  # recipe_id -> name
+        self._lock = threading.Lock()
+        self.epoch = None
+        self.version = 0  # recipe change counter the index is up to date with
+
+    # build the index with one pass over Recipe and RecipeIngredient
+
+    @classmethod
+    def load(cls, conn):
+        index = cls()
+        index._apply(*_read(conn))
+        return index
+
+    def __len__(self):
+        return len(self._recipes)
+
+    # re-read the given recipes and replace their postings; deleted recipes are dropped
+
+    def update(self, conn, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        names, links = _read(conn, recipe_ids)
+        for recipe_id in recipe_ids:
+            names.setdefault(recipe_id, None)
+        self._apply(names, links)
+
+    def _apply(self, names, links):
+        with self._lock:
+            for recipe_id, name in names.items():
+                for ingredient_id in self._recipes.pop(recipe_id, ()):
+                    recipes = self._postings[ingredient_id]
+                    recipes.discard(recipe_id)
+                    if not recipes:
+                        del self._postings[ingredient_id]
+                self._names.pop(recipe_id, None)
+                if name is None:
+                    continue
+                ingredients = frozenset(links.get(recipe_id, ()))
+                self._names[recipe_id] = name
+                self._recipes[recipe_id] = ingredients
+                for ingredient_id in ingredients:
+                    self._postings.setdefault(ingredient_id, set()).add(recipe_id)
+
+    def recipe_ids(self):
+        return list(self._recipes)
+
+    def ingredients(self, recipe_id):
+        return self._recipes.get(recipe_id, frozenset())
+
+    def name(self, recipe_id):
+        return self._names.get(recipe_id)
+
+    # recipe_id -> number of the given ingredients it uses, for recipes using any of them
+
+    def overlap(self, ingredient_ids):
+        with self._lock:
+            return self._overlap(ingredient_ids)
+
+    def _overlap(self, ingredient_ids):
+        matched = Counter()
+        for ingredient_id in ingredient_ids:
+            matched.update(self._postings.get(ingredient_id, ()))
+        return matched
+
+    # recipes with at most max_missing ingredients outside the pantry, best covered first
+    # returns [(recipe_id, name, matched, total, missing_ingredient_ids), ...]
+    # recipes sharing no ingredient with the pantry are never returned
+
+    def match(self, ingredient_ids, max_missing=0, limit=MATCH_LIMIT):
+        pantry = set(ingredient_ids)
+        with self._lock:
+            matched = self._overlap(pantry)
+            results = []
+            for recipe_id, count in matched.items():
+                ingredients = self._recipes[recipe_id]
+                if len(ingredients) - count <= max_missing:
+                    results.append((recipe_id, self._names[recipe_id], count, len(ingredients),
+                                    sorted(ingredients - pantry) if count < len(ingredients) else []))
+        results.sort(key=lambda result: (-result[2] / result[3], result[3] - result[2], result[1], result[0]))
+        return results[:limit]
+
+
+# recipe names and ingredient links, of every recipe or only of the given ones
+# returns ({recipe_id: name}, {recipe_id: [ingredient_id, ...]})
+
+
+def _read(conn, recipe_ids=None):
+    recipe_filter = ""
+    params = ()
+    if recipe_ids is not None:
+        recipe_filter = "WHERE Recipe.recipe_id IN (SELECT value FROM json_each(?))"
+        params = (json.dumps(recipe_ids),)
+    names = dict(conn.execute(f"SELECT Recipe.recipe_id, Recipe.name FROM Recipe {recipe_filter}", params))
+    links = {}
+    for recipe_id, ingredient_id in conn.execute(f"""
+        SELECT RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id
+        FROM RecipeIngredient
+        JOIN Recipe ON RecipeIngredient.recipe_id = Recipe.recipe_id
+        {recipe_filter}
+    """, params):
+        links.setdefault(recipe_id, []).append(ingredient_id)
+    return names, links
+
+
+class _Entry:
+    __slots__ = ('index', 'lock')
+
+    def __init__(self):
+        self.index = None
+        self.lock = threading.Lock()
+
+
+_entries = {}
+
+
+def _key(conn):
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    return database or id(conn)
+
+# get the pantry index for a connection's database, building it on first use and
+# patching in the recipes changed since; connections to the same database file share
+# one index. a version behind the index (a rolled back write it saw) rebuilds it too
+
+
+def get_pantry_index(conn):
+    entry = _entries.setdefault(_key(conn), _Entry())
+    with entry.lock:
+        # read before the recipes, so a write committed meanwhile is patched in again next time
+        epoch, version = recipe_version(conn)
+        index = entry.index
+        if index is None or index.epoch != epoch or version < index.version:
+            index = entry.index = PantryIndex.load(conn)
+        elif version > index.version:
+            index.update(conn, changed_recipes(conn, index.version))
+        index.epoch, index.version = epoch, version
+    return index
+
+
+def match_pantry(conn, ingredient_ids, max_missing=0, limit=MATCH_LIMIT):
+    return get_pantry_index(conn).match(ingredient_ids, max_missing, limit)
@@ -0,0 +1,173 @@
+
+import math
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from catalog import get_catalog
+
+# ingredient-aware meal planning: pick the breakfast/lunch/dinner slots of a week so
+# the plan needs as few distinct ingredients as possible
+# each recipe's ingredients are a bitset (a Python int); a greedy pass fills the
+# slots, then local search replaces single slots until a full pass over them finds no
+# improvement, which takes a few passes. a deadline only caps long plans and big runs
+#
+# candidates are scored through an inverted index from ingredient to the recipes of a
+# meal type using it, built once per run: the ingredients a recipe would add to the
+# plan are its size minus the planned ingredients it shares, and only recipes sharing
+# some are counted, by walking the postings of the few planned ingredients
+
+# default seconds a plan may spend improving the greedy plan
+TIME_LIMIT = 0.25
+
+# recipe -> ingredient bitsets for every recipe in the pool, from the recipe catalog
+# the most common ingredients get the lowest bits, which keeps typical bitsets short
+
+
+def load_ingredient_bitsets(conn, categorized_recipes):
+    return get_catalog(conn).ingredient_bitsets(
+        recipe[0] for recipes in categorized_recipes.values() for recipe in recipes)
+
+# the bit numbers set in a bitset
+
+
+def _bits(bitset):
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class _Candidates:
+    def __init__(self, recipes, bitsets):
+        self.recipes = recipes
+        self.bitsets = [bitsets.get(recipe[0], 0) for recipe in recipes]
+        self.sizes = [bitset.bit_count() for bitset in self.bitsets]
+        self.postings = {}  # ingredient bit -> [position, ...]
+        for position, bitset in enumerate(self.bitsets):
+            for bit in _bits(bitset):
+                self.postings.setdefault(bit, []).append(position)
+        # positions grouped by size, smallest size first
+        groups = {}
+        for position, size in enumerate(self.sizes):
+            groups.setdefault(size, []).append(position)
+        self.by_size = [groups[size] for size in sorted(groups)]
+
+    # the candidate adding the fewest ingredients to planned (a bitset), then the
+    # smallest; ties go to the first at or after start, so every plan breaks them
+    # differently. skips recipe ids in excluded
+    # returns (recipe, ingredients it adds), or (None, None) when all are excluded
+
+    def best(self, planned, excluded, start=0):
+        count = len(self.recipes)
+        best_key = None
+        # recipes sharing nothing with the plan add all of their ingredients
+        for positions in self.by_size:
+            first = bisect_left(positions, start)
+            for index in range(len(positions)):
+                position = positions[(first + index) % len(positions)]
+                if self.recipes[position][0] not in excluded:
+                    best_key = (self.sizes[position], self.sizes[position], (position - start) % count)
+                    break
+            if best_key is not None:
+                break
+        else:
+            return None, None
+        shared = Counter()
+        for bit in _bits(planned):
+            shared.update(self.postings.get(bit, ()))
+        sizes = self.sizes
+        fewest = best_key[0]
+        for position, common in shared.items():
+            # most recipes share only a common ingredient or two and are out at this test
+            if sizes[position] - common > fewest:
+                continue
+            key = (sizes[position] - common, sizes[position], (position - start) % count)
+            if key < best_key and self.recipes[position][0] not in excluded:
+                best_key = key
+                fewest = key[0]
+        return self.recipes[(best_key[2] + start) % count], best_key[0]
+
+# candidate indexes of every meal type, shared by all plans of a run
+
+
+def index_candidates(categorized_recipes, bitsets, meal_types):
+    return {meal_type: _Candidates(categorized_recipes[meal_type], bitsets) for meal_type in meal_types}
+
+# number of distinct ingredients a plan needs
+
+
+def count_distinct_ingredients(meal_plan, bitsets):
+    union = 0
+    for meals in meal_plan.values():
+        for recipe in meals.values():
+            union |= bitsets.get(recipe[0], 0)
+    return union.bit_count()
+
+# build a plan over days x meal_types minimizing distinct ingredients
+# a recipe is used at most max_repeats times (by default only as often as the pool
+# size forces); local search stops at deadline (a time.perf_counter() value, shared
+# by the weeks of a plan or the plans of a run) or else time_limit seconds from now
+# candidates come from index_candidates, built here when not given
+# returns {day: {meal_type: (recipe_id, name, category)}}
+
+
+def build_optimized_plan(categorized_recipes, bitsets, days, meal_types, rng=random,
+                         max_repeats=None, time_limit=TIME_LIMIT, deadline=None, candidates=None):
+    if deadline is None:
+        deadline = time.perf_counter() + time_limit
+    if candidates is None:
+        candidates = index_candidates(categorized_recipes, bitsets, meal_types)
+    slots = [(day, meal_type) for day in days for meal_type in meal_types]
+    limits = {meal_type: max_repeats or math.ceil(len(days) / len(categorized_recipes[meal_type]))
+              for meal_type in meal_types}
+    # where this plan starts breaking ties in each meal type
+    starts = {meal_type: rng.randrange(len(categorized_recipes[meal_type])) for meal_type in meal_types}
+    usage = Counter()
+    used_up = set()  # recipes planned as often as their limit allows
+
+    def use(recipe, meal_type, count):
+        usage[recipe[0]] += count
+        if usage[recipe[0]] >= limits[meal_type]:
+            used_up.add(recipe[0])
+        else:
+            used_up.discard(recipe[0])
+
+    # greedy: each slot takes the recipe adding the fewest new ingredients,
+    # preferring recipes with fewer ingredients overall
+    chosen = []
+    union = 0
+    for _, meal_type in slots:
+        best, _ = candidates[meal_type].best(union, used_up, starts[meal_type])
+        if best is None:
+            best = rng.choice(categorized_recipes[meal_type])
+        chosen.append(best)
+        use(best, meal_type, 1)
+        union |= bitsets.get(best[0], 0)
+
+    # local search: replace one slot at a time whenever that shrinks the ingredient set,
+    # until a whole pass changes nothing
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for slot in rng.sample(range(len(slots)), len(slots)):
+            meal_type = slots[slot][1]
+            rest = 0
+            for other, recipe in enumerate(chosen):
+                if other != slot:
+                    rest |= bitsets.get(recipe[0], 0)
+            current = chosen[slot]
+            best, added = candidates[meal_type].best(rest, used_up | {current[0]}, starts[meal_type])
+            if best is not None and added < (bitsets.get(current[0], 0) & ~rest).bit_count():
+                use(current, meal_type, -1)
+                use(best, meal_type, 1)
+                chosen[slot] = best
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+
+    meal_plan = {day: {} for day in days}
+    for (day, meal_type), recipe in zip(slots, chosen):
+        meal_plan[day][meal_type] = recipe
+    return meal_plan
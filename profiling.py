@@ -0,0 +1,117 @@
+
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# opt-in per-action profiling of Python time and memory
+#
+#   RECIPE_PROFILE=profiles python app.py
+#   python app.py --profile profiles
+#   python app.py --profile profiles batch < commands.jsonl
+#
+# every menu action (or command line command) runs under cProfile and tracemalloc and
+# leaves two files in the directory: SESSION-NNNN-action.txt with the top functions, the top
+# allocation sites and peak memory, and SESSION-NNNN-action.prof for pstats/snakeviz
+# interactive actions include the time spent waiting in input(); it shows up as its
+# own entry in the function list
+
+PROFILE_VARIABLE = 'RECIPE_PROFILE'
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+
+_directory = None
+_session = None
+_sequence = 0
+
+# reports of one process share a session prefix (start time and pid), so runs never overwrite each other
+
+
+def enable_profiling(directory):
+    global _directory, _session
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    _session = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+
+
+def profiling_directory():
+    if _directory is None and os.environ.get(PROFILE_VARIABLE):
+        enable_profiling(os.environ[PROFILE_VARIABLE])
+    return _directory
+
+# peak resident set size of the process in KiB, when the platform reports it
+
+
+def peak_rss_kib():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kibibytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+# run function(*args, **kwargs) as the named action, profiled when profiling is enabled
+# name and function are positional-only, so commands may take a name argument of their own
+
+
+def run_action(name, function, /, *args, **kwargs):
+    directory = profiling_directory()
+    if directory is None:
+        return function(*args, **kwargs)
+
+    global _sequence
+    _sequence += 1
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+        _write_report(directory, f"{_session}-{_sequence:04d}-{re.sub(r'[^A-Za-z0-9_.-]+', '-', name)}",
+                      name, elapsed, peak, profiler, before, after)
+
+
+def _write_report(directory, stem, name, elapsed, peak, profiler, before, after):
+    profiler.dump_stats(os.path.join(directory, f"{stem}.prof"))
+    functions = io.StringIO()
+    pstats.Stats(profiler, stream=functions).sort_stats(
+        'cumulative').print_stats(TOP_FUNCTIONS)
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    allocations = after.filter_traces(ignore).compare_to(
+        before.filter_traces(ignore), 'lineno')
+
+    with open(os.path.join(directory, f"{stem}.txt"), 'w', encoding='utf-8') as report:
+        report.write(f"Action: {name}\n")
+        report.write(f"Started: {datetime.now().isoformat(timespec='seconds')}\n")
+        report.write(f"Wall time: {elapsed * 1000:.1f} ms\n")
+        report.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+        rss = peak_rss_kib()
+        if rss is not None:
+            report.write(f"Peak RSS of the process: {rss} KiB\n")
+        report.write(f"\nTop {TOP_ALLOCATIONS} allocation sites (growth during the action):\n")
+        for stat in allocations[:TOP_ALLOCATIONS]:
+            report.write(f"  {stat}\n")
+        report.write(f"\nTop {TOP_FUNCTIONS} functions by cumulative time:\n")
+        report.write(functions.getvalue())
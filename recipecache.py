@@ -0,0 +1,126 @@
+
+import threading
+from collections import OrderedDict
+
+# bounded LRU cache of assembled recipe details (see app.get_recipe_detail)
+# every write that changes what a recipe detail shows should call invalidate_recipes
+# for the recipes it touched once its transaction has committed. writes from other
+# sessions and processes, and restores, are caught on the next lookup through the
+# recipe change counter (see recipe_version)
+#
+# a detail loaded while an invalidation ran may be the old version, so every
+# invalidation bumps a generation and a load only goes into the cache when the
+# generation it started in is still current
+
+# recipes kept per database
+CACHE_SIZE = 1024
+
+
+class RecipeCache:
+    def __init__(self, capacity=CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()  # recipe_id -> detail, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0  # bumped by every invalidation
+        self.version = None  # recipe change counter last checked
+
+    # return the cached detail for recipe_id, calling load() on a miss
+    # missing recipes (None) are not cached; cached details are shared, so treat them as read-only
+
+    def get(self, recipe_id, load):
+        with self._lock:
+            detail = self._entries.get(recipe_id)
+            if detail is not None:
+                self._entries.move_to_end(recipe_id)
+                self.hits += 1
+                return detail
+            self.misses += 1
+            generation = self.generation
+        detail = load()
+        if detail is not None:
+            with self._lock:
+                if generation != self.generation:
+                    return detail
+                self._entries[recipe_id] = detail
+                self._entries.move_to_end(recipe_id)
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return detail
+
+    def invalidate(self, recipe_ids):
+        with self._lock:
+            self.generation += 1
+            for recipe_id in recipe_ids:
+                if self._entries.pop(recipe_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    # drop the recipes changed since the last check, by this or any other process;
+    # everything when the database was restored in between
+
+    def sync(self, conn):
+        version = recipe_version(conn)
+        seen = self.version
+        if seen is None or seen[0] != version[0] or version[1] < seen[1]:
+            self.clear()
+        elif version[1] > seen[1]:
+            self.invalidate(changed_recipes(conn, seen[1]))
+        self.version = version
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._entries), 'capacity': self.capacity, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+_caches = {}
+
+# get the shared recipe cache for a connection's database, up to date with the recipe
+# change counter; connections to the same database file share one cache
+
+
+def get_recipe_cache(conn):
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    key = database or id(conn)
+    if key not in _caches:
+        _caches[key] = RecipeCache()
+    cache = _caches[key]
+    cache.sync(conn)
+    return cache
+
+# the recipe change counter kept by triggers (see migration 10): (epoch, version)
+# version grows with every committed write to recipe data, by any process; epoch
+# changes when the database is replaced by a restore, which starts its versions over
+
+
+def recipe_version(conn):
+    return conn.execute("SELECT epoch, version FROM RecipeVersion").fetchone()
+
+# recipes written after version, deleted ones included: [recipe_id, ...]
+
+
+def changed_recipes(conn, version):
+    return [row[0] for row in conn.execute(
+        "SELECT recipe_id FROM RecipeChange WHERE version > ?", (version,))]
+
+# drop the cached details of recipes changed by a committed write
+
+
+def invalidate_recipes(conn, recipe_ids):
+    get_recipe_cache(conn).invalidate(list(recipe_ids))
@@ -0,0 +1,113 @@
+
+import json
+import re
+
+# weights for the RecipeSearch columns passed to bm25(): name, instructions, ingredients
+NAME_WEIGHT = 10.0
+INSTRUCTIONS_WEIGHT = 1.0
+INGREDIENTS_WEIGHT = 5.0
+
+# triggers that refresh a recipe's ingredient terms whenever one ingredient is linked or unlinked
+LINK_TRIGGERS = ('recipe_search_link_insert', 'recipe_search_link_delete')
+
+# turn free text typed by the user into an FTS5 query: every word must match,
+# as a prefix, so "choc chip" finds "Chocolate Chip Cookies"
+
+
+def build_match_query(text):
+    terms = re.findall(r"\w+", text.lower())
+    return " ".join(f'"{term}"*' for term in terms)
+
+# search recipes by name, instructions and ingredient names, best matches first
+
+
+def search_recipes(conn, text, limit=20):
+    match = build_match_query(text)
+    if not match:
+        return []
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT Recipe.recipe_id, Recipe.name, Recipe.prep_time, Recipe.cook_time, Recipe.servings,
+                   Category.name AS category, User.username AS user
+            FROM (
+                SELECT rowid, bm25(RecipeSearch, ?, ?, ?) AS score
+                FROM RecipeSearch
+                WHERE RecipeSearch MATCH ?
+                ORDER BY score
+                LIMIT ?
+            ) AS hits
+            JOIN Recipe ON Recipe.recipe_id = hits.rowid
+            JOIN Category ON Recipe.category_id = Category.category_id
+            JOIN User ON Recipe.user_id = User.user_id
+            ORDER BY hits.score
+        """, (NAME_WEIGHT, INSTRUCTIONS_WEIGHT, INGREDIENTS_WEIGHT, match, limit))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+# rebuild the full-text index from scratch and merge its b-trees
+# the triggers keep it current, so this is only needed for maintenance or repair
+
+
+def rebuild_search_index(conn):
+    with conn:
+        conn.execute("DELETE FROM RecipeSearch")
+        conn.execute("""
+            INSERT INTO RecipeSearch (rowid, name, instructions, ingredients)
+            SELECT Recipe.recipe_id, Recipe.name, Recipe.instructions,
+                   COALESCE((SELECT group_concat(Ingredient.name, ' ')
+                             FROM RecipeIngredient
+                             JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+                             WHERE RecipeIngredient.recipe_id = Recipe.recipe_id), '')
+            FROM Recipe
+        """)
+        conn.execute("INSERT INTO RecipeSearch (RecipeSearch) VALUES ('optimize')")
+    return conn.execute("SELECT COUNT(*) FROM RecipeSearch").fetchone()[0]
+
+# refresh the ingredient names of the given recipes' search documents in one statement
+
+
+def refresh_ingredient_terms(cursor, recipe_ids):
+    cursor.execute("""
+        UPDATE RecipeSearch SET ingredients = COALESCE((
+          SELECT group_concat(Ingredient.name, ' ')
+          FROM RecipeIngredient
+          JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+          WHERE RecipeIngredient.recipe_id = RecipeSearch.rowid), '')
+        WHERE rowid IN (SELECT value FROM json_each(?))
+    """, (json.dumps(list(recipe_ids)),))
+
+# bulk loaders relink many ingredients per recipe; instead of letting the per-link
+# triggers rewrite a search document for every link, they pause them and refresh each
+# recipe once with refresh_ingredient_terms. the pause is a SearchPause row written and
+# removed inside the loader's transaction, so no other connection ever sees it, and
+# being no schema change it leaves the connection's prepared statements valid
+
+
+def pause_link_triggers(cursor):
+    cursor.execute("INSERT INTO SearchPause (paused) VALUES (1)")
+
+
+def resume_link_triggers(cursor):
+    cursor.execute("DELETE FROM SearchPause")
+
+# a loader that builds the whole index afterwards drops triggers inside its transaction
+# (so no other connection sees them missing) and restores them at the end
+# returns the triggers' SQL for restore_triggers
+
+
+def suspend_triggers(cursor, names=LINK_TRIGGERS):
+    suspended = []
+    for name in names:
+        row = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()
+        if row is not None:
+            cursor.execute(f"DROP TRIGGER {name}")
+            suspended.append(row[0])
+    return suspended
+
+
+def restore_triggers(cursor, suspended):
+    for sql in suspended:
+        cursor.execute(sql)
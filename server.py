@@ -0,0 +1,304 @@
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from cleanup import start_background_cleanup
+from cli import COMMANDS, CommandError, NotFoundError, check_arguments
+from concurrency import BUSY_TIMEOUT, WriteQueue, configure
+from shopping import load_shopping_list, shopping_list_recipes
+from sqltrace import connection_factory
+
+# JSON HTTP service over the same operations as the command line
+#
+#   python server.py --port 8111
+#   curl localhost:8111/recipes?limit=5
+#
+# reads run on a pool of threads, each holding its own read-only connection; every
+# write goes through a single writer thread with the only read-write connection (a
+# concurrency.WriteQueue), so writes are serialized while WAL lets the readers keep
+# going during them
+
+READERS = os.cpu_count() or 4
+MAX_BODY = 1 << 20
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# connections are opened lazily, once per pool thread
+
+
+class ConnectionPool:
+    def __init__(self, db_file, readers=READERS):
+        self.db_file = os.path.abspath(db_file)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = None
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix='reader')
+
+    # start the writer, which brings the schema up to date and switches to WAL
+    # must run before any reader connects
+
+    def open(self):
+        from app import connect_db
+
+        def connect():
+            conn = connect_db(self.db_file)
+            if conn is None:
+                raise RuntimeError(f"Cannot open {self.db_file}")
+            return conn
+        self._writer = WriteQueue(connect)
+
+    def _track(self, conn):
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _reader_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, timeout=BUSY_TIMEOUT,
+                                   check_same_thread=False, factory=connection_factory())
+            configure(conn, read_only=True)
+            conn.execute("PRAGMA query_only = ON")
+            self._track(conn)
+        return conn
+
+    async def read(self, function, *args):
+        def run():
+            return function(self._reader_connection(), *args)
+        return await asyncio.get_running_loop().run_in_executor(self._readers, run)
+
+    async def write(self, function, *args):
+        return await asyncio.wrap_future(self._writer.submit(function, *args))
+
+    def close(self):
+        self._readers.shutdown()
+        self._writer.close()
+        # reader connections are opened with check_same_thread off, so they can be closed here
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def _command(name):
+    def run(conn, args):
+        check_arguments(name, args)
+        return COMMANDS[name](conn, **args)
+    return run
+
+
+def _saved_shopping_list(conn, args):
+    list_id = args['list_id']
+    items = load_shopping_list(conn, list_id)
+    recipes = shopping_list_recipes(conn, list_id)
+    if not items and not recipes:
+        raise NotFoundError(f"Shopping list {list_id} not found.")
+    return {'list_id': list_id, 'recipes': [{'recipe_id': recipe_id, 'name': name} for recipe_id, name in recipes],
+            'items': [{'ingredient_id': row[0], 'name': row[1], 'unit_of_measure': row[2], 'unit': row[3],
+                       'amount': row[4], 'unparsed': row[5]} for row in items]}
+
+
+def _delete_meal_plan(conn, args):
+    return COMMANDS['meal-plans.delete'](conn, [args['plan_id']])
+
+
+def _delete_recipe(conn, args):
+    return COMMANDS['recipes.delete'](conn, [args['recipe_id']])
+
+# snapshots go to the default directory only; they are taken on a reader connection,
+# so writes carry on meanwhile
+
+
+def _take_snapshot(conn, args):
+    return COMMANDS['snapshot'](conn, **{key: args[key] for key in ('pages', 'pause') if key in args})
+
+
+def _list_snapshots(conn, args):
+    return COMMANDS['snapshots'](conn)
+
+# shopping lists that are not saved only read; saving goes through the writer
+
+
+def _shopping_list_mode(args):
+    return 'write' if args.get('save') else 'read'
+
+
+# (method, path pattern, handler, 'read' | 'write' | function choosing one from the args)
+ROUTES = [
+    ('GET', r'/recipes', _command('recipes.list'), 'read'),
+    ('GET', r'/recipes/search', _command('recipes.search'), 'read'),
+    ('GET', r'/recipes/cook', _command('recipes.cook'), 'read'),
+    ('GET', r'/recipes/(?P<recipe_id>\d+)', _command('recipes.show'), 'read'),
+    ('GET', r'/recipes/(?P<recipe_id>\d+)/similar', _command('recipes.similar'), 'read'),
+    ('GET', r'/recommendations', _command('recipes.recommend'), 'read'),
+    ('POST', r'/recipes', _command('recipes.add'), 'write'),
+    ('DELETE', r'/recipes/(?P<recipe_id>\d+)', _delete_recipe, 'write'),
+    ('POST', r'/shopping-lists', _command('shopping-list'), _shopping_list_mode),
+    ('GET', r'/shopping-lists/(?P<list_id>\d+)', _saved_shopping_list, 'read'),
+    ('GET', r'/meal-plans', _command('meal-plans.list'), 'read'),
+    ('GET', r'/meal-plans/calendar', _command('meal-plans.calendar'), 'read'),
+    ('POST', r'/meal-plans', _command('meal-plans.generate'), 'write'),
+    ('DELETE', r'/meal-plans', _command('meal-plans.delete'), 'write'),
+    ('DELETE', r'/meal-plans/(?P<plan_id>\d+)', _delete_meal_plan, 'write'),
+    ('GET', r'/snapshots', _list_snapshots, 'read'),
+    ('POST', r'/snapshots', _take_snapshot, 'read'),
+    ('GET', r'/cache-stats', _command('cache.stats'), 'read'),
+    ('GET', r'/sql-trace', _command('trace.summary'), 'read'),
+]
+ROUTES = [(method, re.compile(pattern + '$'), handler, mode)
+          for method, pattern, handler, mode in ROUTES]
+
+# query string values: numbers become ints, "true"/"false" booleans, repeated keys lists
+
+
+def _query_value(values):
+    parsed = []
+    for value in values:
+        if value.isdigit():
+            parsed.append(int(value))
+        elif value in ('true', 'false'):
+            parsed.append(value == 'true')
+        else:
+            parsed.append(value)
+    return parsed[0] if len(parsed) == 1 else parsed
+
+
+def _match(method, path):
+    allowed = False
+    for route_method, pattern, handler, mode in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, mode, {key: int(value) for key, value in match.groupdict().items()}
+            allowed = True
+    if allowed:
+        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed.")
+    raise HTTPError(HTTPStatus.NOT_FOUND, "Not found.")
+
+
+async def dispatch(pool, method, target, body):
+    url = urlsplit(target)
+    handler, mode, args = _match(method, url.path.rstrip('/') or '/')
+    args.update({key.replace('-', '_'): _query_value(values)
+                 for key, values in parse_qs(url.query).items()})
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON.")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object.")
+        args.update(payload)
+    if callable(mode):
+        mode = mode(args)
+    run = pool.write if mode == 'write' else pool.read
+    try:
+        return await run(handler, args)
+    except NotFoundError as e:
+        raise HTTPError(HTTPStatus.NOT_FOUND, str(e))
+    except (CommandError, ValueError) as e:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+
+# serve requests on one connection until the client closes it or asks to
+
+
+async def handle_client(pool, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+            try:
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY:
+                    raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large.")
+                body = await reader.readexactly(length) if length else b''
+                status = HTTPStatus.CREATED if method == 'POST' else HTTPStatus.OK
+                result = await dispatch(pool, method, target, body)
+            except HTTPError as e:
+                status, result = e.status, {'error': str(e)}
+            except sqlite3.Error as e:
+                status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Database error: {e}"}
+            except Exception:
+                # a bug in a handler still gets an answer; the traceback goes to the log
+                print(f"Error handling {method} {target}:", file=sys.stderr)
+                traceback.print_exc()
+                status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal server error."}
+
+            payload = json.dumps(result, default=str).encode()
+            writer.write((f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                          "Content-Type: application/json\r\n"
+                          f"Content-Length: {len(payload)}\r\n"
+                          f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(db_file, host='127.0.0.1', port=8111, readers=READERS, ready=None):
+    pool = ConnectionPool(db_file, readers)
+    pool.open()
+    # orphans left from before deletes cascaded are removed in small batches meanwhile
+    start_background_cleanup(pool.db_file)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_client(pool, reader, writer), host, port)
+    if ready is not None:
+        ready(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    from app import DB_FILE
+
+    parser = argparse.ArgumentParser(description="Serve recipes, shopping lists and meal plans as JSON.")
+    parser.add_argument('--db', default=DB_FILE, help="database file")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8111)
+    parser.add_argument('--readers', type=int, default=READERS, help="read-only connections")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.readers,
+                          ready=lambda port: print(f"Serving on http://{args.host}:{port}", file=sys.stderr)))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
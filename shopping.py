@@ -0,0 +1,214 @@
+
+import json
+
+from catalog import get_catalog
+from units import format_quantity
+
+# shopping list aggregation over the numeric RecipeIngredient.amount/unit columns
+# amounts are summed per ingredient and canonical unit; quantities
+# that could not be parsed ("a pinch") are listed as typed instead of being summed
+#
+# lists can be scaled to the servings they are for: every recipe's amounts are multiplied
+# by target / Recipe.servings in the same pass that sums them
+
+# aggregate the ingredients of the selected recipes, optionally only for some ingredients
+# returns rows of (ingredient_id, name, unit_of_measure, unit, total_amount, unparsed_quantities)
+# where unit is '' for quantities without a unit or that could not be parsed
+# servings is a number of servings for every recipe or a dict of recipe_id -> servings,
+# times a dict of recipe_id -> how often it is cooked
+# the sums are computed in memory from the recipe catalog
+
+
+def aggregate_ingredients(conn, recipe_ids, ingredient_ids=None, servings=None, times=None):
+    return get_catalog(conn).aggregate(recipe_ids, ingredient_ids, servings, times)
+
+# how many meals each recipe fills in the given meal plans: {recipe_id: meals}
+# plans saved before meals were stored by date count each of their recipes once
+
+
+def plan_meals(conn, plan_ids):
+    plan_ids = json.dumps(list(plan_ids))
+    return dict(conn.execute("""
+        SELECT recipe_id, SUM(meals) FROM (
+            SELECT recipe_id, COUNT(*) AS meals FROM MealPlanSlot
+            WHERE plan_id IN (SELECT value FROM json_each(?))
+            GROUP BY recipe_id
+            UNION ALL
+            SELECT recipe_id, 1 FROM MealPlanRecipe
+            WHERE plan_id IN (SELECT value FROM json_each(?))
+              AND NOT EXISTS (SELECT 1 FROM MealPlanSlot WHERE MealPlanSlot.plan_id = MealPlanRecipe.plan_id)
+        )
+        GROUP BY recipe_id
+    """, (plan_ids, plan_ids)))
+
+# aggregate the recipes of several meal plans at once, e.g. a month of weekly plans;
+# a recipe counts once per meal it is planned for
+
+
+def aggregate_meal_plans(conn, plan_ids, servings=None):
+    meals = plan_meals(conn, plan_ids)
+    return aggregate_ingredients(conn, meals, servings=servings, times=meals)
+
+# format one aggregated or saved row for display, e.g. "Flour: 3 cups"
+
+
+def format_item(item):
+    name, unit_of_measure, unit, total_amount, unparsed = item[1:6]
+    parts = []
+    if total_amount is not None:
+        parts.append(format_quantity(total_amount, unit, unit_of_measure))
+    if unparsed:
+        parts.append(unparsed)
+    return f"{name}: {' + '.join(parts)}"
+
+# write aggregated rows into a saved list with one executemany
+
+
+def _insert_items(cursor, list_id, items):
+    cursor.executemany("""
+        INSERT INTO ShoppingListItem (list_id, ingredient_id, unit, quantity, note)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(list_id, item[0], item[3], item[4], item[5]) for item in items])
+
+# aggregate the selected recipes and save the result as a shopping list in one transaction
+# servings scales the list like aggregate_ingredients and is kept with it, so recipes
+# added later are scaled the same way; meals is a dict of recipe_id -> meals it is
+# cooked for (see plan_meals), kept per recipe as well. returns the new list_id
+
+
+def save_shopping_list(conn, user_id, recipe_ids, name=None, plan_id=None, servings=None, meals=None):
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    meals = meals or {}
+    items = aggregate_ingredients(conn, recipe_ids, servings=servings, times=meals)
+    per_recipe = servings if isinstance(servings, dict) else {}
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO ShoppingList (user_id, name, plan_id, servings)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, name, plan_id, None if per_recipe else servings))
+        list_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO ShoppingListRecipe (list_id, recipe_id, servings, meals) VALUES (?, ?, ?, ?)",
+            [(list_id, recipe_id, per_recipe.get(recipe_id), meals.get(recipe_id, 1)) for recipe_id in recipe_ids])
+        _insert_items(cursor, list_id, items)
+    return list_id
+
+# save the shopping list for a meal plan, or return the one already saved for it with
+# the same servings; recipes planned for several meals are bought for every one of them
+
+
+def save_plan_shopping_list(conn, plan_id, servings=None):
+    row = conn.execute("""
+        SELECT list_id FROM ShoppingList WHERE plan_id = ? AND servings IS ?
+        ORDER BY list_id DESC LIMIT 1
+    """, (plan_id, servings)).fetchone()
+    if row:
+        return row[0]
+    plan = conn.execute(
+        "SELECT user_id, start_date, end_date FROM MealPlan WHERE plan_id = ?", (plan_id,)).fetchone()
+    if not plan:
+        return None
+    meals = plan_meals(conn, [plan_id])
+    name = f"Meal plan {plan[1]} to {plan[2]}" + (f" for {servings}" if servings else "")
+    return save_shopping_list(conn, plan[0], meals, name=name, plan_id=plan_id, servings=servings, meals=meals)
+
+# read a saved list back in the same row shape as aggregate_ingredients
+
+
+def load_shopping_list(conn, list_id):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT Ingredient.ingredient_id, Ingredient.name, Ingredient.unit_of_measure,
+                   ShoppingListItem.unit, ShoppingListItem.quantity, ShoppingListItem.note
+            FROM ShoppingListItem
+            JOIN Ingredient ON ShoppingListItem.ingredient_id = Ingredient.ingredient_id
+            WHERE ShoppingListItem.list_id = ?
+            ORDER BY Ingredient.name, ShoppingListItem.unit
+        """, (list_id,))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+# most recent saved lists, optionally for one user: (list_id, name, plan_id, created_at)
+
+
+def list_shopping_lists(conn, user_id=None, limit=20):
+    if user_id is None:
+        return conn.execute("""
+            SELECT list_id, name, plan_id, created_at FROM ShoppingList
+            ORDER BY list_id DESC LIMIT ?
+        """, (limit,)).fetchall()
+    return conn.execute("""
+        SELECT list_id, name, plan_id, created_at FROM ShoppingList
+        WHERE user_id = ? ORDER BY created_at DESC, list_id DESC LIMIT ?
+    """, (user_id, limit)).fetchall()
+
+# recipes a saved list was built from: (recipe_id, name)
+
+
+def shopping_list_recipes(conn, list_id):
+    return conn.execute("""
+        SELECT Recipe.recipe_id, Recipe.name
+        FROM ShoppingListRecipe
+        JOIN Recipe ON ShoppingListRecipe.recipe_id = Recipe.recipe_id
+        WHERE ShoppingListRecipe.list_id = ?
+        ORDER BY Recipe.name
+    """, (list_id,)).fetchall()
+
+# recompute only the items for the given ingredients from the list's current recipes,
+# each scaled to its own servings or else the list's, times the meals it is cooked for
+
+
+def _refresh_items(cursor, conn, list_id, ingredient_ids):
+    servings = {}
+    meals = {}
+    for recipe_id, recipe_servings, recipe_meals in cursor.execute("""
+        SELECT ShoppingListRecipe.recipe_id, COALESCE(ShoppingListRecipe.servings, ShoppingList.servings),
+               ShoppingListRecipe.meals
+        FROM ShoppingListRecipe
+        JOIN ShoppingList ON ShoppingListRecipe.list_id = ShoppingList.list_id
+        WHERE ShoppingListRecipe.list_id = ?
+    """, (list_id,)).fetchall():
+        servings[recipe_id] = recipe_servings
+        meals[recipe_id] = recipe_meals
+    cursor.execute("""
+        DELETE FROM ShoppingListItem
+        WHERE list_id = ? AND ingredient_id IN (SELECT value FROM json_each(?))
+    """, (list_id, json.dumps(ingredient_ids)))
+    _insert_items(cursor, list_id, aggregate_ingredients(
+        conn, servings, ingredient_ids, servings, meals))
+
+# add a recipe to a saved list, updating only the rows of that recipe's ingredients
+# servings overrides the list's servings for this recipe
+
+
+def add_recipe_to_list(conn, list_id, recipe_id, servings=None):
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO ShoppingListRecipe (list_id, recipe_id, servings) VALUES (?, ?, ?)
+        """, (list_id, recipe_id, servings))
+        if cursor.rowcount == 0:
+            return False
+        ingredient_ids = [row[0] for row in cursor.execute(
+            "SELECT ingredient_id FROM RecipeIngredient WHERE recipe_id = ?", (recipe_id,))]
+        _refresh_items(cursor, conn, list_id, ingredient_ids)
+    return True
+
+# remove a recipe from a saved list, updating only the rows of that recipe's ingredients
+
+
+def remove_recipe_from_list(conn, list_id, recipe_id):
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM ShoppingListRecipe WHERE list_id = ? AND recipe_id = ?
+        """, (list_id, recipe_id))
+        if cursor.rowcount == 0:
+            return False
+        ingredient_ids = [row[0] for row in cursor.execute(
+            "SELECT ingredient_id FROM RecipeIngredient WHERE recipe_id = ?", (recipe_id,))]
+        _refresh_items(cursor, conn, list_id, ingredient_ids)
+    return True
@@ -0,0 +1,202 @@
+
+import math
+import threading
+from collections import Counter
+from heapq import heappush, heapreplace
+
+from pantry import get_pantry_index
+from recipecache import changed_recipes
+from shopping import plan_meals
+
+# "similar recipes" and "recommended for you" from the ingredients recipes share
+#
+# every recipe is a binary vector over ingredients, so its similarity to another recipe
+# depends only on their sizes and the number of ingredients they share. the shared
+# counts against every other recipe come from the pantry index in one pass over the
+# postings of the recipe's ingredients (a sparse row times the transposed recipe x
+# ingredient matrix, counted in C by Counter). candidates are then scored from the
+# most shared ingredients down, stopping once no recipe sharing fewer can make the top
+# NEIGHBORS, so the long tail sharing only salt is never scored
+#
+# the best NEIGHBORS per recipe are kept in a neighbor table, computed when first asked
+# for (or all at once by precompute) and refreshed incrementally from the recipe change
+# counter (see recipecache.recipe_version), whichever process changed the recipes: a
+# changed recipe gets its own list recomputed, is inserted into the lists it now ranks
+# in, and the lists that held it are recomputed on their next use
+#
+# recommendations add up the neighbors of the recipes in a user's recent meal plans,
+# weighted by how often each was planned, leaving out recipes already planned
+
+# neighbors kept per recipe
+NEIGHBORS = 20
+# similar recipes shown by default
+SIMILAR_LIMIT = 5
+# recent meal plans a recommendation is based on
+HISTORY_PLANS = 12
+# changes of more recipes at once (an import) clear the table instead of refreshing it
+REFRESH_LIMIT = 200
+
+# each metric is a score from (shared, size, other_size) and the highest score any
+# recipe sharing that many of the size ingredients can reach
+
+
+def jaccard(shared, size, other_size):
+    return shared / (size + other_size - shared)
+
+
+def jaccard_bound(shared, size):
+    return shared / size
+
+
+def cosine(shared, size, other_size):
+    return shared / math.sqrt(size * other_size)
+
+
+def cosine_bound(shared, size):
+    return math.sqrt(shared / size)
+
+
+METRICS = {'jaccard': (jaccard, jaccard_bound), 'cosine': (cosine, cosine_bound)}
+METRIC = 'jaccard'
+
+
+class NeighborTable:
+    def __init__(self, index, neighbors=NEIGHBORS, metric=METRIC):
+        self.index = index
+        self.size = neighbors
+        self.score, self.bound = METRICS[metric]
+        self._lists = {}  # recipe_id -> [(neighbor_id, score), ...] best first
+        self._listed_in = {}  # neighbor_id -> {recipe_id whose list holds it, ...}
+        self._lock = threading.RLock()
+        self.version = index.version  # recipe change counter the lists are up to date with
+
+    def __len__(self):
+        return len(self._lists)
+
+    # the best neighbors of recipe_id: [(neighbor_id, score), ...] best first, ties by id
+
+    def _search(self, recipe_id):
+        ingredients = self.index.ingredients(recipe_id)
+        size = len(ingredients)
+        overlap = self.index.overlap(ingredients)
+        overlap.pop(recipe_id, None)
+        best = []  # min-heap of (score, -neighbor_id): the weakest neighbor on top
+        for other, shared in overlap.most_common():
+            if len(best) == self.size and best[0][0] > self.bound(shared, size):
+                break
+            entry = (self.score(shared, size, len(self.index.ingredients(other))), -other)
+            if len(best) < self.size:
+                heappush(best, entry)
+            elif entry > best[0]:
+                heapreplace(best, entry)
+        return [(-neighbor_id, score) for score, neighbor_id in sorted(best, reverse=True)]
+
+    def _store(self, recipe_id, neighbors):
+        self._drop(recipe_id)
+        self._lists[recipe_id] = neighbors
+        for neighbor_id, _ in neighbors:
+            self._listed_in.setdefault(neighbor_id, set()).add(recipe_id)
+
+    def _drop(self, recipe_id):
+        for neighbor_id, _ in self._lists.pop(recipe_id, ()):
+            self._listed_in[neighbor_id].discard(recipe_id)
+
+    # the most similar recipes: [(neighbor_id, score), ...] best first, ties by id
+
+    def neighbors(self, recipe_id):
+        with self._lock:
+            neighbors = self._lists.get(recipe_id)
+            if neighbors is None:
+                neighbors = self._search(recipe_id)
+                self._store(recipe_id, neighbors)
+            return neighbors
+
+    # fill the table for the given recipes, or for every recipe
+
+    def precompute(self, recipe_ids=None):
+        for recipe_id in self.index.recipe_ids() if recipe_ids is None else recipe_ids:
+            self.neighbors(recipe_id)
+
+    def clear(self):
+        with self._lock:
+            self._lists.clear()
+            self._listed_in.clear()
+
+    # bring the table up to date after the index has picked up changes to recipe_ids
+
+    def refresh(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        with self._lock:
+            if len(recipe_ids) > REFRESH_LIMIT:
+                self.clear()
+                return
+            for recipe_id in recipe_ids:
+                self._drop(recipe_id)
+                # lists holding the old version may now need a recipe they cut off
+                for holder in list(self._listed_in.get(recipe_id, ())):
+                    self._drop(holder)
+                self._listed_in.pop(recipe_id, None)
+                ingredients = self.index.ingredients(recipe_id)
+                for other, shared in self.index.overlap(ingredients).items():
+                    neighbors = self._lists.get(other)
+                    if neighbors is None or other == recipe_id:
+                        continue
+                    others = self.index.ingredients(other)
+                    score = self.score(shared, len(others), len(ingredients))
+                    if len(neighbors) < self.size or (-score, recipe_id) < (-neighbors[-1][1], neighbors[-1][0]):
+                        neighbors = sorted(neighbors + [(recipe_id, score)], key=lambda entry: (-entry[1], entry[0]))
+                        self._store(other, neighbors[:self.size])
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def _key(conn):
+    database = conn.execute("PRAGMA database_list").fetchone()[2]
+    return database or id(conn)
+
+# get the neighbor table for a connection's database, refreshed for the recipes changed
+# since it was last used; connections to the same database file share one. a table
+# reads one pantry index, so when the index is rebuilt (a restored database) the
+# table starts over as well
+
+
+def get_neighbor_table(conn):
+    index = get_pantry_index(conn)
+    key = _key(conn)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None or table.index is not index:
+            table = _tables[key] = NeighborTable(index)
+        elif table.version < index.version:
+            # the index has patched in every recipe changed up to its version
+            version = index.version
+            table.refresh(changed_recipes(conn, table.version))
+            table.version = version
+    return table
+
+
+def similar_recipes(conn, recipe_id, limit=SIMILAR_LIMIT):
+    table = get_neighbor_table(conn)
+    return [(neighbor_id, table.index.name(neighbor_id), score)
+            for neighbor_id, score in table.neighbors(recipe_id)[:limit]]
+
+# recipes for a user from the neighbors of what they planned recently, each planned
+# recipe weighted by the meals it filled (see shopping.plan_meals)
+# returns [(recipe_id, name, score), ...] best first
+
+
+def recommend_recipes(conn, user_id, limit=SIMILAR_LIMIT, plans=HISTORY_PLANS):
+    history = plan_meals(conn, [row[0] for row in conn.execute("""
+        SELECT plan_id FROM MealPlan WHERE user_id = ?
+        ORDER BY start_date DESC, plan_id DESC LIMIT ?
+    """, (user_id, plans))])
+    table = get_neighbor_table(conn)
+    scores = Counter()
+    for recipe_id, times in history.items():
+        for neighbor_id, score in table.neighbors(recipe_id):
+            if neighbor_id not in history:
+                scores[neighbor_id] += times * score
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [(recipe_id, table.index.name(recipe_id), score) for recipe_id, score in ranked]
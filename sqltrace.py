@@ -0,0 +1,241 @@
+
+import atexit
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+# SQL statement tracing for finding slow queries, missing indexes and N+1 patterns
+#
+#   RECIPE_SQL_TRACE=1 python app.py              trace, print the summary on exit
+#   RECIPE_SQL_TRACE=/tmp/sql.txt python app.py   write the summary there instead
+#   RECIPE_SQL_SLOW_MS=5                          explain statements slower than 5 ms
+#
+# connections opened by connect_db get TracingConnection as their factory; every statement
+# is recorded under its normalized text with call count, total and max time and rows
+# (fetched for queries, changed for writes); fetch time counts towards the statement
+# the query plan of each statement that once ran over the threshold is captured, and
+# plans that scan a whole table are flagged
+
+TRACE_VARIABLE = 'RECIPE_SQL_TRACE'
+SLOW_VARIABLE = 'RECIPE_SQL_SLOW_MS'
+SLOW_MS = 20.0
+
+NUMBER_LITERAL = re.compile(r"\b\d+(\.\d+)?\b")
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(\s*,\s*\?)+\s*\)")
+# a plan step reading every row: "SCAN Recipe", but not "SCAN Recipe USING INDEX ..."
+FULL_SCAN = re.compile(r"^SCAN (?!.*\bUSING\b)(?!.*VIRTUAL TABLE)(\S+)")
+
+# subqueries and views the plan builds itself; scanning those is not a table scan
+SUBQUERY = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\S+)")
+
+# tables a query plan reads in full
+
+
+def full_scans(plan):
+    subqueries = {match.group(1) for match in map(SUBQUERY.match, plan) if match}
+    return [match.group(1) for match in map(FULL_SCAN.match, plan)
+            if match and match.group(1) not in subqueries]
+
+# statement text with literals and placeholder lists folded, so calls that differ only
+# in their values count as one statement
+
+
+def normalize(sql):
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('(?, ...)', sql)
+    return " ".join(sql.split())
+
+
+class StatementStats:
+    __slots__ = ('sql', 'calls', 'total', 'max', 'rows', 'plan', 'full_scans')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.plan = None
+        self.full_scans = []
+
+    def as_dict(self):
+        return {'sql': self.sql, 'calls': self.calls, 'total_ms': self.total * 1000,
+                'max_ms': self.max * 1000, 'mean_ms': self.total / self.calls * 1000 if self.calls else 0.0,
+                'rows': self.rows, 'plan': self.plan, 'full_scans': self.full_scans}
+
+
+class Tracer:
+    def __init__(self, slow_ms=SLOW_MS):
+        self.slow = slow_ms / 1000
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def statement(self, sql):
+        key = normalize(sql)
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats(key)
+            stats.calls += 1
+            return stats
+
+    # add time and rows to a statement; execution is the time so far of the call they
+    # belong to (execute plus fetches). returns True when the plan should be captured now
+
+    def record(self, stats, elapsed, rows, execution):
+        with self._lock:
+            stats.total += elapsed
+            stats.rows += rows
+            stats.max = max(stats.max, execution)
+            return stats.plan is None and execution >= self.slow
+
+    def explain(self, conn, stats, sql, parameters):
+        try:
+            plan = sqlite3.Connection.execute(
+                conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error as e:
+            plan = [(0, 0, 0, f"(no plan: {e})")]
+        with self._lock:
+            stats.plan = [row[3] for row in plan]
+            stats.full_scans = full_scans(stats.plan)
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+    # statements ordered by total time, the most expensive first
+
+    def summary(self, limit=None):
+        with self._lock:
+            statements = sorted(self._statements.values(), key=lambda stats: stats.total, reverse=True)
+            return [stats.as_dict() for stats in statements[:limit]]
+
+    def report(self, stream, limit=30):
+        statements = self.summary(limit)
+        stream.write(f"SQL trace: {len(self._statements)} distinct statements, "
+                     f"{sum(stats['calls'] for stats in statements)} calls in the top {len(statements)}\n")
+        for stats in statements:
+            stream.write(f"\n{stats['total_ms']:10.1f} ms total  {stats['calls']:8} calls  "
+                         f"{stats['mean_ms']:8.3f} ms mean  {stats['max_ms']:8.3f} ms max  {stats['rows']:8} rows\n")
+            stream.write(f"  {stats['sql'][:300]}\n")
+            for step in stats['plan'] or []:
+                stream.write(f"    plan: {step}\n")
+            if stats['full_scans']:
+                stream.write(f"    FULL SCAN of {', '.join(stats['full_scans'])}\n")
+
+
+class TracingCursor(sqlite3.Cursor):
+    _stats = None
+
+    def _add(self, elapsed, rows):
+        self._execution += elapsed
+        tracer = self.connection.tracer
+        if tracer.record(self._stats, elapsed, rows, self._execution):
+            tracer.explain(self.connection, self._stats, *self._statement)
+
+    def _traced(self, method, sql, parameters, plan_parameters):
+        self._stats = self.connection.tracer.statement(sql)
+        self._statement = (sql, plan_parameters)
+        self._execution = 0.0
+        start = time.perf_counter()
+        try:
+            method(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - start, max(self.rowcount, 0))
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._traced(super().execute, sql, parameters, parameters)
+
+    # the plan is explained with the first parameter set when the sequence is a list
+
+    def executemany(self, sql, seq_of_parameters):
+        plan_parameters = seq_of_parameters[0] if isinstance(
+            seq_of_parameters, (list, tuple)) and seq_of_parameters else ()
+        return self._traced(super().executemany, sql, seq_of_parameters, plan_parameters)
+
+    def _fetched(self, method, *args):
+        start = time.perf_counter()
+        rows = method(*args)
+        if self._stats is not None:
+            self._add(time.perf_counter() - start,
+                      len(rows) if isinstance(rows, list) else rows is not None)
+        return rows
+
+    def fetchone(self):
+        return self._fetched(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetched(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._fetched(super().fetchall)
+
+    def __next__(self):
+        return self._fetched(super().__next__)
+
+
+class TracingConnection(sqlite3.Connection):
+    tracer = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tracer = get_tracer()
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+
+_tracer = None
+
+# the process-wide tracer, created on first use with the threshold from the environment
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(float(os.environ.get(SLOW_VARIABLE) or SLOW_MS))
+    return _tracer
+
+
+def tracing_enabled():
+    return os.environ.get(TRACE_VARIABLE, '') not in ('', '0')
+
+# connection factory for sqlite3.connect: TracingConnection when tracing is enabled
+# the first traced connection registers the summary to be written on exit
+
+
+def connection_factory():
+    if not tracing_enabled():
+        return sqlite3.Connection
+    tracer = get_tracer()
+    if not getattr(tracer, 'dump_registered', False):
+        tracer.dump_registered = True
+        atexit.register(dump, tracer)
+    return TracingConnection
+
+# write the summary to the file named by RECIPE_SQL_TRACE, or stderr when it is just switched on
+
+
+def dump(tracer=None):
+    tracer = tracer or get_tracer()
+    target = os.environ.get(TRACE_VARIABLE, '')
+    if target and target not in ('0', '1', 'true', 'yes'):
+        with open(target, 'w', encoding='utf-8') as stream:
+            tracer.report(stream)
+    else:
+        tracer.report(sys.stderr)
@@ -0,0 +1,229 @@
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from app import connect_db, fetch_recipe_page, load_recipe_detail
+from concurrency import BUSY_TIMEOUT, WriteQueue, configure, with_retry
+from search import search_recipes
+from sqltrace import connection_factory
+from unitofwork import insert_recipe, link_ingredient, transaction
+
+# stress test for many sessions on one database
+#
+#   python stress.py bench.sqlite3 --writers 4 --readers 1 2 4 8 --seconds 5
+#   python stress.py bench.sqlite3 --direct   # every writer on its own connection
+#
+# on a scratch copy of the database, writer sessions keep adding recipes while reader
+# threads page through, open and search recipes, once per reader count. writes go
+# through one WriteQueue, or with --direct each writer has its own connection and
+# relies on the busy timeout and retries. afterwards every acknowledged write must be
+# in the database exactly once; the exit status is 1 when one is missing
+
+# ingredients linked to every recipe a writer adds
+LINKS = 3
+
+
+class Phase:
+    def __init__(self):
+        self.reads = 0
+        self.writes = []  # names of the acknowledged recipes
+        self.latencies = []  # seconds per acknowledged write
+        self.errors = []
+        self.lock = threading.Lock()
+
+
+def _add_recipe(conn, name, user_id, category_id, ingredient_ids):
+    with transaction(conn) as cursor:
+        recipe_id = insert_recipe(cursor, name, 10, 20, 4, "Added by the stress test.", category_id, user_id)
+        for ingredient_id in ingredient_ids:
+            link_ingredient(cursor, recipe_id, ingredient_id, "1 cup")
+    return recipe_id
+
+
+def _reader_connection(db_file):
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, timeout=BUSY_TIMEOUT,
+                           factory=connection_factory())
+    return configure(conn, read_only=True)
+
+# one reader session: a page of recipes, a recipe detail or a search, over and over
+
+
+def _read(db_file, ids, stop, phase, seed):
+    rng = random.Random(seed)
+    conn = _reader_connection(db_file)
+    reads = 0
+    try:
+        while not stop.is_set():
+            action = rng.random()
+            if action < 0.4:
+                fetch_recipe_page(conn, after_id=rng.choice(ids['recipes']))
+            elif action < 0.8:
+                load_recipe_detail(conn, rng.choice(ids['recipes']))
+            else:
+                search_recipes(conn, rng.choice(ids['terms']))
+            reads += 1
+    except sqlite3.Error as e:
+        with phase.lock:
+            phase.errors.append(f"reader: {e}")
+    finally:
+        conn.close()
+        with phase.lock:
+            phase.reads += reads
+
+# one writer session adding recipes, through the queue or on its own connection
+
+
+def _write(db_file, ids, stop, phase, writer, queue):
+    rng = random.Random(writer)
+    conn = None if queue else connect_db(db_file)
+    sequence = 0
+    try:
+        while not stop.is_set():
+            sequence += 1
+            name = f"stress-{writer}-{sequence}-{rng.getrandbits(32):08x}"
+            args = (name, rng.choice(ids['users']), rng.choice(ids['categories']),
+                    rng.sample(ids['ingredients'], LINKS))
+            started = time.perf_counter()
+            try:
+                if queue:
+                    queue.call(_add_recipe, *args)
+                else:
+                    with_retry(_add_recipe, conn, *args)
+            except sqlite3.Error as e:
+                with phase.lock:
+                    phase.errors.append(f"writer {writer}: {e}")
+                continue
+            elapsed = time.perf_counter() - started
+            with phase.lock:
+                phase.writes.append(name)
+                phase.latencies.append(elapsed)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def _load_ids(conn):
+    ids = {
+        'recipes': [row[0] for row in conn.execute("SELECT recipe_id FROM Recipe")],
+        'users': [row[0] for row in conn.execute("SELECT user_id FROM User")],
+        'categories': [row[0] for row in conn.execute("SELECT category_id FROM Category")],
+        'ingredients': [row[0] for row in conn.execute("SELECT ingredient_id FROM Ingredient")],
+    }
+    words = set()
+    for (name,) in conn.execute("SELECT name FROM Recipe LIMIT 1000"):
+        words.update(word for word in name.lower().split() if word.isalpha())
+    ids['terms'] = sorted(words) or ['recipe']
+    if not all(ids.values()) or len(ids['ingredients']) < LINKS:
+        raise RuntimeError("The database needs recipes, users, categories and ingredients (see datagen.py).")
+    return ids
+
+# run one phase with the given number of readers; returns the Phase
+
+
+def run_phase(db_file, ids, readers, writers, seconds, queue=None):
+    phase = Phase()
+    stop = threading.Event()
+    threads = [threading.Thread(target=_read, args=(db_file, ids, stop, phase, reader))
+               for reader in range(readers)]
+    threads += [threading.Thread(target=_write, args=(db_file, ids, stop, phase, f"{readers}.{writer}", queue))
+                for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return phase
+
+# acknowledged writes missing from the database, and recipes present more than once
+
+
+def verify(conn, names):
+    found = {}
+    for name, links in conn.execute("""
+        SELECT Recipe.name, COUNT(RecipeIngredient.ingredient_id)
+        FROM Recipe
+        LEFT JOIN RecipeIngredient ON RecipeIngredient.recipe_id = Recipe.recipe_id
+        WHERE Recipe.name LIKE 'stress-%'
+        GROUP BY Recipe.recipe_id
+    """):
+        found.setdefault(name, []).append(links)
+    missing = [name for name in names if found.get(name) != [LINKS]]
+    duplicated = [name for name, copies in found.items() if len(copies) > 1]
+    return missing, duplicated
+
+
+def run_stress(db_file, reader_counts, writers=4, seconds=5.0, direct=False):
+    with tempfile.TemporaryDirectory() as scratch:
+        copy = os.path.join(scratch, os.path.basename(db_file))
+        source = sqlite3.connect(db_file)
+        target = sqlite3.connect(copy)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        conn = connect_db(copy)
+        if not conn:
+            raise RuntimeError(f"Cannot open {db_file}")
+        queue = None
+        try:
+            ids = _load_ids(conn)
+            if not direct:
+                queue = WriteQueue(lambda: connect_db(copy))
+            print(f"{'readers':>8}{'reads/s':>12}{'writes/s':>10}{'write p50 ms':>14}{'write p95 ms':>14}"
+                  f"{'errors':>8}")
+            names = []
+            errors = []
+            for readers in reader_counts:
+                phase = run_phase(copy, ids, readers, writers, seconds, queue)
+                latencies = sorted(phase.latencies) or [0.0]
+                p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                print(f"{readers:>8}{phase.reads / seconds:>12.0f}{len(phase.writes) / seconds:>10.0f}"
+                      f"{statistics.median(latencies) * 1000:>14.2f}{p95 * 1000:>14.2f}{len(phase.errors):>8}")
+                names.extend(phase.writes)
+                errors.extend(phase.errors)
+            if queue:
+                queue.close()
+                queue = None
+            missing, duplicated = verify(conn, names)
+        finally:
+            if queue:
+                queue.close()
+            conn.close()
+    return names, missing, duplicated, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check concurrent reads and writes on a copy of a database.")
+    parser.add_argument('db', help="database to test (see datagen.py); it is not modified")
+    parser.add_argument('--readers', type=int, nargs='+', default=[0, 1, 2, 4, 8],
+                        help="reader thread counts, one phase each")
+    parser.add_argument('--writers', type=int, default=4, help="writer sessions")
+    parser.add_argument('--seconds', type=float, default=5.0, help="length of each phase")
+    parser.add_argument('--direct', action='store_true',
+                        help="every writer on its own connection instead of one write queue")
+    args = parser.parse_args(argv)
+
+    try:
+        names, missing, duplicated, errors = run_stress(args.db, args.readers, args.writers, args.seconds,
+                                                        args.direct)
+    except (RuntimeError, sqlite3.Error) as e:
+        print(e, file=sys.stderr)
+        return 1
+    for error in errors[:10]:
+        print(error, file=sys.stderr)
+    print(f"\n{len(names)} writes acknowledged, {len(missing)} missing, {len(duplicated)} duplicated, "
+          f"{len(errors)} failed")
+    return 1 if missing or duplicated else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import connect_db  # noqa: E402
+from unitofwork import insert_recipe, link_ingredient, transaction  # noqa: E402
+
+# every test gets its own database file, so the per-database caches start empty
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'recipes.sqlite3')
+
+
+@pytest.fixture
+def connect(db_file):
+    connections = []
+
+    def open_connection():
+        conn = connect_db(db_file)
+        connections.append(conn)
+        return conn
+    yield open_connection
+    for conn in connections:
+        conn.close()
+
+
+@pytest.fixture
+def conn(connect):
+    conn = connect()
+    with transaction(conn) as cursor:
+        cursor.execute("INSERT INTO User (username, email, password) VALUES ('cook', 'cook@example.com', 'x')")
+        cursor.execute("INSERT INTO Category (name) VALUES ('Dinner')")
+    return conn
+
+# add a recipe with {ingredient name: quantity} on any connection, creating the
+# ingredients it needs; returns the recipe_id
+
+
+@pytest.fixture
+def add_recipe():
+    def add(conn, name, ingredients, servings=4):
+        with transaction(conn) as cursor:
+            recipe_id = insert_recipe(cursor, name, 5, 10, servings, "", 1, 1)
+            for ingredient, quantity in ingredients.items():
+                cursor.execute("INSERT OR IGNORE INTO Ingredient (name) VALUES (?)", (ingredient,))
+                ingredient_id = cursor.execute(
+                    "SELECT ingredient_id FROM Ingredient WHERE name = ?", (ingredient,)).fetchone()[0]
+                link_ingredient(cursor, recipe_id, ingredient_id, quantity)
+        return recipe_id
+    return add
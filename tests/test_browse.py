@@ -0,0 +1,16 @@
+from app import count_recipes, fetch_recipe_page, find_page_anchor
+
+
+def test_pages_list_every_counted_recipe(conn, add_recipe):
+    for number in range(5):
+        add_recipe(conn, f"Recipe {number}", {"Salt": "1 pinch"})
+    # a category row lost before foreign keys were enforced
+    conn.execute("PRAGMA foreign_keys = OFF")
+    with conn:
+        conn.execute("UPDATE Recipe SET category_id = 99 WHERE name = 'Recipe 1'")
+    pages = [fetch_recipe_page(conn, page_size=2),
+             fetch_recipe_page(conn, after_id=find_page_anchor(conn, 2, page_size=2), page_size=2),
+             fetch_recipe_page(conn, after_id=find_page_anchor(conn, 3, page_size=2), page_size=2)]
+    names = [recipe[1] for page in pages for recipe in page]
+    assert len(names) == count_recipes(conn) == 5
+    assert names == [f"Recipe {number}" for number in range(5)]
@@ -0,0 +1,24 @@
+from catalog import get_catalog
+from unitofwork import transaction
+
+
+def test_other_writes_keep_the_catalog(conn, connect, add_recipe):
+    add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    catalog = get_catalog(conn)
+    with transaction(connect()) as cursor:
+        cursor.execute("INSERT INTO MealPlan (user_id, start_date, end_date) VALUES (1, '2026-01-05', '2026-01-11')")
+        cursor.execute("INSERT INTO ShoppingList (user_id, name) VALUES (1, 'Weekly')")
+    assert get_catalog(conn) is catalog
+
+
+def test_foreign_recipe_changes_reload_the_catalog(conn, connect, add_recipe):
+    add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    assert len(get_catalog(conn)) == 1
+    other = connect()
+    soup = add_recipe(other, "Soup", {"Tomato": "4"})
+    catalog = get_catalog(conn)
+    assert len(catalog) == 2
+    with transaction(other) as cursor:
+        cursor.execute("UPDATE Ingredient SET name = 'Tomatoes' WHERE name = 'Tomato'")
+    catalog = get_catalog(conn)
+    assert [row[1] for row in catalog.aggregate([soup])] == ["Tomatoes"]
@@ -0,0 +1,17 @@
+import pytest
+
+import cli
+from cli import CommandError, run_command
+
+
+def test_wrong_arguments_are_a_command_error(conn):
+    with pytest.raises(CommandError, match="Invalid arguments for recipes.show"):
+        run_command(conn, 'recipes.show', {'recipe': 1})
+
+
+def test_type_error_inside_a_command_propagates(conn, monkeypatch):
+    def broken(conn, recipe_id):
+        return len(recipe_id)
+    monkeypatch.setitem(cli.COMMANDS, 'recipes.show', broken)
+    with pytest.raises(TypeError):
+        run_command(conn, 'recipes.show', {'recipe_id': 1})
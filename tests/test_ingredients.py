@@ -0,0 +1,25 @@
+from ingredients import get_ingredient_index
+from unitofwork import transaction
+
+
+def add_ingredient(conn, name):
+    with transaction(conn) as cursor:
+        cursor.execute("INSERT INTO Ingredient (name, unit_of_measure) VALUES (?, 'g')", (name,))
+        return cursor.lastrowid
+
+
+def test_index_picks_up_ingredients_added_elsewhere(conn, connect):
+    add_ingredient(conn, "Flour")
+    index = get_ingredient_index(conn)
+    assert [row[1] for row in index.search("fl")] == ["Flour"]
+    add_ingredient(connect(), "Fresh Basil")
+    assert get_ingredient_index(conn) is index
+    assert [row[1] for row in index.search("basil")] == ["Fresh Basil"]
+
+
+def test_added_ingredient_does_not_hide_earlier_foreign_ones(conn, connect):
+    index = get_ingredient_index(conn)
+    add_ingredient(connect(), "Basil")
+    ingredient_id = add_ingredient(conn, "Butter")
+    index.add(ingredient_id, "Butter", "g")
+    assert [row[1] for row in get_ingredient_index(conn).search("b")] == ["Basil", "Butter"]
@@ -0,0 +1,13 @@
+import random
+from datetime import date, timedelta
+
+from mealplans import MEAL_TYPES, build_plan
+
+
+def test_plans_are_keyed_by_date():
+    pool = {meal_type: [(number, f"{meal_type} {number}", meal_type) for number in range(3)]
+            for meal_type in MEAL_TYPES}
+    start = date(2026, 1, 5)
+    plan = build_plan(pool, start, 10, random.Random(0))
+    assert list(plan) == [start + timedelta(days=offset) for offset in range(10)]
+    assert all(set(meals) == set(MEAL_TYPES) for meals in plan.values())
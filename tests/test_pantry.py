@@ -0,0 +1,84 @@
+import pantry
+from backup import restore_database, take_snapshot
+from pantry import get_pantry_index, match_pantry
+from unitofwork import RecipeEdit, transaction
+
+
+def ingredient(conn, name):
+    return conn.execute("SELECT ingredient_id FROM Ingredient WHERE name = ?", (name,)).fetchone()[0]
+
+
+def names(matches):
+    return [match[1] for match in matches]
+
+
+def count_loads(monkeypatch):
+    loads = []
+    load = pantry.PantryIndex.load.__func__
+
+    def counted(cls, conn):
+        loads.append(conn)
+        return load(cls, conn)
+    monkeypatch.setattr(pantry.PantryIndex, 'load', classmethod(counted))
+    return loads
+
+
+def test_recipe_added_by_another_connection_is_matched(conn, connect, add_recipe):
+    add_recipe(conn, "Pancakes", {"Flour": "200 g", "Milk": "300 ml", "Egg": "2"})
+    add_recipe(conn, "Sandwich", {"Bread": "2 slices", "Cheese": "1 slice"})
+    bread = ingredient(conn, "Bread")
+    assert match_pantry(conn, [bread]) == []
+    other = connect()
+    add_recipe(other, "Toast", {"Bread": "2 slices"})
+    assert names(match_pantry(conn, [bread])) == ["Toast"]
+
+
+def test_foreign_change_survives_a_local_edit(conn, connect, add_recipe):
+    pancakes = add_recipe(conn, "Pancakes", {"Flour": "200 g", "Milk": "300 ml"})
+    add_recipe(conn, "Sandwich", {"Bread": "2 slices", "Cheese": "1 slice"})
+    bread = ingredient(conn, "Bread")
+    assert match_pantry(conn, [bread]) == []
+    add_recipe(connect(), "Toast", {"Bread": "2 slices"})
+    # this connection commits a recipe of its own before it looks again
+    edit = RecipeEdit(pancakes)
+    edit.update(name="Crepes")
+    edit.commit(conn)
+    assert names(match_pantry(conn, [bread])) == ["Toast"]
+
+
+def test_foreign_edit_and_delete_are_patched_in(conn, connect, add_recipe):
+    toast = add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    soup = add_recipe(conn, "Soup", {"Bread": "1 slice", "Tomato": "4"})
+    bread, tomato = ingredient(conn, "Bread"), ingredient(conn, "Tomato")
+    assert names(match_pantry(conn, [bread, tomato])) == ["Soup", "Toast"]
+    other = connect()
+    with transaction(other) as cursor:
+        cursor.execute("DELETE FROM RecipeIngredient WHERE recipe_id = ? AND ingredient_id = ?", (soup, tomato))
+        cursor.execute("DELETE FROM Recipe WHERE recipe_id = ?", (toast,))
+    assert names(match_pantry(conn, [tomato])) == []
+    assert names(match_pantry(conn, [bread])) == ["Soup"]
+
+
+def test_other_writes_keep_the_index(conn, connect, add_recipe, monkeypatch):
+    add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    index = get_pantry_index(conn)
+    loads = count_loads(monkeypatch)
+    other = connect()
+    with transaction(other) as cursor:
+        cursor.execute("INSERT INTO MealPlan (user_id, start_date, end_date) VALUES (1, '2026-01-05', '2026-01-11')")
+        cursor.execute("INSERT INTO ShoppingList (user_id, name) VALUES (1, 'Weekly')")
+    assert get_pantry_index(conn) is index
+    add_recipe(other, "Soup", {"Bread": "1 slice"})
+    assert get_pantry_index(conn) is index
+    assert loads == []
+    assert len(index) == 2
+
+
+def test_restore_rebuilds_the_index(conn, add_recipe, tmp_path):
+    add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    bread = ingredient(conn, "Bread")
+    snapshot = take_snapshot(conn, str(tmp_path / 'snapshots'), pause=0)
+    add_recipe(conn, "Soup", {"Bread": "1 slice"})
+    assert names(match_pantry(conn, [bread])) == ["Soup", "Toast"]
+    restore_database(conn, snapshot, pause=0, keep_current=False)
+    assert names(match_pantry(conn, [bread])) == ["Toast"]
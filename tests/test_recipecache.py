@@ -0,0 +1,36 @@
+from app import get_recipe_detail
+from recipecache import RecipeCache, get_recipe_cache
+
+
+def test_foreign_edit_is_not_served_stale(conn, connect, add_recipe):
+    toast = add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    assert get_recipe_detail(conn, toast)['name'] == "Toast"
+    # written like another process would, without telling this one's cache
+    other = connect()
+    with other:
+        other.execute("UPDATE Recipe SET name = 'French toast' WHERE recipe_id = ?", (toast,))
+        other.execute("UPDATE Ingredient SET name = 'Rye bread' WHERE name = 'Bread'")
+    detail = get_recipe_detail(conn, toast)
+    assert detail['name'] == "French toast"
+    assert [ingredient['name'] for ingredient in detail['ingredients']] == ["Rye bread"]
+
+
+def test_foreign_delete_is_not_served_stale(conn, connect, add_recipe):
+    toast = add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    assert get_recipe_detail(conn, toast) is not None
+    other = connect()
+    with other:
+        other.execute("DELETE FROM Recipe WHERE recipe_id = ?", (toast,))
+    assert get_recipe_detail(conn, toast) is None
+    assert len(get_recipe_cache(conn)) == 0
+
+
+def test_load_overtaken_by_an_invalidation_is_not_cached():
+    cache = RecipeCache()
+
+    def load():
+        # a write commits and invalidates the recipe while it is being loaded
+        cache.invalidate([1])
+        return {'name': "old"}
+    assert cache.get(1, load) == {'name': "old"}
+    assert cache.get(1, lambda: {'name': "new"}) == {'name': "new"}
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+from cli import shopping_list
+from shopping import (add_recipe_to_list, aggregate_meal_plans, load_shopping_list, plan_meals,
+                      save_plan_shopping_list)
+from unitofwork import transaction
+
+
+# a plan with one dinner a day, taking the recipes in turn
+
+
+def add_plan(conn, recipe_ids, days, slots=True):
+    start = date(2026, 1, 5)
+    with transaction(conn) as cursor:
+        cursor.execute("INSERT INTO MealPlan (user_id, start_date, end_date) VALUES (1, ?, ?)",
+                       (start.isoformat(), (start + timedelta(days=days - 1)).isoformat()))
+        plan_id = cursor.lastrowid
+        cursor.executemany("INSERT INTO MealPlanRecipe (plan_id, recipe_id) VALUES (?, ?)",
+                           [(plan_id, recipe_id) for recipe_id in recipe_ids])
+        if slots:
+            cursor.executemany(
+                "INSERT INTO MealPlanSlot (plan_id, date, meal_type, recipe_id) VALUES (?, ?, 'Dinner', ?)",
+                [(plan_id, (start + timedelta(days=day)).isoformat(), recipe_ids[day % len(recipe_ids)])
+                 for day in range(days)])
+    return plan_id
+
+
+def amounts(rows):
+    return {(row[1], row[3]): row[4] for row in rows}
+
+
+def test_plan_meals_counts_slots(conn, add_recipe):
+    soup = add_recipe(conn, "Soup", {"Milk": "250 ml"})
+    toast = add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    plan_id = add_plan(conn, [soup, toast], 28)
+    assert plan_meals(conn, [plan_id]) == {soup: 14, toast: 14}
+
+
+def test_saved_plan_list_buys_for_every_meal(conn, add_recipe):
+    soup = add_recipe(conn, "Soup", {"Milk": "250 ml"})
+    plan_id = add_plan(conn, [soup], 28)
+    list_id = save_plan_shopping_list(conn, plan_id)
+    assert amounts(load_shopping_list(conn, list_id)) == {("Milk", "ml"): 7000}
+    assert amounts(aggregate_meal_plans(conn, [plan_id])) == {("Milk", "ml"): 7000}
+    # the same totals when the list is only shown, not saved
+    items = shopping_list(conn, plan_id=plan_id)['items']
+    assert [(item['name'], item['amount']) for item in items] == [("Milk", 7000)]
+
+
+def test_saved_plan_list_scales_servings_per_meal(conn, add_recipe):
+    soup = add_recipe(conn, "Soup", {"Milk": "250 ml"}, servings=4)
+    plan_id = add_plan(conn, [soup], 7)
+    list_id = save_plan_shopping_list(conn, plan_id, servings=2)
+    assert amounts(load_shopping_list(conn, list_id)) == {("Milk", "ml"): 875}
+
+
+def test_recipe_added_to_plan_list_keeps_meal_counts(conn, add_recipe):
+    soup = add_recipe(conn, "Soup", {"Milk": "250 ml"})
+    latte = add_recipe(conn, "Latte", {"Milk": "100 ml", "Coffee": "10 g"})
+    plan_id = add_plan(conn, [soup], 28)
+    list_id = save_plan_shopping_list(conn, plan_id)
+    assert add_recipe_to_list(conn, list_id, latte)
+    assert amounts(load_shopping_list(conn, list_id)) == {("Coffee", "g"): 10, ("Milk", "ml"): 7100}
+
+
+def test_plan_without_slots_counts_recipes_once(conn, add_recipe):
+    soup = add_recipe(conn, "Soup", {"Milk": "250 ml"})
+    plan_id = add_plan(conn, [soup], 7, slots=False)
+    list_id = save_plan_shopping_list(conn, plan_id)
+    assert amounts(load_shopping_list(conn, list_id)) == {("Milk", "ml"): 250}
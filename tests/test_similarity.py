@@ -0,0 +1,61 @@
+from similarity import NeighborTable, get_neighbor_table, recommend_recipes, similar_recipes
+from unitofwork import transaction
+
+PANTRY = ["Flour", "Milk", "Egg", "Butter", "Sugar", "Salt", "Cheese", "Tomato", "Basil", "Rice"]
+
+
+# recipes that each share a few ingredients with their neighbors in PANTRY
+
+
+def add_recipes(conn, add_recipe, count=10):
+    return [add_recipe(conn, f"Recipe {number}",
+                       {PANTRY[(number + offset) % len(PANTRY)]: "1" for offset in range(4)})
+            for number in range(count)]
+
+
+def lists(table):
+    return {recipe_id: table.neighbors(recipe_id) for recipe_id in table.index.recipe_ids()}
+
+
+def test_other_writes_keep_the_neighbors(conn, connect, add_recipe):
+    add_recipes(conn, add_recipe)
+    table = get_neighbor_table(conn)
+    table.precompute()
+    with transaction(connect()) as cursor:
+        cursor.execute("INSERT INTO MealPlan (user_id, start_date, end_date) VALUES (1, '2026-01-05', '2026-01-11')")
+        cursor.execute("INSERT INTO ShoppingList (user_id, name) VALUES (1, 'Weekly')")
+    assert get_neighbor_table(conn) is table
+    assert len(table) == 10
+
+
+def test_foreign_recipe_changes_refresh_the_neighbors(conn, connect, add_recipe):
+    recipe_ids = add_recipes(conn, add_recipe)
+    fish = [add_recipe(conn, name, {"Fish": "1", "Lemon": "1", "Dill": "1"}) for name in ("Fish", "Baked fish")]
+    table = get_neighbor_table(conn)
+    table.precompute()
+    kept = {recipe_id: table.neighbors(recipe_id) for recipe_id in fish}
+    other = connect()
+    twin = add_recipe(other, "Twin", {PANTRY[offset]: "1" for offset in range(4)})
+    with transaction(other) as cursor:
+        cursor.execute("DELETE FROM Recipe WHERE recipe_id = ?", (recipe_ids[5],))
+    assert similar_recipes(conn, recipe_ids[0], 1)[0][:2] == (twin, "Twin")
+    assert get_neighbor_table(conn) is table
+    # lists that never held a changed recipe are kept as they were
+    assert all(table._lists.get(recipe_id) is neighbors for recipe_id, neighbors in kept.items())
+    assert all(recipe_ids[5] not in dict(neighbors) for neighbors in lists(table).values())
+    assert lists(table) == lists(NeighborTable(table.index))
+
+
+def test_recommendations_weigh_recipes_by_meals_planned(conn, add_recipe):
+    often = add_recipe(conn, "Fish", {"Fish": "1", "Lemon": "1", "Dill": "1"})
+    once = add_recipe(conn, "Chili", {"Rice": "1", "Beans": "1", "Corn": "1"})
+    like_once = add_recipe(conn, "Chili bowl", {"Rice": "1", "Beans": "1", "Corn": "1", "Salt": "1"})
+    like_often = add_recipe(conn, "Fish plate", {"Fish": "1", "Lemon": "1", "Dill": "1", "Salt": "1"})
+    with transaction(conn) as cursor:
+        cursor.execute("INSERT INTO MealPlan (plan_id, user_id, start_date, end_date) "
+                       "VALUES (1, 1, '2026-01-05', '2026-01-11')")
+        cursor.executemany("INSERT INTO MealPlanRecipe (plan_id, recipe_id) VALUES (1, ?)", [(often,), (once,)])
+        cursor.executemany("INSERT INTO MealPlanSlot (plan_id, date, meal_type, recipe_id) VALUES (1, ?, ?, ?)",
+                           [(f"2026-01-{day:02}", 'Dinner', often) for day in range(5, 12)]
+                           + [("2026-01-05", 'Lunch', once)])
+    assert [row[0] for row in recommend_recipes(conn, 1)] == [like_often, like_once]
@@ -0,0 +1,27 @@
+from search import search_recipes
+from transfer import import_recipes
+
+
+def record(name, servings=2, ingredients=("Basil",)):
+    return {'name': name, 'category': 'Dinner', 'user': 'cook', 'servings': servings,
+            'ingredients': [{'name': ingredient, 'quantity': '1 cup'} for ingredient in ingredients]}
+
+
+def test_malformed_number_skips_only_its_recipe(conn):
+    stats = import_recipes(conn, [record("Pesto"), record("Soup", servings="a few"), record("Salad")])
+    assert stats == {'inserted': 2, 'updated': 0, 'skipped': 0, 'invalid': 1}
+    assert [row[0] for row in conn.execute("SELECT name FROM Recipe ORDER BY name")] == ["Pesto", "Salad"]
+
+
+def test_imported_ingredients_are_searchable(conn, connect):
+    import_recipes(conn, [record("Pesto", ingredients=("Basil", "Pine nuts")), record("Toast", ingredients=())],
+                   chunk_size=1)
+    import_recipes(conn, [record("Toast", ingredients=("Bread",))])
+    assert [row[1] for row in search_recipes(conn, "pine")] == ["Pesto"]
+    assert [row[1] for row in search_recipes(conn, "bread")] == ["Toast"]
+    assert conn.execute("SELECT COUNT(*) FROM SearchPause").fetchone()[0] == 0
+    # links written outside an import still refresh the search document
+    with conn:
+        conn.execute("DELETE FROM RecipeIngredient WHERE ingredient_id = "
+                     "(SELECT ingredient_id FROM Ingredient WHERE name = 'Bread')")
+    assert search_recipes(connect(), "bread") == []
@@ -0,0 +1,38 @@
+import pytest
+
+from app import delete_recipes
+from unitofwork import transaction
+
+
+def count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_nested_unit_leaves_the_outer_transaction_open(conn):
+    with transaction(conn) as cursor:
+        cursor.execute("INSERT INTO Category (name) VALUES ('Lunch')")
+        with transaction(conn) as inner:
+            inner.execute("INSERT INTO Category (name) VALUES ('Breakfast')")
+        assert conn.in_transaction
+        conn.rollback()
+    assert count(conn, 'Category') == 1
+
+
+def test_failed_nested_unit_undoes_only_itself(conn):
+    with transaction(conn) as cursor:
+        cursor.execute("INSERT INTO Category (name) VALUES ('Lunch')")
+        with pytest.raises(ValueError):
+            with transaction(conn) as inner:
+                inner.execute("INSERT INTO Category (name) VALUES ('Breakfast')")
+                raise ValueError("interrupted")
+        assert conn.in_transaction
+    assert [row[0] for row in conn.execute("SELECT name FROM Category ORDER BY name")] == ["Dinner", "Lunch"]
+
+
+def test_bulk_delete_joins_the_outer_transaction(conn, add_recipe):
+    toast = add_recipe(conn, "Toast", {"Bread": "2 slices"})
+    with pytest.raises(RuntimeError):
+        with transaction(conn):
+            assert delete_recipes(conn, [toast]) == 1
+            raise RuntimeError("undo")
+    assert count(conn, 'Recipe') == 1
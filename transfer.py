@@ -0,0 +1,340 @@
+
+import argparse
+import csv
+import json
+import sys
+from itertools import islice
+
+from ingredients import reset_ingredient_index
+from recipecache import invalidate_recipes
+from search import pause_link_triggers, refresh_ingredient_terms, resume_link_triggers
+from units import parse_quantity
+
+# streaming bulk import/export of recipes with their ingredients as JSONL or CSV
+#
+# JSONL: one recipe per line
+#   {"name": ..., "category": ..., "user": ..., "prep_time": ..., "cook_time": ...,
+#    "servings": ..., "instructions": ...,
+#    "ingredients": [{"name": ..., "quantity": ..., "unit_of_measure": ...}]}
+# CSV: one row per recipe ingredient with the CSV_FIELDS columns; consecutive rows of
+#   the same user and recipe name form one recipe
+#
+# categories, users and ingredients are resolved by name. a recipe is identified by its
+# user and name: importing it again replaces its details and ingredients. recipes of
+# unknown users and recipes with a malformed number are skipped and counted
+
+CSV_FIELDS = ['recipe', 'category', 'user', 'prep_time', 'cook_time', 'servings',
+              'instructions', 'ingredient', 'quantity', 'unit_of_measure']
+
+# recipes per transaction
+CHUNK_SIZE = 1000
+
+# convert an optional numeric field, keeping None for blanks
+# raises ValueError or TypeError for a value that is not a number
+
+
+def _int(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(float(value))
+    except OverflowError:
+        raise ValueError(f"Not a finite number: {value}")
+
+# read recipes from a JSONL stream, one at a time
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+# read recipes from a CSV stream, grouping consecutive rows of the same recipe
+
+
+def read_csv(stream):
+    record = None
+    for row in csv.DictReader(stream):
+        key = (row.get('user'), row.get('recipe'))
+        if record is None or key != (record['user'], record['name']):
+            if record is not None:
+                yield record
+            record = {
+                'name': row.get('recipe'),
+                'category': row.get('category'),
+                'user': row.get('user'),
+                'prep_time': row.get('prep_time'),
+                'cook_time': row.get('cook_time'),
+                'servings': row.get('servings'),
+                'instructions': row.get('instructions'),
+                'ingredients': [],
+            }
+        if row.get('ingredient'):
+            record['ingredients'].append({
+                'name': row['ingredient'],
+                'quantity': row.get('quantity'),
+                'unit_of_measure': row.get('unit_of_measure'),
+            })
+    if record is not None:
+        yield record
+
+# first free recipe_id, so new recipes can be inserted with explicit ids through executemany
+
+
+def _next_recipe_id(cursor):
+    row = cursor.execute("""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'Recipe'), 0),
+                   COALESCE((SELECT MAX(recipe_id) FROM Recipe), 0))
+    """).fetchone()
+    return row[0] + 1
+
+# look up or create the categories and ingredients named in a chunk
+# lookups are cached for the whole import; only names not seen before hit the database
+
+
+def _resolve_names(cursor, records, categories, ingredients):
+    for record in records:
+        category = record.get('category')
+        if category and category not in categories:
+            row = cursor.execute(
+                "SELECT category_id FROM Category WHERE name = ?", (category,)).fetchone()
+            if row is None:
+                cursor.execute(
+                    "INSERT INTO Category (name) VALUES (?)", (category,))
+                categories[category] = cursor.lastrowid
+            else:
+                categories[category] = row[0]
+        for ingredient in record.get('ingredients') or []:
+            name = ingredient.get('name')
+            if name and name not in ingredients:
+                row = cursor.execute(
+                    "SELECT ingredient_id, unit_of_measure FROM Ingredient WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    unit_of_measure = ingredient.get('unit_of_measure')
+                    cursor.execute(
+                        "INSERT INTO Ingredient (name, unit_of_measure) VALUES (?, ?)", (name, unit_of_measure))
+                    ingredients[name] = (cursor.lastrowid, unit_of_measure)
+                else:
+                    ingredients[name] = row
+
+# write one chunk of recipes in a single transaction
+# parents (categories, ingredients) are resolved first, then recipes, then their links
+
+
+def _import_chunk(conn, records, users, categories, ingredients, stats):
+    # later records for the same user and recipe name win
+    by_key = {}
+    numbers = {}
+    for record in records:
+        user_id = users.get(record.get('user'))
+        if user_id is None or not record.get('name'):
+            stats['skipped'] += 1
+            continue
+        try:
+            numbers[(user_id, record['name'])] = tuple(
+                _int(record.get(field)) for field in ('prep_time', 'cook_time', 'servings'))
+        except (TypeError, ValueError):
+            stats['invalid'] += 1
+            continue
+        by_key[(user_id, record['name'])] = record
+    if not by_key:
+        return
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        _resolve_names(cursor, by_key.values(), categories, ingredients)
+
+        existing = {}
+        cursor.execute("""
+            SELECT Recipe.user_id, Recipe.name, MAX(Recipe.recipe_id)
+            FROM json_each(?) AS wanted
+            JOIN Recipe ON Recipe.user_id = json_extract(wanted.value, '$[0]')
+                       AND Recipe.name = json_extract(wanted.value, '$[1]')
+            GROUP BY Recipe.user_id, Recipe.name
+        """, (json.dumps(list(by_key)),))
+        for user_id, name, recipe_id in cursor.fetchall():
+            existing[(user_id, name)] = recipe_id
+
+        next_id = _next_recipe_id(cursor)
+        inserts, updates, links = [], [], []
+        for key, record in by_key.items():
+            prep_time, cook_time, servings = numbers[key]
+            values = (record['name'], prep_time, cook_time, servings, record.get('instructions'),
+                      categories.get(record.get('category')), key[0])
+            if key in existing:
+                recipe_id = existing[key]
+                updates.append(values + (recipe_id,))
+            else:
+                recipe_id = next_id
+                next_id += 1
+                inserts.append((recipe_id,) + values)
+            for ingredient in record.get('ingredients') or []:
+                if not ingredient.get('name'):
+                    continue
+                ingredient_id, unit_of_measure = ingredients[ingredient['name']]
+                quantity = ingredient.get('quantity')
+                quantity = None if quantity is None else str(quantity)
+                amount, unit = parse_quantity(quantity, unit_of_measure)
+                links.append((recipe_id, ingredient_id, quantity, amount, unit))
+
+        cursor.executemany("""
+            INSERT INTO Recipe (recipe_id, name, prep_time, cook_time, servings, instructions, category_id, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, inserts)
+        cursor.executemany("""
+            UPDATE Recipe
+            SET name = ?, prep_time = ?, cook_time = ?, servings = ?, instructions = ?, category_id = ?, user_id = ?
+            WHERE recipe_id = ?
+        """, updates)
+        # relink ingredients in bulk, then index each recipe's ingredient names once
+        pause_link_triggers(cursor)
+        cursor.executemany("DELETE FROM RecipeIngredient WHERE recipe_id = ?",
+                           [(update[-1],) for update in updates])
+        cursor.executemany("""
+            INSERT OR REPLACE INTO RecipeIngredient (recipe_id, ingredient_id, quantity, amount, unit)
+            VALUES (?, ?, ?, ?, ?)
+        """, links)
+        refresh_ingredient_terms(
+            cursor, [insert[0] for insert in inserts] + [update[-1] for update in updates])
+        resume_link_triggers(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    invalidate_recipes(conn, [insert[0] for insert in inserts] + [update[-1] for update in updates])
+    stats['inserted'] += len(inserts)
+    stats['updated'] += len(updates)
+
+# import recipes from an iterable of records in chunked transactions
+# returns counts of inserted, updated, skipped (unknown user or no name) and invalid
+# (malformed number) recipes
+
+
+def import_recipes(conn, records, chunk_size=CHUNK_SIZE):
+    users = dict(conn.execute("SELECT username, user_id FROM User"))
+    categories = {}
+    ingredients = {}
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0, 'invalid': 0}
+    records = iter(records)
+    try:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            _import_chunk(conn, chunk, users, categories, ingredients, stats)
+    finally:
+        reset_ingredient_index(conn)
+    return stats
+
+# stream every recipe with its ingredients from one ordered query
+
+
+def iter_recipes(conn):
+    cursor = conn.execute("""
+        SELECT Recipe.recipe_id, Recipe.name, Category.name, User.username, Recipe.prep_time,
+               Recipe.cook_time, Recipe.servings, Recipe.instructions,
+               Ingredient.name, RecipeIngredient.quantity, Ingredient.unit_of_measure
+        FROM Recipe
+        LEFT JOIN Category ON Recipe.category_id = Category.category_id
+        LEFT JOIN User ON Recipe.user_id = User.user_id
+        LEFT JOIN RecipeIngredient ON RecipeIngredient.recipe_id = Recipe.recipe_id
+        LEFT JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+        ORDER BY Recipe.recipe_id
+    """)
+    record = None
+    current_id = None
+    for row in cursor:
+        if row[0] != current_id:
+            if record is not None:
+                yield record
+            current_id = row[0]
+            record = {
+                'name': row[1], 'category': row[2], 'user': row[3], 'prep_time': row[4],
+                'cook_time': row[5], 'servings': row[6], 'instructions': row[7],
+                'ingredients': [],
+            }
+        if row[8] is not None:
+            record['ingredients'].append(
+                {'name': row[8], 'quantity': row[9], 'unit_of_measure': row[10]})
+    if record is not None:
+        yield record
+
+# write all recipes to a stream as JSONL or CSV; returns the number of recipes written
+
+
+def export_recipes(conn, stream, fmt='jsonl'):
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(CSV_FIELDS)
+        for record in iter_recipes(conn):
+            recipe = [record['name'], record['category'], record['user'], record['prep_time'],
+                      record['cook_time'], record['servings'], record['instructions']]
+            for ingredient in record['ingredients'] or [{}]:
+                writer.writerow(recipe + [ingredient.get('name'), ingredient.get('quantity'),
+                                          ingredient.get('unit_of_measure')])
+            count += 1
+    else:
+        for record in iter_recipes(conn):
+            stream.write(json.dumps(record) + "\n")
+            count += 1
+    return count
+
+# pick the format from the file extension unless given explicitly
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def main(argv=None):
+    from app import DB_FILE, connect_db
+
+    parser = argparse.ArgumentParser(
+        description="Bulk import or export recipes as JSONL or CSV.")
+    parser.add_argument('--db', default=DB_FILE, help="database file")
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help="file format (default: from the file extension, else jsonl)")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    import_parser = subcommands.add_parser(
+        'import', help="import recipes from a file ('-' for stdin)")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    export_parser = subcommands.add_parser(
+        'export', help="export recipes to a file ('-' for stdout)")
+    export_parser.add_argument('path')
+    args = parser.parse_args(argv)
+
+    conn = connect_db(args.db)
+    if not conn:
+        return 1
+    fmt = _format_for(args.path, args.format)
+    try:
+        if args.command == 'import':
+            stream = sys.stdin if args.path == '-' else open(
+                args.path, newline='', encoding='utf-8')
+            with stream:
+                records = read_csv(
+                    stream) if fmt == 'csv' else read_jsonl(stream)
+                stats = import_recipes(conn, records, args.chunk_size)
+            print(f"Imported {stats['inserted']} new recipes, updated {stats['updated']}, "
+                  f"skipped {stats['skipped']} with unknown users and {stats['invalid']} with malformed numbers.",
+                  file=sys.stderr)
+        else:
+            stream = sys.stdout if args.path == '-' else open(
+                args.path, 'w', newline='', encoding='utf-8')
+            with stream:
+                count = export_recipes(conn, stream, fmt)
+            print(f"Exported {count} recipes.", file=sys.stderr)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+
+from contextlib import contextmanager
+
+from ingredients import get_ingredient_index
+from recipecache import invalidate_recipes
+from units import parse_quantity
+
+# atomic writes for multi-step edits
+# a RecipeEdit collects everything entered for one recipe (its fields, new ingredients,
+# links added and removed) in memory while the user is still typing, then writes it
+# all in one transaction: one commit per recipe instead of one per ingredient, and
+# nothing half-written when something fails
+
+# run a block in one write transaction, committing at the end or rolling back on error
+# IMMEDIATE takes the write lock up front so the block cannot fail halfway on a busy database
+# inside a transaction the caller already opened, the block runs in a savepoint instead:
+# an error undoes only the block, and committing is left to the caller
+
+
+@contextmanager
+def transaction(conn):
+    cursor = conn.cursor()
+    if conn.in_transaction:
+        cursor.execute("SAVEPOINT unit_of_work")
+        try:
+            yield cursor
+        except BaseException:
+            cursor.execute("ROLLBACK TO unit_of_work")
+            cursor.execute("RELEASE unit_of_work")
+            raise
+        else:
+            cursor.execute("RELEASE unit_of_work")
+        finally:
+            cursor.close()
+        return
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        yield cursor
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+# link an ingredient to a recipe, storing the quantity as typed plus its parsed
+# numeric amount and canonical unit for shopping list aggregation
+
+
+def link_ingredient(cursor, recipe_id, ingredient_id, quantity, unit_of_measure=None):
+    amount, unit = parse_quantity(quantity, unit_of_measure)
+    cursor.execute("""
+        INSERT INTO RecipeIngredient (recipe_id, ingredient_id, quantity, amount, unit)
+        VALUES (?, ?, ?, ?, ?)
+    """, (recipe_id, ingredient_id, quantity, amount, unit))
+
+# insert a recipe row and return its recipe_id
+
+
+def insert_recipe(cursor, name, prep_time, cook_time, servings, instructions, category_id, user_id):
+    cursor.execute("""
+        INSERT INTO Recipe (name, prep_time, cook_time, servings, instructions, category_id, user_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (name, prep_time, cook_time, servings, instructions, category_id, user_id))
+    return cursor.lastrowid
+
+
+RECIPE_FIELDS = ('name', 'prep_time', 'cook_time', 'servings',
+                 'instructions', 'category_id', 'user_id')
+
+# pending changes to one recipe; recipe_id None means a new recipe
+# ingredients created in the edit get negative placeholder ids until it is committed
+
+
+class RecipeEdit:
+    def __init__(self, recipe_id=None):
+        self.recipe_id = recipe_id
+        self.fields = {}
+        self.new_ingredients = {}  # placeholder id -> (name, unit_of_measure)
+        self.links = {}  # ingredient_id -> (quantity, name, unit_of_measure)
+        self.unlinks = set()
+
+    def update(self, **fields):
+        unknown = set(fields) - set(RECIPE_FIELDS)
+        if unknown:
+            raise TypeError(f"Unknown recipe fields: {', '.join(sorted(unknown))}")
+        self.fields.update(fields)
+
+    def create_ingredient(self, name, unit_of_measure):
+        placeholder = -(len(self.new_ingredients) + 1)
+        self.new_ingredients[placeholder] = (name, unit_of_measure)
+        return placeholder
+
+    # link an ingredient, replacing its quantity if it is already on the recipe
+
+    def link(self, ingredient_id, quantity, name=None, unit_of_measure=None):
+        if ingredient_id in self.new_ingredients:
+            name, unit_of_measure = self.new_ingredients[ingredient_id]
+        self.links[ingredient_id] = (quantity, name, unit_of_measure)
+
+    def unlink(self, ingredient_id):
+        self.links.pop(ingredient_id, None)
+        if ingredient_id > 0:
+            self.unlinks.add(ingredient_id)
+
+    def __bool__(self):
+        return bool(self.fields or self.links or self.unlinks)
+
+    # the recipe's ingredients as they will be after commit:
+    # [(ingredient_id, name, quantity, unit_of_measure)]
+
+    def ingredients(self, conn):
+        current = []
+        if self.recipe_id is not None:
+            current = conn.execute("""
+                SELECT Ingredient.ingredient_id, Ingredient.name, RecipeIngredient.quantity, Ingredient.unit_of_measure
+                FROM RecipeIngredient
+                JOIN Ingredient ON RecipeIngredient.ingredient_id = Ingredient.ingredient_id
+                WHERE RecipeIngredient.recipe_id = ?
+            """, (self.recipe_id,)).fetchall()
+        ingredients = [ingredient for ingredient in current
+                       if ingredient[0] not in self.unlinks and ingredient[0] not in self.links]
+        ingredients.extend((ingredient_id, name, quantity, unit_of_measure)
+                           for ingredient_id, (quantity, name, unit_of_measure) in self.links.items())
+        return ingredients
+
+    # write every pending change in one transaction; returns the recipe_id
+
+    def commit(self, conn):
+        index = get_ingredient_index(conn) if self.new_ingredients else None
+        created = {}
+        recipe_id = self.recipe_id
+        with transaction(conn) as cursor:
+            if recipe_id is None:
+                recipe_id = insert_recipe(
+                    cursor, *(self.fields.get(field) for field in RECIPE_FIELDS))
+            elif self.fields:
+                assignments = ", ".join(f"{field} = ?" for field in self.fields)
+                cursor.execute(f"UPDATE Recipe SET {assignments} WHERE recipe_id = ?",
+                               list(self.fields.values()) + [recipe_id])
+
+            for placeholder, (name, unit_of_measure) in self.new_ingredients.items():
+                if placeholder in self.links:
+                    cursor.execute("INSERT INTO Ingredient (name, unit_of_measure) VALUES (?, ?)",
+                                   (name, unit_of_measure))
+                    created[placeholder] = cursor.lastrowid
+
+            # replaced links are removed first and inserted again with the new quantity
+            removed = self.unlinks | {ingredient_id for ingredient_id in self.links if ingredient_id > 0}
+            cursor.executemany("DELETE FROM RecipeIngredient WHERE recipe_id = ? AND ingredient_id = ?",
+                               [(recipe_id, ingredient_id) for ingredient_id in removed])
+            for ingredient_id, (quantity, _, unit_of_measure) in self.links.items():
+                link_ingredient(cursor, recipe_id, created.get(ingredient_id, ingredient_id),
+                                quantity, unit_of_measure)
+
+        self.recipe_id = recipe_id
+        for placeholder, ingredient_id in created.items():
+            index.add(ingredient_id, *self.new_ingredients[placeholder])
+        invalidate_recipes(conn, [self.recipe_id])
+        self.fields, self.new_ingredients, self.links, self.unlinks = {}, {}, {}, set()
+        return self.recipe_id
@@ -0,0 +1,124 @@
+
+import re
+
+# quantity parsing and unit conversion for recipe ingredients
+# amounts are stored in a canonical unit per dimension: grams for mass,
+# millilitres for volume; any other unit (slices, large, jars...) is a count unit
+
+MASS = 'g'
+VOLUME = 'ml'
+
+# unit spelling -> (canonical unit, size of one unit in the canonical unit)
+UNITS = {
+    'mg': (MASS, 0.001), 'milligram': (MASS, 0.001), 'milligrams': (MASS, 0.001),
+    'g': (MASS, 1.0), 'gr': (MASS, 1.0), 'gram': (MASS, 1.0), 'grams': (MASS, 1.0),
+    'kg': (MASS, 1000.0), 'kilogram': (MASS, 1000.0), 'kilograms': (MASS, 1000.0),
+    'oz': (MASS, 28.349523125), 'ounce': (MASS, 28.349523125), 'ounces': (MASS, 28.349523125),
+    'lb': (MASS, 453.59237), 'lbs': (MASS, 453.59237),
+    'pound': (MASS, 453.59237), 'pounds': (MASS, 453.59237),
+    'ml': (VOLUME, 1.0), 'milliliter': (VOLUME, 1.0), 'milliliters': (VOLUME, 1.0),
+    'millilitre': (VOLUME, 1.0), 'millilitres': (VOLUME, 1.0),
+    'cl': (VOLUME, 10.0), 'dl': (VOLUME, 100.0),
+    'l': (VOLUME, 1000.0), 'liter': (VOLUME, 1000.0), 'liters': (VOLUME, 1000.0),
+    'litre': (VOLUME, 1000.0), 'litres': (VOLUME, 1000.0),
+    'tsp': (VOLUME, 4.92892159375), 'teaspoon': (VOLUME, 4.92892159375),
+    'teaspoons': (VOLUME, 4.92892159375),
+    'tbsp': (VOLUME, 14.78676478125), 'tablespoon': (VOLUME, 14.78676478125),
+    'tablespoons': (VOLUME, 14.78676478125),
+    'fl oz': (VOLUME, 29.5735295625), 'floz': (VOLUME, 29.5735295625),
+    'cup': (VOLUME, 236.5882365), 'cups': (VOLUME, 236.5882365),
+    'pint': (VOLUME, 473.176473), 'pints': (VOLUME, 473.176473),
+    'quart': (VOLUME, 946.352946), 'quarts': (VOLUME, 946.352946),
+    'gallon': (VOLUME, 3785.411784), 'gallons': (VOLUME, 3785.411784),
+}
+
+# larger units used when displaying big canonical amounts
+DISPLAY_UNITS = {MASS: ('kg', 1000.0), VOLUME: ('l', 1000.0)}
+
+FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4',
+             '¾': '3/4', '⅛': '1/8', '⅜': '3/8', '⅝': '5/8', '⅞': '7/8'}
+
+NUMBER = re.compile(r"^\s*(\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)\s*(.*)$")
+
+# canonical spelling for a unit: known units map to their dimension, count units
+# are lowercased and singularized so "slices" and "slice" add up
+
+
+def canonical_unit(unit):
+    unit = " ".join(unit.lower().strip().rstrip('.').split())
+    if unit in UNITS:
+        return UNITS[unit][0]
+    if len(unit) > 3 and unit.endswith('s') and not unit.endswith('ss'):
+        unit = unit[:-1]
+    return unit
+
+# parse a quantity typed by the user ("200g", "1 1/2 cups", "2", "½ tsp") into
+# (amount, canonical unit); a bare number takes the ingredient's unit of measure
+# returns (None, None) when there is no leading number ("a pinch", "to taste")
+
+
+def parse_quantity(text, default_unit=None):
+    if text is None:
+        return None, None
+    text = str(text)
+    if not text.isascii():
+        for symbol, fraction in FRACTIONS.items():
+            text = text.replace(symbol, f" {fraction}")
+    match = NUMBER.match(text)
+    if not match:
+        return None, None
+
+    number, rest = match.groups()
+    amount = 0.0
+    for part in number.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            if float(denominator) == 0:
+                return None, None
+            amount += float(numerator) / float(denominator)
+        else:
+            amount += float(part)
+
+    # ignore anything after the number that does not start like a word, e.g. "2-3"
+    words = rest.lower().replace('.', ' ').split()
+    if words and not words[0][0].isalpha():
+        words = []
+    if len(words) >= 2 and f"{words[0]} {words[1]}" in UNITS:
+        unit = f"{words[0]} {words[1]}"
+    elif words:
+        unit = words[0]
+    elif default_unit:
+        unit = default_unit
+    else:
+        return amount, ''
+
+    unit = " ".join(unit.lower().split())
+    if unit in UNITS:
+        canonical, factor = UNITS[unit]
+        return amount * factor, canonical
+    return amount, canonical_unit(unit)
+
+# convert a canonical amount into a display unit, preferring the ingredient's own
+# unit of measure when it belongs to the same dimension; returns (amount, unit)
+
+
+def to_display(amount, unit, preferred_unit=None):
+    if preferred_unit:
+        preferred = " ".join(preferred_unit.lower().split())
+        if preferred in UNITS and UNITS[preferred][0] == unit:
+            return amount / UNITS[preferred][1], preferred_unit
+        if preferred not in UNITS and canonical_unit(preferred) == unit:
+            return amount, preferred_unit
+    if unit in DISPLAY_UNITS:
+        larger, factor = DISPLAY_UNITS[unit]
+        if amount >= factor:
+            return amount / factor, larger
+    return amount, unit
+
+# format a canonical amount for printing, e.g. "1.5 kg" or "3 cups"
+
+
+def format_quantity(amount, unit, preferred_unit=None):
+    amount, unit = to_display(amount, unit, preferred_unit)
+    number = f"{amount:.2f}".rstrip('0').rstrip('.')
+    return f"{number} {unit}".strip()